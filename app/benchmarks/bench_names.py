@@ -0,0 +1,64 @@
+"""Micro-benchmark of the functions used to check, split and
+flatten the names of a file
+
+Usage
+-----
+
+    python -m ze_mailer.app.benchmarks.bench_names
+"""
+import re
+import timeit
+
+from ze_mailer.app.core.mixins.utilities import UtilitiesMixin
+
+NAMES = [
+    'eugenie bouchard',
+    'serena williams',
+    'kimberley garner',
+    'aurelie de la tour',
+    'madonna',
+]
+
+# The pattern that was used before the names were
+# checked with a precompiled regex
+LEGACY_PATTERN = r'^(?:\w+\s?)+$'
+
+
+def per_name(statement, number, namespace):
+    """Return the cost of the statement for
+    a single name in microseconds
+    """
+    timer = timeit.Timer(statement, globals=namespace)
+    total = min(timer.repeat(repeat=5, number=number))
+    return total / (number * len(NAMES)) * 1e6
+
+def main(number=20000):
+    utilities = UtilitiesMixin()
+    namespace = {
+        'names': NAMES,
+        're': re,
+        'legacy': LEGACY_PATTERN,
+        'utilities': utilities
+    }
+    statements = {
+        'legacy regex': 'for name in names: re.match(legacy, name)',
+        'check_name_structure': 'for name in names: utilities.check_name_structure(name)',
+        'split_name': 'for name in names: utilities.split_name(name)',
+        'flatten_name': 'for name in names: utilities.flatten_name(name)'
+    }
+    for label, statement in statements.items():
+        print('%-22s %.3f us/name' % (label, per_name(statement, number, namespace)))
+
+    # A long name that cannot be matched and that is
+    # used to make the legacy regex backtrack
+    namespace['pathological'] = 'a' * 18 + '!'
+    statements = {
+        'legacy pathological': 're.match(legacy, pathological)',
+        'pathological': 'utilities.check_name_structure(pathological)'
+    }
+    for label, statement in statements.items():
+        timer = timeit.Timer(statement, globals=namespace)
+        print('%-22s %.3f us/name' % (label, min(timer.repeat(3, 10)) / 10 * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Throughput benchmark of the different ways of sending emails
+using a local SMTP sink instead of a real server
+
+Description
+-----------
+
+The sink runs in a separate process so that the CPU time reported
+for each path is only the one used to send the emails. Each path
+reports the number of emails sent per second, the 50th and 99th
+percentiles of the time taken to send an email and the CPU time
+used for each email. The batch path sends the emails in shared
+transactions and only reports its throughput.
+
+Usage
+-----
+
+    python -m ze_mailer.app.benchmarks.bench_senders --messages 500 --latency 0.005
+
+The results can be saved with `--json results.json` and used as
+a baseline for a later run which fails when a path is slower:
+
+    python -m ze_mailer.app.benchmarks.bench_senders --baseline results.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import sys
+import time
+from functools import partial
+
+from ze_mailer.app.benchmarks.sink import SinkServer
+from ze_mailer.app.core.pools import ServerPool
+from ze_mailer.app.core.senders import (AsyncSender, BatchSender, Envelope,
+                                        SendEmail, SendResult)
+from ze_mailer.app.core.servers import LocalServer
+
+USER = 'user'
+
+PASSWORD = 'password'
+
+PATHS = ['single', 'pooled', 'batch', 'async']
+
+
+def run_sink(connection, options):
+    sink = SinkServer(port=0, credentials=(USER, PASSWORD), **options)
+    connection.send(sink.port)
+    try:
+        sink.serve_forever()
+    finally:
+        sink.server_close()
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+def create_envelopes(count):
+    message = 'Subject: Benchmark\r\n\r\n' + 'This is a test\r\n' * 20
+    return [Envelope('sender@gmail.com', 'user%s@gmail.com' % i, message)
+                for i in range(count)]
+
+
+def send_single(host, port, envelopes, concurrency):
+    """A new connection for each email (SendEmail)
+    """
+    sender = type('SinkSendEmail', (SendEmail,), {'server': partial(LocalServer, host, port)})
+    timings = []
+    for envelope in envelopes:
+        start = time.perf_counter()
+        sender(envelope.sender, envelope.recipients[0], 'Benchmark',
+                    user=USER, password=PASSWORD)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def send_pooled(host, port, envelopes, concurrency):
+    """The connections are reused (ServerPool)
+    """
+    pool = ServerPool(server_class=LocalServer, max_size=1)
+    timings = []
+    try:
+        for envelope in envelopes:
+            start = time.perf_counter()
+            pool.sendmail(host, port, envelope.sender, envelope.recipients,
+                            envelope.message, user=USER, password=PASSWORD)
+            timings.append(time.perf_counter() - start)
+    finally:
+        pool.close()
+    return timings
+
+def check_results(results):
+    """Stop the benchmark when emails were not sent, the
+    recipients refused with --refusal-rate are expected
+    """
+    errors = [result for result in results
+                if result.status not in (SendResult.ACCEPTED, SendResult.REFUSED)]
+    if errors:
+        raise RuntimeError('%s emails were not sent: %s' % (len(errors), errors[0].error))
+
+def send_batch(host, port, envelopes, concurrency):
+    """A single session with pipelined transactions (BatchSender)
+    """
+    server = LocalServer(host, port, user=USER, password=PASSWORD)
+    try:
+        results = BatchSender(server).send(envelopes)
+    finally:
+        server.close()
+    check_results(results)
+    # The emails are sent in shared transactions
+    # which do not have a duration of their own
+    return None
+
+def send_async(host, port, envelopes, concurrency):
+    """Multiple sessions used at the same time (AsyncSender)
+    """
+    pool = ServerPool(server_class=LocalServer, max_size=concurrency)
+    sender = AsyncSender(host, port, user=USER, password=PASSWORD,
+                            concurrency=concurrency, pool=pool)
+    try:
+        results = asyncio.run(sender.send(envelopes))
+    finally:
+        pool.close()
+    check_results(results)
+    return [result.elapsed for result in results]
+
+
+def measure(path, host, port, count, concurrency):
+    function = globals()['send_%s' % path]
+    envelopes = create_envelopes(count)
+    # Do not print the logins of the servers
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        timings = function(host, port, envelopes, concurrency)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+    return {
+        'messages_per_second': count / elapsed,
+        'p50_ms': None if timings is None else percentile(timings, 50) * 1000,
+        'p99_ms': None if timings is None else percentile(timings, 99) * 1000,
+        'cpu_us_per_message': cpu / count * 1e6
+    }
+
+def format_milliseconds(value):
+    return '%10s' % '-' if value is None else '%10.3f' % value
+
+def run(paths=PATHS, count=200, concurrency=8, **options):
+    """Start the sink and return the results of each path
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=run_sink, args=(sender, options), daemon=True)
+    process.start()
+    try:
+        port = receiver.recv()
+        return {path: measure(path, 'localhost', port, count, concurrency) for path in paths}
+    finally:
+        process.terminate()
+        process.join()
+
+def compare(results, baseline, tolerance):
+    """Return the paths that are slower than
+    in the baseline by more than `tolerance`
+    """
+    regressions = []
+    for path, result in results.items():
+        if path not in baseline:
+            continue
+        expected = baseline[path]['messages_per_second']
+        if result['messages_per_second'] < expected * (1 - tolerance):
+            regressions.append(path)
+    return regressions
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark the senders with a local SMTP sink')
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.001,
+                            help='Seconds waited by the sink before replying')
+    parser.add_argument('--refusal-rate', type=float, default=0)
+    parser.add_argument('--no-pipelining', action='store_true')
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=PATHS)
+    parser.add_argument('--json', help='Save the results to a file')
+    parser.add_argument('--baseline', help='Fail if slower than the results of a file')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    arguments = parser.parse_args(arguments)
+
+    results = run(arguments.paths, count=arguments.messages, concurrency=arguments.concurrency,
+                    latency=arguments.latency, refusal_rate=arguments.refusal_rate,
+                    pipelining=not arguments.no_pipelining)
+
+    print('%-8s %12s %10s %10s %14s' % ('path', 'msgs/sec', 'p50 ms', 'p99 ms', 'cpu us/msg'))
+    for path, result in results.items():
+        print('%-8s %12.1f %s %s %14.1f' % (path, result['messages_per_second'],
+                    format_milliseconds(result['p50_ms']), format_milliseconds(result['p99_ms']),
+                    result['cpu_us_per_message']))
+
+    if arguments.json:
+        with open(arguments.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as f:
+            regressions = compare(results, json.load(f), arguments.tolerance)
+        if regressions:
+            print('Slower than the baseline: %s' % ', '.join(regressions))
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
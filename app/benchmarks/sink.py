@@ -0,0 +1,327 @@
+"""A local SMTP server that accepts the emails without delivering
+them, used to measure the performance of the senders offline
+
+Usage
+-----
+
+    python -m ze_mailer.app.benchmarks.sink --port 1025 --latency 0.01
+
+author: pendenquejohn@gmail.com
+"""
+import argparse
+import base64
+import random
+import re
+import socketserver
+import threading
+import time
+
+CRLF = b'\r\n'
+
+
+class SinkHandler(socketserver.BaseRequestHandler):
+    """Handles an SMTP session. The replies to the commands
+    received in a single read are sent together after waiting
+    `latency` seconds which simulates the round trip to a
+    remote server: pipelined commands only wait once
+    """
+    def setup(self):
+        self.sink = self.server
+        self.sink.connected()
+        self.buffer = b''
+        self.replies = []
+        self.in_data = False
+        self.auth_login = None
+        self.authenticated = not self.sink.auth
+        self.reset()
+
+    def reset(self):
+        self.sender = None
+        self.recipients = []
+
+    def reply(self, code, text):
+        self.replies.append(('%s %s' % (code, text)).encode('ascii') + CRLF)
+
+    def flush(self):
+        if self.replies:
+            if self.sink.latency:
+                time.sleep(self.sink.latency)
+            self.request.sendall(b''.join(self.replies))
+            self.replies = []
+
+    def handle(self):
+        self.reply(220, 'localhost ze_mailer sink')
+        self.flush()
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            self.buffer += data
+            closed = self.process()
+            self.flush()
+            if closed:
+                return
+
+    def process(self):
+        """Handle the complete commands of the buffer and
+        return True when the client ended the session
+        """
+        while True:
+            if self.in_data:
+                if self.buffer.startswith(b'.' + CRLF):
+                    body, self.buffer = b'', self.buffer[3:]
+                else:
+                    body, separator, rest = self.buffer.partition(CRLF + b'.' + CRLF)
+                    if not separator:
+                        return False
+                    self.buffer = rest
+                self.in_data = False
+                # Remove the period added by the client
+                # to the lines starting with a period
+                body = re.sub(br'(?m)^\.', b'', body)
+                self.sink.received(self.sender, self.recipients, body)
+                self.reply(250, 'queued')
+                self.reset()
+                continue
+
+            line, separator, rest = self.buffer.partition(CRLF)
+            if not separator:
+                return False
+            self.buffer = rest
+            if self.command(line.decode('utf-8', 'replace')):
+                return True
+
+    def command(self, line):
+        if self.auth_login is not None:
+            return self.login(line)
+
+        verb, _, argument = line.partition(' ')
+        verb = verb.upper()
+        if verb in ('EHLO', 'HELO'):
+            self.reset()
+            lines = ['localhost']
+            if verb == 'EHLO':
+                if self.sink.pipelining:
+                    lines.append('PIPELINING')
+                if self.sink.auth:
+                    lines.append('AUTH PLAIN LOGIN')
+                lines.append('8BITMIME')
+            for line in lines[:-1]:
+                self.replies.append(('250-%s' % line).encode('ascii') + CRLF)
+            self.reply(250, lines[-1])
+        elif verb == 'AUTH':
+            mechanism, _, response = argument.partition(' ')
+            if mechanism.upper() == 'PLAIN':
+                _, user, password = base64.b64decode(response).decode('utf-8').split('\x00')
+                self.authenticate(user, password)
+            elif mechanism.upper() == 'LOGIN':
+                self.auth_login = [base64.b64decode(response).decode('utf-8')] if response else []
+                self.reply(334, 'UGFzc3dvcmQ6' if response else 'VXNlcm5hbWU6')
+            else:
+                self.reply(504, 'unrecognized authentication type')
+        elif verb == 'MAIL':
+            if not self.authenticated:
+                self.reply(530, 'authentication required')
+            else:
+                self.reset()
+                # The address can be followed by
+                # options such as BODY=8BITMIME
+                address = argument.split(':', 1)[-1].split()
+                self.sender = address[0].strip('<>') if address else ''
+                self.reply(250, 'ok')
+        elif verb == 'RCPT':
+            if self.sender is None:
+                self.reply(503, 'need MAIL command')
+            else:
+                recipient = argument.split(':', 1)[-1].strip().strip('<>')
+                code = self.sink.recipient_code(recipient)
+                if code == 250:
+                    self.recipients.append(recipient)
+                    self.reply(250, 'ok')
+                elif code == 450:
+                    self.reply(450, 'mailbox unavailable, try again later')
+                else:
+                    self.reply(550, 'no such user')
+        elif verb == 'DATA':
+            if not self.recipients:
+                self.reply(554, 'no valid recipients')
+            else:
+                self.in_data = True
+                self.reply(354, 'end data with <CR><LF>.<CR><LF>')
+        elif verb == 'RSET':
+            self.reset()
+            self.reply(250, 'ok')
+        elif verb == 'NOOP':
+            self.reply(250, 'ok')
+        elif verb == 'QUIT':
+            self.reply(221, 'bye')
+            return True
+        else:
+            self.reply(502, 'command not implemented')
+        return False
+
+    def login(self, line):
+        self.auth_login.append(base64.b64decode(line).decode('utf-8'))
+        if len(self.auth_login) == 1:
+            self.reply(334, 'UGFzc3dvcmQ6')
+        else:
+            user, password = self.auth_login
+            self.auth_login = None
+            self.authenticate(user, password)
+        return False
+
+    def authenticate(self, user, password):
+        if self.sink.credentials is None or self.sink.credentials == (user, password):
+            self.authenticated = True
+            self.reply(235, 'authentication succeeded')
+        else:
+            self.reply(535, 'authentication failed')
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    """An SMTP server that counts the emails it receives
+
+    Description
+    -----------
+
+    Each connection is handled in its own thread. The server can be
+    started in the background and used with `LocalServer`:
+
+        with SinkServer(port=0, latency=0.01) as sink:
+            sink.start()
+            server = LocalServer(port=sink.port, user='user', password='password')
+
+    Parameters
+    ----------
+
+        latency: the number of seconds to wait before replying
+
+        refusal_rate: the proportion of recipients refused with a 550 code
+
+        deferral_rate: the proportion of recipients refused
+                       temporarily with a 450 code
+
+        pipelining: whether the PIPELINING extension is advertised
+
+        auth: whether the clients have to authenticate with AUTH
+              (PLAIN or LOGIN) before sending emails
+
+        credentials: the (user, password) accepted by the server,
+                     any credentials are accepted by default
+
+        keep: whether the emails that were received should
+              be kept in `messages`
+
+        mailboxes: the addresses that exist on the server, all
+                   the other ones are refused with a 550 code.
+                   All the addresses exist by default
+
+        catch_all: the domains for which all the addresses exist
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='localhost', port=1025, latency=0, refusal_rate=0,
+                    deferral_rate=0, pipelining=True, auth=True, credentials=None,
+                    keep=False, mailboxes=None, catch_all=(), seed=None):
+        super().__init__((host, port), SinkHandler)
+        self.latency = latency
+        self.refusal_rate = refusal_rate
+        self.deferral_rate = deferral_rate
+        self.pipelining = pipelining
+        self.auth = auth
+        self.credentials = credentials
+        self.keep = keep
+        self.mailboxes = None if mailboxes is None else {item.lower() for item in mailboxes}
+        self.catch_all = {item.lower() for item in catch_all}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.connections = 0
+        self.recipients = 0
+        self.messages = []
+        self.thread = None
+
+    def __repr__(self):
+        return '%s(%s:%s, %s emails)' % (self.__class__.__name__, self.host,
+                    self.port, self.count)
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def recipient_code(self, recipient):
+        if self.mailboxes is not None:
+            recipient = recipient.lower()
+            domain = recipient.rsplit('@', 1)[-1]
+            if recipient not in self.mailboxes and domain not in self.catch_all:
+                return 550
+        with self.lock:
+            value = self.random.random()
+        if value < self.refusal_rate:
+            return 550
+        if value < self.refusal_rate + self.deferral_rate:
+            return 450
+        return 250
+
+    def connected(self):
+        with self.lock:
+            self.connections += 1
+
+    def received(self, sender, recipients, body):
+        with self.lock:
+            self.count += 1
+            self.recipients += len(recipients)
+            if self.keep:
+                self.messages.append((sender, list(recipients), body))
+
+    def start(self):
+        """Serve the connections in a background thread
+        """
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05},
+                                        daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def __exit__(self, *args):
+        if self.thread is not None:
+            self.stop()
+        else:
+            self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local SMTP sink')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--refusal-rate', type=float, default=0)
+    parser.add_argument('--deferral-rate', type=float, default=0)
+    parser.add_argument('--no-pipelining', action='store_true')
+    parser.add_argument('--no-auth', action='store_true')
+    arguments = parser.parse_args()
+
+    sink = SinkServer(arguments.host, arguments.port, latency=arguments.latency,
+                refusal_rate=arguments.refusal_rate, deferral_rate=arguments.deferral_rate,
+                pipelining=not arguments.no_pipelining, auth=not arguments.no_auth)
+    print('Listening on %s:%s' % (sink.host, sink.port))
+    try:
+        sink.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.server_close()
+
+if __name__ == '__main__':
+    main()
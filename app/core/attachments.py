@@ -0,0 +1,197 @@
+"""Regroups the functionnalities used to create the attachments
+of the emails
+
+author: pendenquejohn@gmail.com
+"""
+import base64
+import mmap
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from email.mime.base import MIMEBase
+
+from ze_mailer.app.core.errors import AttachmentError
+
+# Base64 encodes 57 bytes in a line of 76 characters:
+# reading the file by multiples of 57 bytes allows
+# encoding each chunk independently
+CHUNK_SIZE = 57 * 1024
+
+CRLF = b'\r\n'
+
+# Set while `iter_message_data` serializes a message
+# in the current thread: the markers of the streaming
+# attachments can only be used at that moment
+STREAMING = threading.local()
+
+
+def encode_file(path, chunk_size=CHUNK_SIZE):
+    """Encode a file in base64 by reading it chunk by chunk
+    so that the file and its encoded version are never
+    both in memory
+    """
+    lines = []
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines.append(base64.encodebytes(chunk).decode('ascii'))
+    return ''.join(lines)
+
+
+class AttachmentCache:
+    """Keeps the encoded attachments in memory in order to
+    encode a file only once when it is sent to multiple
+    recipients
+
+    Description
+    -----------
+
+    The attachments are identified by the path, the modification time
+    and the size of the file which means that a file that was modified
+    is encoded again. When the encoded attachments exceed `max_size`
+    bytes, the least recently used ones are removed from the cache.
+
+    Parameters
+    ----------
+
+        max_size: the maximum number of encoded bytes kept in the cache
+    """
+    def __init__(self, max_size=50 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        # key -> (attachment, size)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return self.get_key(path) in self.entries
+
+    def __repr__(self):
+        return '%s(%s items, %s bytes)' % (self.__class__.__name__, len(self), self.size)
+
+    @staticmethod
+    def get_key(path):
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def create_attachment(path):
+        """Create an attachment using a local path
+        """
+        attachment = MIMEBase('application', 'octet-stream')
+        attachment.set_payload(encode_file(path))
+        attachment['Content-Transfer-Encoding'] = 'base64'
+        # Get the file's name
+        filename = os.path.basename(path)
+        attachment.add_header('Content-Disposition', 'attachment', filename=filename)
+        return attachment
+
+    def get(self, path):
+        """Return the attachment for a path, encoding
+        the file if it is not in the cache
+        """
+        key = self.get_key(path)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key][0]
+
+        attachment = self.create_attachment(path)
+        size = len(attachment.get_payload())
+        if size > self.max_size:
+            return attachment
+
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (attachment, size)
+                self.size += size
+            while self.size > self.max_size:
+                _, (_, removed_size) = self.entries.popitem(last=False)
+                self.size -= removed_size
+        return attachment
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class StreamingAttachment(MIMEBase):
+    """An attachment that is encoded while the email is being sent
+    instead of being loaded in memory
+
+    Description
+    -----------
+
+    The file is memory-mapped and encoded by chunks of `chunk_size`
+    bytes which are written directly to the connection. The payload
+    of the part is only a marker which is replaced by the encoded
+    file by `iter_message_data`. Serializing the message in any
+    other way e.g. with `as_string` raises an AttachmentError
+    """
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        super().__init__('application', 'octet-stream')
+        self.path = path
+        self.chunk_size = chunk_size - chunk_size % 57 or 57
+        self.marker = 'ZEMAILERSTREAM%s' % uuid.uuid4().hex
+        self.set_payload(self.marker)
+        self['Content-Transfer-Encoding'] = 'base64'
+        filename = os.path.basename(path)
+        self.add_header('Content-Disposition', 'attachment', filename=filename)
+
+    def get_payload(self, i=None, decode=False):
+        if not getattr(STREAMING, 'active', False):
+            raise AttachmentError('The streaming attachment %s can only be sent '
+                        'with iter_message_data' % os.path.basename(self.path))
+        return super().get_payload(i, decode)
+
+    def iter_encoded(self):
+        """Yield the file encoded in base64 by chunks of lines
+        separated by CRLF, without a CRLF after the last line
+        """
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                separator = b''
+                for start in range(0, len(content), self.chunk_size):
+                    chunk = base64.encodebytes(content[start:start + self.chunk_size])
+                    yield separator + chunk[:-1].replace(b'\n', CRLF)
+                    separator = CRLF
+
+
+def iter_message_data(message, linesep='\r\n'):
+    """Yield the bytes sent after the DATA command for a message
+    that contains streaming attachments: the message is escaped
+    and the attachments are encoded as they are sent
+    """
+    streams = {part.marker: part for part in message.walk()
+                    if isinstance(part, StreamingAttachment)}
+    STREAMING.active = True
+    try:
+        serialized = message.as_bytes(policy=message.policy.clone(linesep=linesep))
+    finally:
+        STREAMING.active = False
+    if streams:
+        markers = '|'.join(re.escape(marker) for marker in streams).encode('ascii')
+        segments = re.split(b'(' + markers + b')', serialized)
+    else:
+        segments = [serialized]
+
+    for index, segment in enumerate(segments):
+        if index % 2:
+            yield from streams[segment.decode('ascii')].iter_encoded()
+        else:
+            # Escape the lines starting with a period,
+            # base64 lines never start with one
+            yield re.sub(br'(?m)^\.', b'..', segment)
+    if not serialized.endswith(CRLF):
+        yield CRLF
+    yield b'.' + CRLF
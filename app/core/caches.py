@@ -0,0 +1,185 @@
+"""A cache of the files created by the names algorithms so that
+the same file is not created twice from the same names
+
+author: pendenquejohn@gmail.com
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from ze_mailer import __version__
+from ze_mailer.app.core.settings import configuration
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Return the sha256 of the content of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_rows(rows):
+    """Return the sha256 of rows of strings such as the
+    names that were read in memory
+    """
+    digest = hashlib.sha256()
+    for row in rows:
+        # Unit and record separators cannot be
+        # mistaken for the values of the rows
+        digest.update(('\x1f'.join(row) + '\x1e').encode('utf-8'))
+    return digest.hexdigest()
+
+
+
+class OutputCache:
+    """Keeps a copy of the files that were created, identified by
+    everything that was used to create them
+
+    Description
+    -----------
+
+    The key of a file is computed from the content of the file
+    containing the names, the compiled pattern, the domain, the
+    particle and the version of the library. The names that were
+    read in memory can be changed before creating the file, their
+    fingerprint is then passed with `extra`. When the same key
+    is requested again, the file is copied from the cache:
+
+        cache = OutputCache()
+        key = cache.get_key('names.csv', template)
+        if not cache.copy(key, 'emails.csv'):
+            ...
+            cache.put(key, 'emails.csv', rows=count)
+
+    The least recently used files are removed when the files
+    in the cache exceed `max_size` bytes.
+
+    Parameters
+    ----------
+
+        directory: where the files are stored, `configuration['cache_dir']`
+                   by default
+
+        max_size: the maximum number of bytes used by the cache,
+                  `configuration['cache_max_size']` by default
+    """
+    def __init__(self, directory=None, max_size=None):
+        self.directory = directory or configuration['cache_dir']
+        self.max_size = int(max_size if max_size is not None else configuration['cache_max_size'])
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.directory)
+
+    def __contains__(self, key):
+        return os.path.exists(self.get_path(key))
+
+    def __len__(self):
+        return len(self.entries())
+
+    def get_path(self, key, extension='csv'):
+        return os.path.join(self.directory, '%s.%s' % (key, extension))
+
+    @staticmethod
+    def get_key(file_path, template, *extra):
+        """Return the key of the file created from the names of
+        `file_path` using a compiled pattern or a TemplateList.
+        `extra` can contain anything else that changes
+        the content of the file
+        """
+        values = [hash_file(file_path), template.key, __version__]
+        values.extend(extra)
+        return hashlib.sha256(repr(values).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the information stored with a file
+        or None if it is not in the cache
+        """
+        try:
+            with open(self.get_path(key, 'json'), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+        # The modification time is used to
+        # find the least recently used files
+        os.utime(path)
+        return info
+
+    def copy(self, key, destination):
+        """Copy a file from the cache and return its information
+        or None if the file is not in the cache
+        """
+        info = self.get(key)
+        if info is not None:
+            try:
+                shutil.copyfile(self.get_path(key), destination)
+            except FileNotFoundError:
+                # Removed by another process
+                return None
+        return info
+
+    def put(self, key, source, **info):
+        """Add a copy of a file to the cache
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        # Copy to a temporary file first so that an
+        # incomplete file is never found in the cache
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        os.close(descriptor)
+        try:
+            shutil.copyfile(source, temporary)
+            os.replace(temporary, self.get_path(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        with open(self.get_path(key, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+        self.evict()
+
+    def entries(self):
+        """Return (mtime, size, key) for each file of the cache
+        """
+        entries = []
+        try:
+            items = os.scandir(self.directory)
+        except FileNotFoundError:
+            return entries
+        with items:
+            for entry in items:
+                key, extension = os.path.splitext(entry.name)
+                if extension == '.csv':
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, key))
+        return entries
+
+    def remove(self, key):
+        for extension in ('csv', 'json'):
+            try:
+                os.remove(self.get_path(key, extension))
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """Remove the least recently used files until
+        the cache uses less than `max_size` bytes
+        """
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, key in entries:
+            if size <= self.max_size:
+                break
+            self.remove(key)
+            size -= entry_size
+
+    def clear(self):
+        for _, _, key in self.entries():
+            self.remove(key)
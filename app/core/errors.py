@@ -23,3 +23,21 @@ class FileTypeError(BaseErrors):
 class SeparatorError(BaseErrors):
     def __init__(self, message=None):
         super().__init__('The separator you provided should be one of ". - _"')
+
+class PatternError(BaseErrors):
+    def __init__(self, message, pattern=None):
+        super().__init__(message)
+        self.pattern = pattern
+
+class PoolTimeoutError(BaseErrors):
+    def __init__(self, message):
+        super().__init__(message)
+
+class InvalidValueError(BaseErrors):
+    def __init__(self, message, value=None):
+        super().__init__(message)
+        self.value = value
+
+class AttachmentError(BaseErrors):
+    def __init__(self, message):
+        super().__init__(message)
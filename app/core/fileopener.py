@@ -1,25 +1,57 @@
 import csv
 import os
+import time
 from collections import OrderedDict
 from pathlib import Path
 
 from ze_mailer.app.core.errors import FileTypeError
 from ze_mailer.app.core.messages import Info
 from ze_mailer.app.core.mixins.utilities import UtilitiesMixin
+from ze_mailer.app.core.tables import NameTable
+
+# The number of nanoseconds during which the modification
+# time of a directory might not change after a modification
+MTIME_PRECISION = 2 * 10**9
 
 
 class FilesObject:
     """A dictionnary object that holds files in a directory and
     facilitates actions such as getting them back with ease
+
+    Description
+    -----------
+
+    The files are indexed by name and by extension. The directory
+    is only scanned again when its modification time changes
+    which happens when a file is added, removed or renamed:
+
+        files = FilesObject().scan_directory('path/to/data')
+        files.get_object('dummy')
+        files.by_extension('csv')
     """
-    files = OrderedDict()
+    def __init__(self):
+        self.files = OrderedDict()
+        # extension -> [Path, ...]
+        self.extensions = {}
+        self.directory_path = None
+        self.mtime = None
+        self.scanned_at = 0
+        self.exclude_files = ()
 
     def __getitem__(self, key):
-        try:
-            item = self.files[key]
-        except FileExistsError:
-            raise
-        return item
+        return self.files[key]
+
+    def __contains__(self, key):
+        return key in self.files
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    def __repr__(self):
+        return '%s(%s, %s files)' % (self.__class__.__name__, self.directory_path, len(self))
 
     def __setattr__(self, name, value):
         if name == 'files':
@@ -31,26 +63,37 @@ class FilesObject:
     def append(self, file_directory, filename):
         """Appends an item to files
         """
-        name, extension = filename.split('.')
-
-        full_path = os.path.join(file_directory, filename)
-        file_item = {
-            name: {
-                'extension': extension,
-                'object': Path(full_path)
-            }
+        # Only the last dot separates the
+        # name from the extension
+        name, extension = os.path.splitext(filename)
+        extension = extension[1:]
+
+        full_path = Path(os.path.join(file_directory, filename))
+        self.files[name] = {
+            'extension': extension,
+            'object': full_path
         }
-        self.files.update(file_item)
+        # Files with the same name but different extensions
+        # override each other in files but not here
+        self.extensions.setdefault(extension, []).append(full_path)
 
-    @classmethod
-    def get_object(cls, key):
+    def clear(self):
+        self.files = OrderedDict()
+        self.extensions = {}
+        self.mtime = None
+
+    def get_object(self, key):
         """Gets a file and returns the Path() element
         """
-        selected_file = cls.__getitem__(cls, key)
-        return selected_file['object']
+        return self[key]['object']
+
+    def by_extension(self, extension):
+        """Return the Path() elements of the files
+        that have the given extension
+        """
+        return list(self.extensions.get(extension.lstrip('.'), []))
 
-    @classmethod
-    def scan_directory(cls, directory_path, exclude_files: list=[], *args):
+    def scan_directory(self, directory_path, exclude_files: list=None, *args):
         """Scans the data directory in order to get
         all the files within it and return and the object
         elements
@@ -63,29 +106,119 @@ class FilesObject:
                 {
                     name: {
                         extension: extension,
-                        path: full_path,
                         object: Path(full_path)
                     }
                 }
+
+            Only the files at the top level of the directory are listed.
+            The previous scan is reused if the directory did not change
         """
-        # If there are no files in the directory or there
-        # someking of mishap where the wrong directory is
-        # selected for example, return empy generator
-        filenames = list(os.walk(directory_path))[0][2]
-        if len(filenames) == 0:
-            return cls
-
-        for filename in filenames:
-            if filename not in exclude_files:
-                cls.append(cls, directory_path, filename)
-        return cls
+        exclude_files = tuple(exclude_files or ())
+        mtime = os.stat(directory_path).st_mtime_ns
+        # A file added just after the last scan might not
+        # change the modification time of the directory
+        # which is not precise enough: a directory that
+        # was modified around that scan is scanned again
+        if (directory_path == self.directory_path and mtime == self.mtime
+                and exclude_files == self.exclude_files
+                and self.scanned_at - mtime > MTIME_PRECISION):
+            return self
+
+        scanned_at = time.time_ns()
+        self.clear()
+        with os.scandir(directory_path) as entries:
+            for entry in entries:
+                if entry.name not in exclude_files and entry.is_file():
+                    self.append(directory_path, entry.name)
+        self.directory_path = directory_path
+        self.mtime = mtime
+        self.scanned_at = scanned_at
+        self.exclude_files = exclude_files
+        return self
+
+class CSVStream(UtilitiesMixin):
+    """An iterable that reads and normalizes the rows of a csv
+    file one by one instead of loading the whole file in memory.
+    The file is read again each time the object is iterated over
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        # (mtime, size, number of rows) of the
+        # last time the rows were counted
+        self.counted = None
+        with open(file_path, 'r', encoding='utf-8') as f:
+            self.headers = next(csv.reader(f), [])
+
+    def __len__(self):
+        """The number of rows, counted by reading the file
+        again only when the file was modified
+        """
+        stat = os.stat(self.file_path)
+        if self.counted is None or self.counted[:2] != (stat.st_mtime_ns, stat.st_size):
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                csv_file = csv.reader(f)
+                next(csv_file, None)
+                count = sum(1 for row in csv_file if row)
+            self.counted = (stat.st_mtime_ns, stat.st_size, count)
+        return self.counted[2]
+
+    def __iter__(self):
+        return self.iter_rows()
+
+    def iter_rows(self, normalize=True):
+        """Read the rows of the file, with their name
+        normalized unless `normalize` is False
+        """
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            csv_file = csv.reader(f)
+            # Skip the headers
+            next(csv_file, None)
+            for row in csv_file:
+                if row:
+                    if normalize:
+                        row[0] = self.normalize_name(row[0])
+                    yield row
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.file_path)
 
 class FileOpener(UtilitiesMixin):
-    def __init__(self, file_path=None):
+    """Opens a csv file and normalizes the names that it contains
+
+    Parameters
+    ----------
+
+        file_path: the path to the csv file
+
+        stream: if True, the rows are read one by one from the
+                file when they are needed instead of being
+                loaded in memory
+
+        table: if True, the rows are stored in a NameTable which
+               uses several times less memory than lists of strings
+    """
+    def __init__(self, file_path=None, stream=False, table=False):
         if not file_path.endswith('csv'):
             message = 'Your file should be a csv file'
             raise FileTypeError(message, file_path)
-        
+
+        self.file_path = file_path
+        if stream:
+            self.csv_content = CSVStream(file_path)
+            self.headers = self.csv_content.headers
+            return
+
+        if table:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                csv_file = csv.reader(f)
+                # The rows are added to the table one by one
+                # so that the file is never fully loaded
+                csv_content = NameTable(next(csv_file, []))
+                csv_content.extend(row for row in csv_file if row)
+            self.headers = list(csv_content.headers)
+            self.csv_content = self.normalize_names(csv_content)
+            return
+
         with open(file_path, 'r', encoding='utf-8') as f:
             csv_file = csv.reader(f)
             csv_content = list(csv_file).copy()
@@ -99,11 +232,22 @@ class FileOpener(UtilitiesMixin):
         self.csv_content = self.normalize_names(csv_content)
 
 class FileWriter:
-    def create_file(self, file_path, headers:list, data:list, file_name=None):
+    def create_file(self, file_path, headers:list, data, file_name=None):
+        """Write the headers and the rows of data to a csv file. Data
+        can be any iterable, the rows are written as they come
+        """
+        count = 0
         with open(file_path, 'w', encoding='utf-8', newline='\n') as f:
-            # Recompose the header and the content
-            # data.insert(0, headers)
             csv_file = csv.writer(f)
+            if headers:
+                csv_file.writerow(headers)
             for row in data:
                 csv_file.writerow(row)
-        return Info('Wrote %s names to %s' % (len(data), os.path.basename(file_path)))
+                count += 1
+        return count
+
+    @staticmethod
+    def get_message(count, file_path, action='Wrote'):
+        """The message displayed once a file was created
+        """
+        return Info('%s %s names to %s' % (action, count, os.path.basename(file_path)))
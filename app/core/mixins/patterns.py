@@ -0,0 +1,290 @@
+"""Compiles the email patterns used by the names algorithms (`nom.prenom`,
+`pnom`, `nomp`...) into reusable templates
+
+author: pendenquejohn@gmail.com
+"""
+from functools import lru_cache
+
+from ze_mailer.app.core.errors import PatternError
+
+# The tokens that can be used in a pattern, ordered
+# from the longest to the shortest so that `prenom`
+# is never read as `p` followed by `renom`
+TOKENS = (
+    ('prenom', 'name'),
+    ('nom', 'surname'),
+    ('p', 'name_initial'),
+    ('n', 'surname_initial'),
+)
+
+# Position of each slot kind in the values
+# computed by EmailTemplate.render
+SLOT_KINDS = ('name', 'name_initial', 'surname', 'surname_initial')
+
+
+class EmailTemplate:
+    """A compiled version of a pattern such as `nom.prenom`
+
+    Description
+    -----------
+
+    The pattern is parsed once into its slots (name, name initial,
+    surname, surname initial) and the literal segments between them
+    so that creating an email for a given row only consists
+    of filling the slots:
+
+        nom.prenom -> slots: [surname, name], literals: ['.']
+
+    Parameters
+    ----------
+
+        pattern: the pattern to compile e.g. `nom.prenom`
+
+        domain: the domain to append to the email e.g. `edhec.com`
+
+        particle: a tuple or a list containing the string to append
+                  and its separator e.g. (bba, -)
+    """
+    def __init__(self, pattern, domain=None, particle=None):
+        self.pattern = pattern
+        self.domain = domain
+        self.particle = particle
+        self.slots, self.literals = self.parse(pattern)
+
+        # The first literal is the separator
+        # of the pattern e.g. '.' for nom.prenom
+        self.separator = self.literals[0] if self.literals else ''
+
+        # Precompute everything that does not
+        # depend on the row: the format string
+        # for the local part and the suffix
+        # e.g. -bba@edhec.com
+        local_format = ['{%s}' % 0]
+        for index, literal in enumerate(self.literals, start=1):
+            local_format.append(literal.replace('{', '{{').replace('}', '}}'))
+            local_format.append('{%s}' % index)
+        self.local_format = ''.join(local_format)
+
+        suffix = ''
+        if particle:
+            if isinstance(particle, str):
+                suffix = self.separator + particle
+            else:
+                value, separator = particle
+                suffix = separator + value
+        if domain:
+            suffix = suffix + '@' + domain
+        self.suffix = suffix
+
+    def __str__(self):
+        return self.pattern
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.pattern)
+
+    @staticmethod
+    def parse(pattern):
+        """Parse a pattern into a list of slot indexes and
+        the literals that separate them
+
+        Example
+        -------
+
+            `p.nom` becomes `([1, 2], ['.'])`
+        """
+        if not pattern or not isinstance(pattern, str):
+            raise PatternError('The pattern should be a non empty string. '
+                    'Received %s' % repr(pattern), pattern)
+
+        slots = []
+        literals = []
+        literal = ''
+        position = 0
+        while position < len(pattern):
+            for token, kind in TOKENS:
+                if pattern.startswith(token, position):
+                    if slots:
+                        literals.append(literal)
+                    elif literal:
+                        raise PatternError('A pattern cannot start with a '
+                                'separator: %s' % pattern, pattern)
+                    slot = SLOT_KINDS.index(kind)
+                    if slot in slots:
+                        raise PatternError('The element "%s" is used more than once in '
+                                'the pattern: %s' % (token, pattern), pattern)
+                    slots.append(slot)
+                    literal = ''
+                    position += len(token)
+                    break
+            else:
+                character = pattern[position]
+                if character.isalnum():
+                    raise PatternError('We could not find any match with the '
+                            'pattern (%s) that was provided' % pattern, pattern)
+                literal += character
+                position += 1
+
+        if literal:
+            raise PatternError('A pattern cannot end with a '
+                    'separator: %s' % pattern, pattern)
+        return slots, literals
+
+    def render(self, name, surname):
+        """Create the email for a given name and surname
+
+        Example
+        -------
+
+            For `nom.prenom@edhec.com`, ('eugenie', 'bouchard') becomes
+            `bouchard.eugenie@edhec.com`
+        """
+        values = (name, name[:1], surname, surname[:1])
+        parts = [values[slot] for slot in self.slots]
+        if all(parts):
+            return self.local_format.format(*parts) + self.suffix
+
+        # When a part of the name is missing e.g. a single
+        # name, do not keep the separators around it
+        local = ''
+        for index, part in enumerate(parts):
+            if not part:
+                continue
+            if local:
+                local = local + self.literals[index - 1]
+            local = local + part
+        return local + self.suffix
+
+    @staticmethod
+    def split_name(name):
+        """Split a normalized name in a name and a surname. Single
+        names are considered to be surnames and composed surnames
+        are joined together
+
+        Example
+        -------
+
+            `eugenie bouchard` becomes `(eugenie, bouchard)`
+
+            `eugenie de la tour` becomes `(eugenie, delatour)`
+        """
+        tokens = name.split()
+        if not tokens:
+            return '', ''
+        if len(tokens) == 1:
+            return '', tokens[0]
+        return tokens[0], ''.join(tokens[1:])
+
+    @property
+    def key(self):
+        """Identifies everything that changes the emails
+        created by the template
+        """
+        return (self.pattern, self.local_format, self.suffix)
+
+    def render_name(self, name):
+        """Create the email from a full name e.g. `eugenie bouchard`
+        """
+        return self.render(*self.split_name(name))
+
+    def render_rows(self, rows):
+        """Return a copy of each row with the email created from
+        its first column. Used to create the emails by chunks
+        """
+        render_name = self.render_name
+        return [row + [render_name(row[0])] for row in rows]
+
+
+class TemplateList:
+    """Ordered templates used to create multiple emails for each name,
+    from the most to the least likely one e.g. `['nomp', 'nom']`
+
+    Description
+    -----------
+
+    Each row creates one row per distinct email with its rank. The
+    emails created by two templates can be the same, for instance
+    for single names, in which case only the best ranked one is kept:
+
+        [eugenie bouchard] => [eugenie bouchard, boucharde, 1], [eugenie bouchard, bouchard, 2]
+    """
+    def __init__(self, templates):
+        self.templates = list(templates)
+
+    def __str__(self):
+        return str([template.pattern for template in self.templates])
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.__str__())
+
+    def __iter__(self):
+        return iter(self.templates)
+
+    def __len__(self):
+        return len(self.templates)
+
+    @property
+    def key(self):
+        return tuple(template.key for template in self.templates)
+
+    def render_name(self, name):
+        """Return the distinct emails created from a full
+        name, from the most to the least likely one
+        """
+        parts = EmailTemplate.split_name(name)
+        emails = []
+        for template in self.templates:
+            email = template.render(*parts)
+            if email not in emails:
+                emails.append(email)
+        return emails
+
+    def render_row(self, row):
+        """Return a copy of the row for each of its
+        emails with the rank of the email
+        """
+        return [row + [email, rank] for rank, email in enumerate(self.render_name(row[0]), start=1)]
+
+    def render_rows(self, rows):
+        render_row = self.render_row
+        return [item for row in rows for item in render_row(row)]
+
+
+@lru_cache(maxsize=None)
+def compile_pattern(pattern, domain=None, particle=None):
+    """Return the compiled EmailTemplate for a pattern. Templates
+    are only compiled once for a given pattern, domain and particle
+    """
+    return EmailTemplate(pattern, domain=domain, particle=particle)
+
+
+class PatternsMixin:
+    """A mixin used to extend the names algorithms with
+    the template compiled from their `pattern`, `domain`
+    and `particle` attributes. The pattern can also be a
+    list of patterns ordered by priority
+    """
+    @property
+    def multiple(self):
+        return isinstance(self.pattern, (list, tuple))
+
+    @property
+    def template(self):
+        """The EmailTemplate of the pattern or a TemplateList
+        when multiple patterns are used
+        """
+        particle = self.particle
+        if isinstance(particle, list):
+            particle = tuple(particle)
+        if self.multiple:
+            return TemplateList(compile_pattern(pattern, domain=self.domain or None,
+                                    particle=particle or None) for pattern in self.pattern)
+        return compile_pattern(self.pattern, domain=self.domain or None,
+                    particle=particle or None)
+
+    @property
+    def output_headers(self):
+        """The headers of the rows with their emails
+        """
+        if self.multiple:
+            return self.headers + ['email', 'rank']
+        return self.headers + ['email']
@@ -1,5 +1,64 @@
-from ze_mailer.app.core.messages import Info
 import re
+import unicodedata
+
+from ze_mailer.app.core.messages import Info
+from ze_mailer.app.core.tables import NameTable
+
+# Letters that cannot be decomposed into
+# a letter and an accent
+SPECIAL_LETTERS = {
+    'ß': 'ss',
+    'æ': 'ae',
+    'Æ': 'AE',
+    'œ': 'oe',
+    'Œ': 'OE',
+    'ø': 'o',
+    'Ø': 'O',
+    'đ': 'd',
+    'Đ': 'D',
+    'ð': 'd',
+    'Ð': 'D',
+    'ł': 'l',
+    'Ł': 'L',
+    'þ': 'th',
+    'Þ': 'TH',
+    'ı': 'i',
+    'ħ': 'h',
+    'Ħ': 'H',
+    'ŧ': 't',
+    'Ŧ': 'T',
+    'ŋ': 'n',
+    'Ŋ': 'N',
+    'ĸ': 'k',
+    'ƒ': 'f',
+}
+
+
+def build_accents_table():
+    """Create the translation table used to replace the accented
+    letters of Latin-1 and Latin Extended (A and B) by their
+    ascii equivalent e.g. é -> e, ç -> c, ß -> ss
+    """
+    table = {}
+    for code in range(0x00C0, 0x0250):
+        letter = chr(code)
+        decomposed = ''.join(item for item in unicodedata.normalize('NFKD', letter)
+                            if not unicodedata.combining(item))
+        if decomposed != letter and decomposed.isascii():
+            table[code] = decomposed
+    table.update({ord(key): value for key, value in SPECIAL_LETTERS.items()})
+    return table
+
+ACCENTS = build_accents_table()
+
+# Names composed of words separated by a single
+# whitespace e.g. 'eugenie bouchard'. Each word has
+# to be followed by a whitespace or the end of the
+# name which prevents the regex from backtracking
+NORMAL_NAME = re.compile(r'^\w+(?:\s\w+)*\s?$')
+
+SINGLE_NAME = re.compile(r'^\w+$')
+
 
 class UtilitiesMixin:
     """A mixin used to extend classes with various definitions on 
@@ -11,8 +70,8 @@ class UtilitiesMixin:
         get names like 'eugenie bouchard' or 'eugenie' and we
         have to able to distinguish that
         """
-        is_normal = re.match(r'^(?:\w+\s?)+$', name)
-        is_single = re.match(r'^(?:\w+)$', name)
+        is_normal = NORMAL_NAME.match(name)
+        is_single = SINGLE_NAME.match(name)
 
         if is_normal:
             return {'regex': is_normal, 'match': 'normal'}
@@ -27,6 +86,12 @@ class UtilitiesMixin:
         
         `Eugénie Bouchard` becomes `[Eugénie, Bouchard]`.
         """
+        # Most names are composed of two words separated
+        # by a space in which case we do not need a regex
+        first, separator, last = name.partition(' ')
+        if separator and first.isalnum() and last.isalnum():
+            return [first, last]
+
         # We have to assert through a regex
         # that we are getting a classic pattern:
         # 'eugenie bouchard' as opposed to 'eugenie'
@@ -59,6 +124,12 @@ class UtilitiesMixin:
 
     @classmethod
     def normalize_names(cls, names:list):
+        if isinstance(names, NameTable):
+            # The column of names is replaced
+            # at once in the table
+            if names.columns:
+                names.map_column(0, cls.normalize_name)
+            return names
         for index, name in enumerate(names):
             # TODO: Cases where the array contains
             # two names - Build something
@@ -79,25 +150,24 @@ class UtilitiesMixin:
 
             NOTE - This method will also normalize the name
         """
-        new_name=''
-        accents = {
-            'é': 'e',
-            'è': 'e',
-            'ê': 'e',
-            'ë': 'e',
-            'ï': 'i',
-            'î': 'i',
-            'ü': 'u',
-            'ù': 'u',
-            'à': 'a',
-        }
-        for letter in name:
-            for key, value in accents.items():
-                if letter == key:
-                    letter = value
-            new_name += letter
+        new_name = name.translate(ACCENTS)
+        if not new_name.isascii():
+            # Letters that are not in the table e.g. from
+            # other alphabets are decomposed in order to
+            # remove the accents that they might have
+            new_name = ''.join(letter for letter in unicodedata.normalize('NFKD', new_name)
+                            if not unicodedata.combining(letter))
         return cls.normalize_name(new_name)
 
+    @classmethod
+    def flatten_names(cls, names):
+        """Replace all accents from multiple names
+        and normalize them
+        """
+        flatten_name = cls.flatten_name
+        for name in names:
+            yield flatten_name(name)
+
     @classmethod
     def reverse(cls, name):
         """Reverse an array with names.
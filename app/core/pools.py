@@ -0,0 +1,198 @@
+"""A pool of SMTP connections that keeps the authenticated
+sessions to the servers open in order to reuse them
+across multiple emails
+
+author: pendenquejohn@gmail.com
+"""
+import smtplib
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from ze_mailer.app.core.errors import PoolTimeoutError
+from ze_mailer.app.core.servers import BaseServer
+
+
+class ServerPool:
+    """Keeps the connections to the SMTP servers open and
+    reuses them instead of connecting, starting TLS and
+    logging in for each email that is sent
+
+    Description
+    -----------
+
+    The connections are grouped by host, port and user. Before being
+    reused, a connection is checked with a NOOP command and replaced
+    by a new one if the server closed it in the meantime.
+
+        pool = ServerPool(max_size=5)
+
+        with pool.connection('smtp.gmail.com', 587, user, password) as server:
+            server.smtp_connection.sendmail(sender, receiver, message)
+
+    Parameters
+    ----------
+
+        server_class: the BaseServer subclass used to create the connections
+
+        max_size: the maximum number of connections opened at the same
+                  time for a given host, port and user
+
+        idle_timeout: the number of seconds after which a connection
+                      that was not used is closed instead of being reused
+    """
+    def __init__(self, server_class=BaseServer, max_size=5, idle_timeout=60,
+                    health_check=True, clock=time.monotonic):
+        self.server_class = server_class
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check = health_check
+        self.clock = clock
+        # key -> deque([(server, released_at), ...])
+        self.idle = {}
+        # key -> number of opened connections
+        self.sizes = {}
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        with self.condition:
+            return sum(self.sizes.values())
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, dict(self.sizes))
+
+    @staticmethod
+    def get_key(host, port, user):
+        return (host, port, user)
+
+    def create_server(self, host, port, user=None, password=None):
+        return self.server_class(host=host, port=port, user=user, password=password)
+
+    def discard(self, key, server):
+        """Close a connection and free its place in the pool
+        """
+        with self.condition:
+            self.sizes[key] = self.sizes.get(key, 1) - 1
+            self.condition.notify()
+        server.close()
+
+    def prune(self):
+        """Close the connections that were not used
+        for more than `idle_timeout` seconds
+        """
+        now = self.clock()
+        expired = []
+        with self.condition:
+            for key, connections in self.idle.items():
+                while connections and now - connections[0][1] > self.idle_timeout:
+                    server, _ = connections.popleft()
+                    expired.append((key, server))
+        for key, server in expired:
+            self.discard(key, server)
+
+    def acquire(self, host, port, user=None, password=None, timeout=None):
+        """Return a connection to the server. An idle connection
+        is reused when possible, otherwise a new one is created.
+        If `max_size` connections are already in use, waits
+        until one of them is released
+        """
+        key = self.get_key(host, port, user)
+        self.prune()
+
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            with self.condition:
+                connections = self.idle.setdefault(key, deque())
+                if connections:
+                    # Use the most recently released
+                    # connection which is the most
+                    # likely to still be open
+                    server, _ = connections.pop()
+                elif self.sizes.get(key, 0) < self.max_size:
+                    self.sizes[key] = self.sizes.get(key, 0) + 1
+                    server = None
+                else:
+                    remaining = None if deadline is None else deadline - self.clock()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolTimeoutError('Could not get a connection to %s:%s '
+                                'in %s seconds' % (host, port, timeout))
+                    self.condition.wait(remaining)
+                    continue
+
+            if server is None:
+                try:
+                    server = self.create_server(host, port, user=user, password=password)
+                except Exception:
+                    with self.condition:
+                        self.sizes[key] -= 1
+                        self.condition.notify()
+                    raise
+            elif self.health_check and not server.is_connected():
+                # The server closed the connection on
+                # its side: replace it by a new one
+                self.discard(key, server)
+                continue
+
+            server.pool_key = key
+            return server
+
+    def release(self, server, discard=False):
+        """Give back a connection to the pool. Connections that
+        are in an unknown state should be discarded
+        """
+        key = server.pool_key
+        if discard:
+            self.discard(key, server)
+            return
+
+        with self.condition:
+            self.idle.setdefault(key, deque()).append((server, self.clock()))
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self, host, port, user=None, password=None, timeout=None):
+        """Acquire a connection and release it once it was used.
+        The connection is discarded if the server disconnected
+        """
+        server = self.acquire(host, port, user=user, password=password, timeout=timeout)
+        try:
+            yield server
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self.release(server, discard=True)
+            raise
+        except BaseException:
+            self.release(server)
+            raise
+        else:
+            self.release(server)
+
+    def sendmail(self, host, port, sender, receiver, message, user=None, password=None):
+        """Send an email using a connection from the pool. A new
+        connection is used if the server closed the one that was
+        acquired before the transaction started. Once the transaction
+        started, the email might have been received and it is never
+        sent again
+        """
+        started = False
+        for attempt in range(2):
+            try:
+                with self.connection(host, port, user=user, password=password) as server:
+                    if not self.health_check:
+                        # The connection was not checked when it was acquired
+                        server.smtp_connection.noop()
+                    started = True
+                    return server.smtp_connection.sendmail(sender, receiver, message)
+            except smtplib.SMTPServerDisconnected:
+                if started or attempt:
+                    raise
+
+    def close(self):
+        """Close all the connections that are not in use
+        """
+        with self.condition:
+            idle = [(key, server) for key, connections in self.idle.items()
+                        for server, _ in connections]
+            self.idle = {}
+        for key, server in idle:
+            self.discard(key, server)
@@ -0,0 +1,276 @@
+"""A persistent queue of the emails to send stored in a local
+SQLite database so that a bulk run can be resumed after a crash
+
+author: pendenquejohn@gmail.com
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from ze_mailer.app.core.senders import Envelope, SendResult
+from ze_mailer.app.core.settings import configuration
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    sender TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    message BLOB NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_state ON messages (state, available_at, id);
+"""
+
+
+class SendQueue:
+    """A queue of envelopes stored in SQLite
+
+    Description
+    -----------
+
+    Each envelope goes through the following states:
+
+        queued -> in_flight -> sent
+                            -> retry -> in_flight ...
+                            -> failed
+
+    The envelopes are claimed and updated by batches in a single
+    transaction. Deferred envelopes are retried after an exponential
+    backoff and marked as failed after `max_attempts` attempts.
+
+    A claimed envelope is leased for `lease` seconds. When the process
+    stops, the envelopes that were in flight can be claimed again
+    once their lease expired, which allows multiple processes to use
+    the same queue. Since it is not possible to know if they were
+    sent, these envelopes, and only them, might be sent twice.
+
+        queue = SendQueue()
+        queue.enqueue(envelopes)
+        queue.drain(BatchSender(server).send)
+
+    Parameters
+    ----------
+
+        path: the SQLite file, `configuration['queue_file']` by default
+
+        backoff: the number of seconds to wait before the first retry,
+                 doubled after each attempt up to `max_backoff`
+
+        lease: the number of seconds after which an envelope that
+               is still in flight can be claimed again
+    """
+    QUEUED = 'queued'
+    IN_FLIGHT = 'in_flight'
+    SENT = 'sent'
+    FAILED = 'failed'
+    RETRY = 'retry'
+
+    def __init__(self, path=None, max_attempts=5, backoff=60, max_backoff=3600,
+                    lease=600, recover=True, clock=time.time):
+        self.path = path or configuration['queue_file']
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(self.path, isolation_level=None,
+                                    check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+        if recover:
+            self.recover()
+
+    def __len__(self):
+        """The number of envelopes that still have to be sent
+        """
+        counts = self.counts()
+        return counts[self.QUEUED] + counts[self.RETRY] + counts[self.IN_FLIGHT]
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, self.counts())
+
+    def transaction(self, statements):
+        """Execute (sql, rows) statements in a single transaction
+        """
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                for sql, rows in statements:
+                    cursor.executemany(sql, rows)
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+
+    def enqueue(self, envelopes, batch_size=10000):
+        """Add envelopes to the queue and return their number
+        """
+        count = 0
+        now = self.clock()
+        batch = []
+        for envelope in envelopes:
+            message = envelope.message
+            if isinstance(message, str):
+                message = message.encode('utf-8')
+            batch.append((envelope.sender, json.dumps(envelope.recipients), message, now))
+            if len(batch) >= batch_size:
+                count += self.insert(batch)
+                batch = []
+        if batch:
+            count += self.insert(batch)
+        return count
+
+    def insert(self, rows):
+        self.transaction([('INSERT INTO messages (sender, recipients, message, updated_at) '
+                            'VALUES (?, ?, ?, ?)', rows)])
+        return len(rows)
+
+    def claim(self, limit=100):
+        """Mark up to `limit` envelopes that can be sent as being in
+        flight and return them, the ones that are available since the
+        longest time first. The id of each envelope in the queue is
+        stored in `envelope.queue_id`
+        """
+        now = self.clock()
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # Each state is read in the order of the index
+                # which avoids sorting all the available rows
+                candidates = []
+                for state in (self.QUEUED, self.RETRY, self.IN_FLIGHT):
+                    candidates.extend(cursor.execute(
+                        'SELECT available_at, id FROM messages WHERE state = ? '
+                        'AND available_at <= ? ORDER BY available_at, id LIMIT ?',
+                        (state, now, limit)
+                    ).fetchall())
+                ids = [queue_id for _, queue_id in sorted(candidates)[:limit]]
+
+                rows = []
+                for queue_id in ids:
+                    rows.append(cursor.execute(
+                        'SELECT id, sender, recipients, message FROM messages WHERE id = ?',
+                        (queue_id,)
+                    ).fetchone())
+                cursor.executemany('UPDATE messages SET state = ?, available_at = ?, '
+                            'updated_at = ? WHERE id = ?',
+                            [(self.IN_FLIGHT, now + self.lease, now, queue_id) for queue_id in ids])
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+            cursor.execute('COMMIT')
+
+        envelopes = []
+        for queue_id, sender, recipients, message in rows:
+            envelope = Envelope(sender, json.loads(recipients), message)
+            envelope.queue_id = queue_id
+            envelopes.append(envelope)
+        return envelopes
+
+    def update(self, results):
+        """Update the state of the claimed envelopes from their
+        results: accepted envelopes are sent, refused and failed
+        ones have failed and deferred ones are retried later
+        """
+        now = self.clock()
+        sent = []
+        failed = []
+        retried = []
+        for result in results:
+            queue_id = result.envelope.queue_id
+            error = str(result.error) if result.error else None
+            if result.status == SendResult.ACCEPTED:
+                sent.append((self.SENT, now, queue_id))
+            elif result.status in (SendResult.REFUSED, SendResult.FAILED):
+                failed.append((self.FAILED, now, error, queue_id))
+            else:
+                retried.append((self.max_attempts, self.FAILED, self.RETRY, now, self.backoff,
+                                self.max_backoff, now, error, queue_id))
+
+        # The attempts are counted by the database so that the
+        # processes retrying the same envelope do not override
+        # each other. The backoff doubles after each attempt
+        self.transaction([
+            ('UPDATE messages SET state = ?, updated_at = ? WHERE id = ?', sent),
+            ('UPDATE messages SET state = ?, attempts = attempts + 1, updated_at = ?, '
+                'error = ? WHERE id = ?', failed),
+            ('UPDATE messages SET state = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END, '
+                'attempts = attempts + 1, '
+                'available_at = ? + MIN(? * (1 << MIN(attempts, 32)), ?), '
+                'updated_at = ?, error = ? WHERE id = ?', retried)
+        ])
+
+    def recover(self):
+        """Put the envelopes whose lease expired back in the queue.
+        The envelopes claimed by the other processes are kept
+        """
+        now = self.clock()
+        self.transaction([('UPDATE messages SET state = ?, updated_at = ? '
+                            'WHERE state = ? AND available_at <= ?',
+                            [(self.RETRY, now, self.IN_FLIGHT, now)])])
+
+    def release(self, envelopes, error=None):
+        """Defer claimed envelopes that were not sent
+        """
+        self.update([SendResult(envelope, SendResult.DEFERRED, error=error)
+                        for envelope in envelopes])
+
+    def counts(self):
+        """The number of envelopes in each state
+        """
+        counts = dict.fromkeys([self.QUEUED, self.IN_FLIGHT, self.SENT,
+                                self.FAILED, self.RETRY], 0)
+        with self.lock:
+            rows = self.connection.execute('SELECT state, COUNT(*) FROM messages GROUP BY state')
+            counts.update(rows.fetchall())
+        return counts
+
+    def next_available(self):
+        """The time at which the next envelope to retry
+        can be sent or None if there is none
+        """
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT MIN(available_at) FROM messages WHERE state IN (?, ?)',
+                (self.QUEUED, self.RETRY)
+            ).fetchone()
+        return row[0]
+
+    def drain(self, send, batch_size=100, sleep=time.sleep):
+        """Send all the envelopes of the queue using `send(envelopes)`
+        which returns the results of the envelopes (e.g. BatchSender.send)
+        and wait for the envelopes that have to be retried later
+        """
+        while True:
+            envelopes = self.claim(batch_size)
+            if envelopes:
+                try:
+                    results = list(send(envelopes))
+                except BaseException as error:
+                    self.release(envelopes, error=error)
+                    raise
+                self.update(results)
+                # The envelopes without a result are deferred
+                # instead of staying in flight
+                reported = {result.envelope.queue_id for result in results}
+                missing = [envelope for envelope in envelopes if envelope.queue_id not in reported]
+                if missing:
+                    self.release(missing)
+                continue
+            available_at = self.next_available()
+            if available_at is None:
+                return
+            sleep(max(0, available_at - self.clock()))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,288 @@
+"""A scheduler that spreads the emails to send over multiple
+accounts while respecting the sending limits of the providers
+
+author: pendenquejohn@gmail.com
+"""
+import time
+from collections import Counter, deque
+
+from ze_mailer.app.core.errors import NoServerError
+from ze_mailer.app.core.settings import configuration
+
+
+class TokenBucket:
+    """Allows `count` emails per `period` seconds. The tokens
+    are refilled continuously which means that the emails
+    can also be sent in bursts of up to `count` emails
+    """
+    def __init__(self, count, period, clock=time.monotonic):
+        self.capacity = count
+        self.rate = count / period
+        self.clock = clock
+        self.tokens = count
+        self.updated_at = clock()
+
+    def __repr__(self):
+        return '%s(%s/%ss)' % (self.__class__.__name__, self.capacity,
+                    round(self.capacity / self.rate))
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def available(self):
+        self.refill()
+        return self.tokens
+
+    def check(self, count):
+        # More tokens than the capacity of
+        # the bucket are never available
+        if count > self.capacity:
+            raise ValueError('Cannot use %s tokens of a bucket of %s tokens'
+                                % (count, self.capacity))
+
+    def wait_time(self, count=1):
+        """The number of seconds to wait before
+        `count` tokens are available
+        """
+        self.check(count)
+        self.refill()
+        if self.tokens >= count:
+            return 0
+        return (count - self.tokens) / self.rate
+
+    def consume(self, count=1):
+        self.check(count)
+        self.refill()
+        if self.tokens < count:
+            return False
+        self.tokens -= count
+        return True
+
+
+class Scheduler:
+    """Queue of emails to send using the accounts configured in
+    `configuration['server_config']`
+
+    Description
+    -----------
+
+    Each server, account and recipient domain has its own token
+    buckets created from `configuration['sending_limits']`. An
+    email uses one token for each of its recipients, counted for
+    the domain of each recipient. An email is given to the first
+    account whose buckets allow sending it, which spreads the
+    emails over the accounts:
+
+        scheduler = Scheduler()
+        scheduler.extend(envelopes)
+        scheduler.run(lambda account, envelope: pool.sendmail(...))
+
+    Parameters
+    ----------
+
+        accounts: a list of server configurations (name, host, port,
+                  user, password), the values of `server_config`
+                  are used by default
+
+        limits: the sending limits, `sending_limits` by default
+
+        lookahead: the number of queued emails checked when the
+                   recipient domain of the first one cannot
+                   receive more emails at the moment
+
+    An email with more recipients than a limit allows can never
+    be sent and is refused by `add`: it should be split first
+    """
+    def __init__(self, accounts=None, limits=None, lookahead=100, clock=time.monotonic):
+        if accounts is None:
+            accounts = list(configuration['server_config'].values())
+        self.accounts = list(accounts)
+        self.limits = limits if limits is not None else configuration['sending_limits']
+        self.lookahead = lookahead
+        self.clock = clock
+        self.queue = deque()
+        # The number of queued recipients of each domain
+        self.domains = Counter()
+        self.recipients = 0
+        self.buckets = {}
+
+    def __len__(self):
+        return len(self.queue)
+
+    def __repr__(self):
+        return '%s(%s queued, %s accounts)' % (self.__class__.__name__,
+                    len(self.queue), len(self.accounts))
+
+    @property
+    def queue_depth(self):
+        return len(self.queue)
+
+    @staticmethod
+    def get_domains(envelope):
+        """The number of recipients of each domain of an email
+        """
+        return Counter(recipient.rsplit('@', 1)[-1].lower() for recipient in envelope.recipients)
+
+    def get_buckets(self, scope, key, limits):
+        buckets = self.buckets.get((scope, key))
+        if buckets is None:
+            buckets = [TokenBucket(count, period, clock=self.clock) for count, period in limits]
+            self.buckets[(scope, key)] = buckets
+        return buckets
+
+    def account_buckets(self, account):
+        """The buckets of the server and of
+        the account used to send an email
+        """
+        limits = self.limits.get(account['name'], {})
+        server = self.get_buckets('server', account['name'], limits.get('server', []))
+        user = self.get_buckets('account', (account['name'], account['user']),
+                            limits.get('account', []))
+        return server + user
+
+    def domain_buckets(self, domain):
+        return self.get_buckets('domain', domain, self.limits.get('domain', []))
+
+    def get_capacity(self, account):
+        """The largest number of recipients that
+        an account can send an email to
+        """
+        limits = self.limits.get(account['name'], {})
+        return min([count for count, _ in limits.get('server', []) + limits.get('account', [])]
+                        or [float('inf')])
+
+    def add(self, envelope):
+        count = len(envelope.recipients)
+        domains = self.get_domains(envelope)
+        domain_capacity = min([limit for limit, _ in self.limits.get('domain', [])]
+                                or [float('inf')])
+        if max(domains.values() or [0]) > domain_capacity or (self.accounts
+                and count > max(self.get_capacity(account) for account in self.accounts)):
+            raise ValueError('The email to %s recipients exceeds the sending limits'
+                                ' and should be split' % count)
+        self.queue.append(envelope)
+        self.domains.update(domains)
+        self.recipients += count
+
+    def extend(self, envelopes):
+        for envelope in envelopes:
+            self.add(envelope)
+
+    def next(self):
+        """Return the next email to send with the account to use,
+        or None and the number of seconds to wait before an email
+        can be sent
+        """
+        if not self.queue:
+            return None, 0
+        if not self.accounts:
+            raise NoServerError('There is no account to send the emails')
+
+        account_waits = [max([bucket.wait_time() for bucket in self.account_buckets(account)] or [0])
+                            for account in self.accounts]
+        if min(account_waits):
+            return None, min(account_waits)
+
+        wait = None
+        for index in range(min(self.lookahead, len(self.queue))):
+            envelope = self.queue[index]
+            domains = self.get_domains(envelope)
+            domain_buckets = [(bucket, count) for domain, count in domains.items()
+                                for bucket in self.domain_buckets(domain)]
+            item_wait = max([bucket.wait_time(count) for bucket, count in domain_buckets] or [0])
+
+            selected = None
+            if not item_wait:
+                count = len(envelope.recipients)
+                account_waits = []
+                for account in self.accounts:
+                    if count > self.get_capacity(account):
+                        continue
+                    buckets = self.account_buckets(account)
+                    account_wait = max([bucket.wait_time(count) for bucket in buckets] or [0])
+                    if not account_wait:
+                        selected = account, buckets
+                        break
+                    account_waits.append(account_wait)
+                else:
+                    item_wait = min(account_waits)
+
+            if selected is None:
+                wait = item_wait if wait is None else min(wait, item_wait)
+                continue
+
+            account, buckets = selected
+            for bucket in buckets:
+                bucket.consume(count)
+            for bucket, domain_count in domain_buckets:
+                bucket.consume(domain_count)
+            # Use the other accounts first for
+            # the next emails
+            self.accounts.remove(account)
+            self.accounts.append(account)
+
+            del self.queue[index]
+            self.domains.subtract(domains)
+            for domain in domains:
+                if self.domains[domain] <= 0:
+                    del self.domains[domain]
+            self.recipients -= count
+            return (account, envelope), 0
+        return None, wait
+
+    def throughput(self):
+        """The number of recipients per second that can receive
+        an email in the long run with the configured accounts
+        """
+        servers = {}
+        for account in self.accounts:
+            limits = self.limits.get(account['name'], {})
+            account_rate = min([count / period for count, period in limits.get('account', [])]
+                            or [float('inf')])
+            rate, server_rate = servers.get(account['name'], (0, None))
+            if server_rate is None:
+                server_rate = min([count / period for count, period in limits.get('server', [])]
+                                or [float('inf')])
+            servers[account['name']] = (rate + account_rate, server_rate)
+        return sum(min(rate, server_rate) for rate, server_rate in servers.values())
+
+    def projected_completion(self):
+        """The estimated number of seconds needed to send
+        all the emails that are in the queue
+        """
+        if not self.queue:
+            return 0
+        rate = self.throughput()
+        if not rate:
+            return float('inf')
+
+        # The tokens that are available now allow
+        # sending a first batch immediately
+        available = 0
+        for account in self.accounts:
+            buckets = self.account_buckets(account)
+            available += min([bucket.available() for bucket in buckets] or [self.recipients])
+        projection = max(0, self.recipients - available) / rate
+
+        # A domain receiving many emails can
+        # take longer than the accounts
+        domain_limits = self.limits.get('domain', [])
+        if domain_limits:
+            domain_rate = min(count / period for count, period in domain_limits)
+            for domain, count in self.domains.items():
+                available = min(bucket.available() for bucket in self.domain_buckets(domain))
+                projection = max(projection, max(0, count - available) / domain_rate)
+        return projection
+
+    def run(self, send, sleep=time.sleep):
+        """Send all the emails in the queue by calling `send(account, envelope)`
+        and wait when the limits do not allow sending more emails
+        """
+        while self.queue:
+            item, wait = self.next()
+            if item is None:
+                sleep(wait)
+            else:
+                send(*item)
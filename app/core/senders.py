@@ -1,16 +1,21 @@
-import asyncio
 import os
-from asyncio import coroutine, create_task, run
-from email.encoders import encode_base64
-from email.mime.base import MIMEBase
+import re
+import smtplib
+import time
+from collections import OrderedDict
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from mimetypes import guess_type, read_mime_types
 
+from ze_mailer.app.core.attachments import (AttachmentCache, StreamingAttachment,
+                                            iter_message_data)
 from ze_mailer.app.core.errors import NoServerError
+from ze_mailer.app.core.pools import ServerPool
 from ze_mailer.app.core.servers import Gmail
 from ze_mailer.app.core.settings import configuration
 
+CRLF = b'\r\n'
+
 
 class SendEmail:
     """Send an email using a server
@@ -32,6 +37,21 @@ class SendEmail:
     server = Gmail
 
     def __init__(self, sender, receiver, subject, **kwargs):
+        Klass = self.get_server(**kwargs)
+        message = self.create_message(sender, receiver, subject, **kwargs)
+
+        # ..Send email
+        if any(isinstance(part, StreamingAttachment) for part in message.walk()):
+            # The attachments are encoded while
+            # the email is being sent
+            send_stream(Klass.smtp_connection, sender, receiver, iter_message_data(message))
+        else:
+            Klass.smtp_connection.sendmail(sender, receiver, message.as_string())
+        Klass.smtp_connection.close()
+
+    def get_server(self, **kwargs):
+        """Create the server used to send the email
+        """
         if self.server:
             if callable(self.server):
                 # Create a new server instance
@@ -42,9 +62,8 @@ class SendEmail:
                 # credentials whatsoever by default. The user is
                 # responsible for providing them whichever way suits
                 if 'user' in kwargs and 'password' in kwargs:
-                    Klass = self.server(user=kwargs['user'], password=kwargs['password'])
-                else:
-                    Klass = self.server()
+                    return self.server(user=kwargs['user'], password=kwargs['password'])
+                return self.server()
             else:
                 raise NoServerError('Server is not a callable. \
                             Received %s' % type(self.server))
@@ -52,7 +71,10 @@ class SendEmail:
             raise NoServerError('Server was not provided. \
                         Did you forget to register a server?')
 
-        # Create a MIME object
+    @staticmethod
+    def create_message(sender, receiver, subject, **kwargs):
+        """Create the MIME object of the email
+        """
         message = MIMEMultipart('alternative')
         message['From'] = sender
         message['To'] = receiver
@@ -67,11 +89,12 @@ class SendEmail:
 
         # Attachment - attach if any
         if 'attachment' in kwargs:
-            message.attach(kwargs['attachment'])
-
-        # ..Send email
-        Klass.smtp_connection.sendmail(sender, receiver, message.as_string())
-        Klass.smtp_connection.close()
+            attachments = kwargs['attachment']
+            if not isinstance(attachments, list):
+                attachments = [attachments]
+            for attachment in attachments:
+                message.attach(attachment)
+        return message
 
 class SendEmailWithAttachment(SendEmail):
     """Send an email with an attachment using a server
@@ -89,47 +112,516 @@ class SendEmailWithAttachment(SendEmail):
 
         file_path: corresponds to the path of the object
         that you want to attach to the email
+
+        stream: encode the attachment while the email is being sent
+        instead of loading it in memory. Recommended for large files
     """
 
-    def __init__(self, sender, receiver, subject, file_path, **kwargs):
+    # The encoded attachments are shared by all the
+    # emails in order to encode a file only once
+    attachment_cache = AttachmentCache()
+
+    def __init__(self, sender, receiver, subject, file_path, stream=False, **kwargs):
         # Create the attachment...
-        attachment = self.create_attachment(file_path)
+        attachment = self.create_attachment(file_path, stream=stream)
         # ...and send it to the superclass kwargs by calling __init__
-        super().__init__(sender, receiver, subject, attachment=attachment)
+        super().__init__(sender, receiver, subject, attachment=attachment, **kwargs)
 
-    def create_attachment(self, path):
-        """Create an attachment using a local path
+    def create_attachment(self, path, stream=False):
+        """Create an attachment using a local path. The attachment
+        is encoded once and reused for the next emails unless
+        it is streamed
         """
-        content = open(path, 'rb')
-        # mime_type = guess_type(path)
-        attachment = MIMEBase('application', 'octet-stream')
-        attachment.set_payload(content.read())
-        content.close()
-        # Encode in Base64
-        encode_base64(attachment)
-        # Get the file's name
-        filename = os.path.basename(path)
-        attachment.add_header('Content-Disposition', 'attachment; filename=%s' % filename)
-        return attachment
-
-    def create_attachments(self, paths:list):
+        if stream:
+            return StreamingAttachment(path)
+        if self.attachment_cache is None:
+            return AttachmentCache.create_attachment(path)
+        return self.attachment_cache.get(path)
+
+    def create_attachments(self, paths:list, stream=False):
         """Creates attachments to append to the main
         email body
         """
         attachments = []
 
         for path in paths:
-            attachments.append(self.create_attachment(path))
+            attachments.append(self.create_attachment(path, stream=stream))
 
         return attachments
 
-def send_email(sender, receiver, subject, **kwargs):
-    """This is wrapper function that allows you to send an email
-    asynchronously using the SendEmail class
+class Envelope:
+    """An email that is ready to be sent: the sender, the
+    recipients and the serialized message
+    """
+    def __init__(self, sender, recipients, message):
+        self.sender = sender
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        self.recipients = list(recipients)
+        self.message = message
+
+    def __repr__(self):
+        return '%s(%s -> %s)' % (self.__class__.__name__, self.sender,
+                    ', '.join(self.recipients))
+
+    @classmethod
+    def from_message(cls, message):
+        """Create an envelope from a MIME object
+        """
+        return cls(message['From'], message['To'], message.as_string())
+
+class SendResult:
+    """The result of sending an envelope
+
+    Description
+    -----------
+
+    The status is one of `accepted`, `refused`, `deferred` (a
+    temporary failure that should be retried later) or `failed`
+    when the envelope cannot be sent at all e.g. a message that
+    cannot be encoded. `refused`
+    contains the recipients that were refused by the server
+    even when the email was accepted for the other ones
+    """
+    ACCEPTED = 'accepted'
+    REFUSED = 'refused'
+    DEFERRED = 'deferred'
+    FAILED = 'failed'
+
+    def __init__(self, envelope, status, refused=None, error=None, elapsed=0):
+        self.envelope = envelope
+        self.status = status
+        self.refused = refused or {}
+        self.error = error
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return '%s(%s, %s, %.3fs)' % (self.__class__.__name__, self.envelope,
+                    self.status, self.elapsed)
+
+    @classmethod
+    def from_exception(cls, envelope, error, elapsed=0):
+        if isinstance(error, smtplib.SMTPNotSupportedError):
+            # The server does not support the
+            # extension needed by the message
+            return cls(envelope, cls.FAILED, error=error, elapsed=elapsed)
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            return cls(envelope, cls.REFUSED, refused=error.recipients,
+                        error=error, elapsed=elapsed)
+        if isinstance(error, smtplib.SMTPResponseException):
+            # 4xx codes are temporary failures
+            status = cls.DEFERRED if 400 <= error.smtp_code < 500 else cls.REFUSED
+            return cls(envelope, status, error=error, elapsed=elapsed)
+        if isinstance(error, (smtplib.SMTPException, OSError)):
+            return cls(envelope, cls.DEFERRED, error=error, elapsed=elapsed)
+        # Sending the envelope again would fail the same way
+        return cls(envelope, cls.FAILED, error=error, elapsed=elapsed)
+
+def get_mail_options(smtp_connection, message):
+    """Return the options of the MAIL command needed to send a message.
+    A message that is not ascii is declared with BODY=8BITMIME which
+    raises SMTPNotSupportedError if the server does not support it
+    """
+    if isinstance(message, bytes) and not message.isascii():
+        if not smtp_connection.has_extn('8bitmime'):
+            raise smtplib.SMTPNotSupportedError('The server does not support 8bit messages')
+        return ['BODY=8BITMIME']
+    return []
+
+def deliver(server, envelope):
+    """Send an envelope using a connected server and return its result.
+    Raises SMTPServerDisconnected if the server closed the connection
+    """
+    start = time.perf_counter()
+    try:
+        mail_options = get_mail_options(server.smtp_connection, envelope.message)
+        refused = server.smtp_connection.sendmail(envelope.sender, envelope.recipients,
+                            envelope.message, mail_options=mail_options)
+    except smtplib.SMTPServerDisconnected:
+        raise
+    except (smtplib.SMTPException, OSError) as error:
+        return SendResult.from_exception(envelope, error,
+                    elapsed=time.perf_counter() - start)
+    return SendResult(envelope, SendResult.ACCEPTED, refused=refused,
+                elapsed=time.perf_counter() - start)
+
+def prepare_data(message):
+    """Convert a message to the bytes sent after the DATA command:
+    CRLF line endings, lines starting with a period are escaped
+    and the message ends with a line containing a single period
+    """
+    if isinstance(message, str):
+        message = message.encode('ascii')
+    message = re.sub(br'(?:\r\n|\n|\r(?!\n))', CRLF, message)
+    message = re.sub(br'(?m)^\.', b'..', message)
+    if not message.endswith(CRLF):
+        message = message + CRLF
+    return message + b'.' + CRLF
+
+def send_stream(smtp_connection, sender, recipients, chunks):
+    """Send a message whose data is written to the connection chunk
+    by chunk. The chunks should already be escaped and end with the
+    final period (see iter_message_data). Like `sendmail`, returns
+    the recipients that were refused
     """
-    async def sender_class():
-        return SendEmail(sender, receiver, subject, **kwargs)
+    if isinstance(recipients, str):
+        recipients = [recipients]
+    code, response = smtp_connection.mail(sender)
+    if code != 250:
+        smtp_connection.rset()
+        raise smtplib.SMTPSenderRefused(code, response, sender)
 
-    task1 = asyncio.create_task(sender_class())
+    refused = {}
+    for recipient in recipients:
+        code, response = smtp_connection.rcpt(recipient)
+        if code not in (250, 251):
+            refused[recipient] = (code, response)
+    if len(refused) == len(recipients):
+        smtp_connection.rset()
+        raise smtplib.SMTPRecipientsRefused(refused)
 
-    return await task1.result()
+    smtp_connection.putcmd('data')
+    code, response = smtp_connection.getreply()
+    if code != 354:
+        smtp_connection.rset()
+        raise smtplib.SMTPDataError(code, response)
+    for chunk in chunks:
+        smtp_connection.send(chunk)
+    code, response = smtp_connection.getreply()
+    if code != 250:
+        smtp_connection.rset()
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+class BatchSender:
+    """Deliver many envelopes over a single SMTP session
+
+    Description
+    -----------
+
+    The envelopes that have the same sender and message are grouped in a
+    single transaction with up to `rcpt_limit` recipients. When the server
+    supports PIPELINING, the MAIL FROM, RCPT TO and DATA commands of a
+    transaction are sent at once instead of waiting for the reply to each
+    one of them:
+
+        server = Gmail(user='user', password='password')
+        results = BatchSender(server).send(envelopes)
+
+    One SendResult is returned for each envelope and the recipients
+    that were refused by the server are reported individually. The
+    envelopes with addresses that are not ASCII have failed unless
+    the server supports SMTPUTF8
+    """
+    def __init__(self, server, rcpt_limit=100):
+        self.server = server
+        self.rcpt_limit = rcpt_limit
+
+    @property
+    def pipelining(self):
+        return bool(self.server.smtp_connection.has_extn('pipelining'))
+
+    @property
+    def smtputf8(self):
+        return bool(self.server.smtp_connection.has_extn('smtputf8'))
+
+    @staticmethod
+    def is_ascii(addresses):
+        return all(address.isascii() for address in addresses)
+
+    def transaction(self, sender, recipients, message, data=None, mail_options=()):
+        """Send a message to multiple recipients and return
+        the reply of the server for each one of them. `data`
+        is the message already converted by `prepare_data`
+        """
+        smtp = self.server.smtp_connection
+        options = list(mail_options)
+        # The addresses that are not ASCII
+        # require the SMTPUTF8 extension
+        if not self.is_ascii([sender] + recipients):
+            options.append('SMTPUTF8')
+        if self.pipelining:
+            commands = [' '.join(['mail FROM:%s' % smtplib.quoteaddr(sender)] + options)]
+            commands.extend('rcpt TO:%s' % smtplib.quoteaddr(recipient)
+                                for recipient in recipients)
+            commands.append('data')
+            text = ''.join(command + '\r\n' for command in commands)
+            smtp.send(text.encode('ascii' if self.is_ascii([text]) else 'utf-8'))
+            mail_reply = smtp.getreply()
+            rcpt_replies = [smtp.getreply() for _ in recipients]
+            data_reply = smtp.getreply()
+        else:
+            mail_reply = smtp.mail(sender, options)
+            rcpt_replies = []
+            if mail_reply[0] == 250:
+                rcpt_replies = [smtp.rcpt(recipient) for recipient in recipients]
+            data_reply = None
+            if any(reply[0] in (250, 251) for reply in rcpt_replies):
+                smtp.putcmd('data')
+                data_reply = smtp.getreply()
+
+        if mail_reply[0] != 250:
+            if data_reply and data_reply[0] == 354:
+                smtp.send(b'.' + CRLF)
+                smtp.getreply()
+            smtp.rset()
+            return {recipient: mail_reply for recipient in recipients}
+
+        replies = dict(zip(recipients, rcpt_replies))
+        accepted = [recipient for recipient, reply in replies.items() if reply[0] in (250, 251)]
+        if data_reply is None or data_reply[0] != 354:
+            smtp.rset()
+            failure = data_reply or (554, b'No valid recipients')
+            replies.update({recipient: failure for recipient in accepted})
+            return replies
+
+        # An empty message is sent if the server started the
+        # DATA command when none of the recipients were valid
+        if accepted:
+            smtp.send(data if data is not None else prepare_data(message))
+        else:
+            smtp.send(b'.' + CRLF)
+        final_reply = smtp.getreply()
+        replies.update({recipient: final_reply for recipient in accepted})
+        return replies
+
+    def send(self, envelopes):
+        """Send the envelopes and return their results
+        in the same order
+
+        When the session fails, the results of the transactions that
+        were completed are kept and the envelopes that were not sent
+        are deferred. An envelope whose message cannot be converted
+        or that has no recipients has failed
+        """
+        envelopes = list(envelopes)
+        smtputf8 = self.smtputf8
+        results = {}
+        groups = OrderedDict()
+        for envelope in envelopes:
+            if not smtputf8 and not self.is_ascii([envelope.sender] + envelope.recipients):
+                error = smtplib.SMTPNotSupportedError('The server does not support'
+                            ' addresses that are not ASCII')
+                results[id(envelope)] = SendResult(envelope, SendResult.FAILED, error=error)
+                continue
+            groups.setdefault((envelope.sender, envelope.message), []).append(envelope)
+
+        error = None
+        for (sender, message), group in groups.items():
+            recipients = list(OrderedDict.fromkeys(recipient for envelope in group
+                                for recipient in envelope.recipients))
+            replies = {}
+            start = time.perf_counter()
+            if error is None and recipients:
+                try:
+                    data = prepare_data(message)
+                    mail_options = get_mail_options(self.server.smtp_connection, message)
+                except Exception as exception:
+                    for envelope in group:
+                        results[id(envelope)] = SendResult.from_exception(envelope, exception)
+                    continue
+
+                for index in range(0, len(recipients), self.rcpt_limit):
+                    chunk = recipients[index:index + self.rcpt_limit]
+                    try:
+                        replies.update(self.transaction(sender, chunk, message, data=data,
+                                            mail_options=mail_options))
+                    except (smtplib.SMTPException, OSError) as exception:
+                        # The session cannot be used anymore
+                        error = exception
+                        break
+            elapsed = time.perf_counter() - start
+
+            for envelope in group:
+                results[id(envelope)] = self.get_result(envelope, replies, elapsed, error=error)
+        return [results[id(envelope)] for envelope in envelopes]
+
+    @staticmethod
+    def get_result(envelope, replies, elapsed, error=None):
+        if not envelope.recipients:
+            return SendResult(envelope, SendResult.FAILED, elapsed=elapsed,
+                        error=ValueError('The envelope has no recipients'))
+
+        # The recipients without a reply were not sent
+        # because the session failed before
+        missing = [recipient for recipient in envelope.recipients if recipient not in replies]
+        if len(missing) == len(envelope.recipients):
+            return SendResult(envelope, SendResult.DEFERRED, error=error, elapsed=elapsed)
+        replies = dict(replies)
+        replies.update((recipient, (451, str(error).encode('utf-8'))) for recipient in missing)
+
+        refused = {recipient: replies[recipient] for recipient in envelope.recipients
+                        if replies[recipient][0] >= 300}
+        if len(refused) < len(envelope.recipients):
+            status = SendResult.ACCEPTED
+        elif all(400 <= code < 500 for code, _ in refused.values()):
+            status = SendResult.DEFERRED
+        else:
+            status = SendResult.REFUSED
+        return SendResult(envelope, status, refused=refused, elapsed=elapsed)
+
+class AsyncSender:
+    """Send a large number of envelopes over multiple
+    SMTP sessions at the same time
+
+    Description
+    -----------
+
+    Each of the `concurrency` sessions sends the envelopes one after the
+    other. The envelopes are read from the iterable (or async iterable)
+    only when a session is ready to send them which prevents
+    loading all of them in memory:
+
+        sender = AsyncSender('smtp.gmail.com', 587, user='user', password='password')
+        async for result in sender.results(envelopes):
+            print(result.status)
+
+    Parameters
+    ----------
+
+        concurrency: the number of sessions used at the same time
+
+        pool: the ServerPool used to get the sessions, one is
+              created if it is not provided
+
+        queue_size: the number of envelopes and results waiting
+                    to be sent or read
+    """
+    def __init__(self, host, port, user=None, password=None, concurrency=10,
+                    pool=None, queue_size=None):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.concurrency = concurrency
+        self.pool = pool if pool is not None else ServerPool(max_size=concurrency)
+        self.queue_size = queue_size or concurrency * 2
+
+    def acquire(self):
+        return self.pool.acquire(self.host, self.port, user=self.user,
+                    password=self.password)
+
+    def send_one(self, server, envelope):
+        """Send an envelope using the session of a worker and return
+        the session to use for the next envelope. The envelope is sent
+        again on a new session if the server closed the connection
+        """
+        try:
+            if server is None:
+                server = self.acquire()
+            try:
+                return server, deliver(server, envelope)
+            except smtplib.SMTPServerDisconnected:
+                self.pool.release(server, discard=True)
+                server = None
+            server = self.acquire()
+            return server, deliver(server, envelope)
+        except BaseException as error:
+            # The session is given back to the pool whatever
+            # happened, otherwise the pool stays full and
+            # the other workers wait for it forever
+            if server is not None:
+                self.pool.release(server, discard=True)
+            if not isinstance(error, Exception):
+                raise
+            return None, SendResult.from_exception(envelope, error)
+
+    async def results(self, envelopes):
+        """Send the envelopes and yield their results
+        as soon as they are sent
+        """
+        # asyncio is only imported when it is used since
+        # it makes importing this module much slower
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        pending = asyncio.Queue(maxsize=self.queue_size)
+        results = asyncio.Queue(maxsize=self.queue_size)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+
+        async def stop_workers():
+            for _ in range(self.concurrency):
+                await pending.put(None)
+
+        async def produce():
+            try:
+                if hasattr(envelopes, '__aiter__'):
+                    async for envelope in envelopes:
+                        await pending.put(envelope)
+                else:
+                    for envelope in envelopes:
+                        await pending.put(envelope)
+            except asyncio.CancelledError:
+                # The workers are cancelled as well and
+                # nobody reads the queue anymore
+                raise
+            except BaseException:
+                await stop_workers()
+                raise
+            await stop_workers()
+
+        def release(future):
+            if not future.cancelled() and future.exception() is None:
+                server, _ = future.result()
+                if server is not None:
+                    self.pool.release(server)
+
+        async def work():
+            server = None
+            try:
+                while True:
+                    envelope = await pending.get()
+                    if envelope is None:
+                        break
+                    session, server = server, None
+                    future = executor.submit(self.send_one, session, envelope)
+                    try:
+                        server, result = await asyncio.wrap_future(future)
+                    except asyncio.CancelledError:
+                        # The session is given back to the pool once
+                        # the envelope that is being sent was sent
+                        if future.cancel():
+                            if session is not None:
+                                self.pool.release(session)
+                        else:
+                            future.add_done_callback(release)
+                        raise
+                    except Exception as error:
+                        result = SendResult.from_exception(envelope, error)
+                    await results.put(result)
+                await results.put(None)
+            finally:
+                if server is not None:
+                    self.pool.release(server)
+
+        tasks = [asyncio.create_task(produce())]
+        tasks.extend(asyncio.create_task(work()) for _ in range(self.concurrency))
+        try:
+            finished = 0
+            while finished < self.concurrency:
+                result = await results.get()
+                if result is None:
+                    finished += 1
+                else:
+                    yield result
+            # Raise the errors of the iterable, if any
+            await tasks[0]
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Wait for the envelopes that are being sent so
+            # that their sessions are back in the pool
+            await asyncio.to_thread(executor.shutdown)
+
+    async def send(self, envelopes):
+        """Send the envelopes and return the list of their results
+        """
+        return [result async for result in self.results(envelopes)]
+
+async def send_email(sender, receiver, subject, **kwargs):
+    """This is wrapper function that allows you to send an email
+    asynchronously using the SendEmail class
+    """
+    import asyncio
+    return await asyncio.to_thread(SendEmail, sender, receiver, subject, **kwargs)
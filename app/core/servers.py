@@ -7,7 +7,7 @@ import os
 import smtplib
 from smtplib import SMTP
 
-from errors import CredentialsError
+from ze_mailer.app.core.errors import CredentialsError
 from ze_mailer.app.core.settings import configuration
 
 
@@ -21,11 +21,20 @@ class BaseServer:
     This class should not be used directly but subclassed
     in order to create a connection to a given SMTP server.
     """
+    # The class used to create the connection
+    # and whether the connection should be put
+    # in TLS mode after identifying ourselves
+    smtp_class = SMTP
+    use_tls = True
+
     def __init__(self, host=None, port=None, user=None, password=None):
+        self.host = host
+        self.port = port
+        self.user = user
         try:
             # Create an SMTP object from host and port
             # :: <smtplib.SMTP> object
-            smtp_connection = SMTP(host=host, port=port)
+            smtp_connection = self.smtp_class(host=host, port=port)
         except smtplib.SMTPConnectError:
             raise
         else:
@@ -34,12 +43,13 @@ class BaseServer:
             # the server - normaly this is called
             # when .sendemail() is called
             smtp_connection.ehlo()
-            # Put connection in TLS mode
-            # (Transport Layer Security)
-            smtp_connection.starttls()
-            # It is advised by the documentation to
-            # call EHLO after TLS [once again]
-            smtp_connection.ehlo()
+            if self.use_tls:
+                # Put connection in TLS mode
+                # (Transport Layer Security)
+                smtp_connection.starttls()
+                # It is advised by the documentation to
+                # call EHLO after TLS [once again]
+                smtp_connection.ehlo()
 
             try:
                 # Check that the creadentials are set and that
@@ -64,6 +74,26 @@ class BaseServer:
                 # return smtp_connection
                 self.smtp_connection = smtp_connection
 
+    def is_connected(self):
+        """Check that the server did not close the
+        connection by sending a NOOP command
+        """
+        try:
+            code, _ = self.smtp_connection.noop()
+        except (smtplib.SMTPException, OSError):
+            return False
+        return code == 250
+
+    def close(self):
+        """Close the connection to the server
+        """
+        try:
+            self.smtp_connection.quit()
+        except (smtplib.SMTPException, OSError):
+            # The server already closed
+            # the connection on its side
+            self.smtp_connection.close()
+
     @staticmethod
     def init_credentials(user, password):
         if not user and not password:
@@ -96,3 +126,12 @@ class Outlook(BaseServer):
     """
     def __init__(self, user=None, password=None):
         super().__init__('smtp.gmail.com', 587, user=user, password=password)
+
+class LocalServer(BaseServer):
+    """A server running on the local machine without TLS
+    such as the SMTP sink used by the benchmarks
+    """
+    use_tls = False
+
+    def __init__(self, host='localhost', port=1025, user=None, password=None):
+        super().__init__(host, port, user=user, password=password)
@@ -4,36 +4,79 @@ the base configurations for the application
 author: pendenquejohn@gmail.com
 """
 
-import json
 import os
 from collections import OrderedDict
-from configparser import ConfigParser
 
-from ze_mailer.app.core.fileopener import FilesObject
+# The settings can be overriden by environment
+# variables such as ZEMAILER_OUTPUT_DIR. Importing this
+# module should stay cheap: the modules that are only
+# needed by some of the settings are imported when used
+ENVIRONMENT_PREFIX = 'ZEMAILER_'
+
+
+def output_dir(config):
+    """The Documents folder of the user, on Windows
+    HOMEDRIVE and HOMEPATH are used when they are set
+    """
+    drive = os.environ.get('HOMEDRIVE')
+    path = os.environ.get('HOMEPATH')
+    if drive and path:
+        home = os.path.join(drive, path)
+    else:
+        home = os.path.expanduser('~')
+    return os.path.join(home, 'Documents')
+
+def cache_dir(config):
+    home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(home, 'ze_mailer')
+
+def server_config(config):
+    return {
+        'default': {
+            'name': 'google',
+            'host': 'smtp.gmail.com',
+            'port': 587,
+            'user': config['user'],
+            'password': config['password']
+        },
+        'outlook': {
+            'name': 'outlook',
+            'host': 'smtp.gmail.com',
+            'port': 587,
+            'user': config['user'],
+            'password': config['password']
+        }
+    }
 
 
 class Configuration:
-    """This is the base class to configure the application. 
+    """This is the base class to configure the application.
     This returns a dictionary object that you can use order to update
-    """
 
-    def __init__(self):
-        settings = OrderedDict()
+    Description
+    -----------
 
-        # Root path
-        settings['base_dir'] = os.getcwd()
+    Each setting is computed by a resolver the first time it is used
+    which makes importing the application cheap. The values are taken,
+    in this order, from the values that were set on the instance, from
+    the environment variables prefixed with ZEMAILER_, from the JSON file
+    passed when calling the instance and finally from the resolvers:
 
+        configuration['output_dir'] = 'path/to/folder'
+        configuration.register('custom', lambda config: config['base_dir'])
+    """
+    resolvers = OrderedDict([
+        # Root path
+        ('base_dir', lambda config: os.getcwd()),
         # Data directory path within the application
-        settings['data_dir'] = os.path.join(settings['base_dir'], 'app', 'data')
-
+        ('data_dir', lambda config: os.path.join(config['base_dir'], 'app', 'data')),
         # Settings for the SMTP server
-        settings['user'] = None
-        settings['password'] = None
-        
+        ('user', lambda config: None),
+        ('password', lambda config: None),
         # These are the base regex patterns
         # used in order parse the pattern
         # sent by the user to construct an email
-        settings['base_regex_patterns'] = {
+        ('base_regex_patterns', lambda config: {
             'with_separator': [
                 # nom.prenom <-> prenom.nom
                 # nom_prenom <-> prenom_nom
@@ -52,50 +95,89 @@ class Configuration:
                 # nom or prenom
                 r'^((?:pre)?nom)$',
             ]
-        }
-
+        }),
         # The main directory in which to output
         # files that were created
-        settings['output_dir'] = os.path.join(os.environ['HOMEDRIVE'], os.path.join('HOMEPATH'), 'Documents')
-
+        ('output_dir', output_dir),
         # Extension to use by default
         # when creating a file
-        settings['output_extension'] = 'csv'
-
+        ('output_extension', lambda config: 'csv'),
         # Configuration for the servers
-        settings['server_config'] = {
-            'default': {
-                'name': 'google',
-                'host': 'smtp.gmail.com',
-                'port': 587,
-                'user': settings['user'],
-                'password': settings['password']
+        ('server_config', server_config),
+        # Sending limits of the providers used by the
+        # scheduler: each limit is a number of emails
+        # for a period in seconds. The limits are applied
+        # to the whole server, to each account of the
+        # server and to each domain receiving emails
+        ('sending_limits', lambda config: {
+            'google': {
+                'server': [],
+                'account': [(500, 86400), (20, 60)]
             },
             'outlook': {
-                'name': 'outlook',
-                'host': 'smtp.gmail.com',
-                'port': 587,
-                'user': settings['user'],
-                'password': settings['password']
-            }
-        }
-
+                'server': [],
+                'account': [(300, 86400), (30, 60)]
+            },
+            'domain': [(60, 60)]
+        }),
+        # The SQLite file used to store the
+        # emails waiting to be sent
+        ('queue_file', lambda config: os.path.join(config['base_dir'], 'local.sqlite')),
+        # Where the files created by the names algorithms
+        # are cached and the maximum size of the cache
+        ('cache_dir', cache_dir),
+        ('cache_max_size', lambda config: 1024 * 1024 * 1024),
         # This is a test parameter variable
         # created to test the features of the application
-        settings['dummy_file'] = os.path.join(settings['data_dir'], 'dummy.csv')
+        ('dummy_file', lambda config: os.path.join(config['data_dir'], 'dummy.csv'))
+    ])
 
-        self.settings = settings
+    def __init__(self):
+        self.resolvers = OrderedDict(self.resolvers)
+        # Values set on the instance
+        self.values = {}
+        # Values computed by the resolvers
+        self.resolved = {}
+        # Values of the JSON file
+        self.overrides = {}
+        # path -> (mtime, size) of the JSON files
+        self.json_files = {}
+        self._data_files = None
 
     def __setitem__(self, key, value):
-        return self.settings.update({key: value})
+        self.values[key] = value
+        # The settings computed from the
+        # previous value are outdated
+        self.reset()
 
     def __getitem__(self, key):
+        if key in self.values:
+            return self.values[key]
+
+        environment = os.environ.get(ENVIRONMENT_PREFIX + key.upper())
+        if environment is not None:
+            # Dictionnaries and lists are written in JSON,
+            # the other values are kept as strings
+            if environment.lstrip()[:1] in ('{', '['):
+                import json
+                return json.loads(environment)
+            return environment
+
+        if key in self.overrides:
+            return self.overrides[key]
+
         try:
-            value = self.settings[key]
+            return self.resolved[key]
         except KeyError:
-            value = None
-        return value
-    
+            resolver = self.resolvers.get(key)
+            if resolver is None:
+                return None
+            value = self.resolved[key] = resolver(self)
+            return value
+
+    def __contains__(self, key):
+        return key in self.values or key in self.overrides or key in self.resolvers
+
     def __str__(self):
         return str(self.settings)
 
@@ -107,19 +189,49 @@ class Configuration:
 
     def __call__(self, json_file, **kwargs):
         """You can pass additional configuration elements to the
-        settings dictionnary by providing a JSON file
+        settings dictionnary by providing a JSON file. The file
+        is only read again if it was modified
         """
         if json_file:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                additional_settings = json.load(f)
-                self.settings.update(**additional_settings)
+            path = os.path.abspath(json_file)
+            stat = os.stat(path)
+            key = (stat.st_mtime_ns, stat.st_size)
+            if self.json_files.get(path) != key:
+                import json
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.overrides.update(json.load(f))
+                self.json_files[path] = key
+                self.reset()
 
         return self.settings
 
+    @property
+    def settings(self):
+        """All the settings as a dictionnary
+        """
+        keys = list(self.resolvers)
+        keys.extend(key for key in self.overrides if key not in self.resolvers)
+        keys.extend(key for key in self.values if key not in keys)
+        return OrderedDict((key, self[key]) for key in keys)
+
+    def register(self, key, resolver):
+        """Add a setting computed by `resolver(configuration)`
+        the first time it is used
+        """
+        self.resolvers[key] = resolver
+        self.resolved.pop(key, None)
+
+    def reset(self):
+        """Compute the settings again the next time they are used
+        """
+        self.resolved.clear()
+
     def data_dir_files(self):
         """Get the files in the data directory
         """
-        filesobject = FilesObject()
-        return filesobject.scan_directory(self.settings['data_dir'])
+        if self._data_files is None:
+            from ze_mailer.app.core.fileopener import FilesObject
+            self._data_files = FilesObject()
+        return self._data_files.scan_directory(self['data_dir'])
 
 configuration = Configuration()
@@ -0,0 +1,257 @@
+"""A compact in-memory table of names where each column is stored
+in a single buffer instead of one Python string for each value
+
+author: pendenquejohn@gmail.com
+"""
+from array import array
+
+
+class StringColumn:
+    """A column of strings stored as their UTF-8 bytes one after
+    the other with the offset at which each value ends
+
+    Description
+    -----------
+
+    The values are decoded when they are requested. A value only
+    uses its bytes and an offset of 8 bytes instead of a full
+    Python string:
+
+        column = StringColumn(['eugenie bouchard', 'serena williams'])
+        column.data
+        >> bytearray(b'eugenie bouchardserena williams')
+        column.offsets
+        >> array('Q', [0, 16, 31])
+
+    Slicing a column returns a view that shares the buffers of the
+    column. A view is copied the first time a value is appended to it
+    """
+    def __init__(self, values=None):
+        self.data = bytearray()
+        self.offsets = array('Q', [0])
+        self.start = 0
+        self.stop = 0
+        # Whether the buffers belong to another column
+        self.shared = False
+        if values is not None:
+            self.extend(values)
+
+    @classmethod
+    def view(cls, column, start, stop):
+        instance = cls.__new__(cls)
+        instance.data = column.data
+        instance.offsets = column.offsets
+        instance.start = start
+        instance.stop = stop
+        instance.shared = True
+        return instance
+
+    def __repr__(self):
+        return '%s(%s values)' % (self.__class__.__name__, len(self))
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self.view(self, self.start + start, self.start + max(start, stop))
+        if index < 0:
+            index = index + len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('%s index out of range' % self.__class__.__name__)
+        index = index + self.start
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode('utf-8')
+
+    def __iter__(self):
+        data = self.data
+        offsets = self.offsets
+        start = offsets[self.start]
+        for index in range(self.start + 1, self.stop + 1):
+            stop = offsets[index]
+            yield data[start:stop].decode('utf-8')
+            start = stop
+
+    def __eq__(self, other):
+        if isinstance(other, (StringColumn, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __getstate__(self):
+        # Only the values of a view are sent
+        # to the other processes
+        column = self.copy() if self.is_view else self
+        return column.data, column.offsets
+
+    def __setstate__(self, state):
+        self.data, self.offsets = state
+        self.start = 0
+        self.stop = len(self.offsets) - 1
+        self.shared = False
+
+    @property
+    def is_view(self):
+        return self.start != 0 or self.stop != len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the values of the column
+        """
+        return (self.offsets[self.stop] - self.offsets[self.start]
+                    + (len(self) + 1) * self.offsets.itemsize)
+
+    def copy(self):
+        return StringColumn(self)
+
+    def append(self, value):
+        if self.shared:
+            self.data, self.offsets = self.copy().__getstate__()
+            self.start, self.stop = 0, len(self.offsets) - 1
+            self.shared = False
+        self.data += value.encode('utf-8')
+        self.offsets.append(len(self.data))
+        self.stop += 1
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+    def map(self, function):
+        """Return a new column with the function
+        applied to each value
+        """
+        return StringColumn(function(value) for value in self)
+
+
+class NameTable:
+    """A table of names that can be used instead of the list of rows
+    read by `FileOpener` and that uses several times less memory
+
+    Description
+    -----------
+
+    Each column of the csv file is a `StringColumn`. The table behaves
+    like a list of rows: iterating over the table or getting a row
+    returns a new list of strings which means that changing that list
+    does not change the table:
+
+        table = NameTable(['name'], [['eugenie bouchard']])
+        table[0]
+        >> ['eugenie bouchard']
+        table[:10]
+        >> NameTable(1 rows, ['name'])
+
+    A slice is a table sharing the buffers of this table. Adding a
+    column does not copy the other columns, which is used to add the
+    emails to the names:
+
+        table.add_column('email', ['eugenie.bouchard@gmail.com'])
+
+    Parameters
+    ----------
+
+        headers: the names of the columns
+
+        rows: the rows to add to the table. Missing values
+              are added as empty strings
+    """
+    def __init__(self, headers, rows=None):
+        self.headers = list(headers)
+        self.columns = [StringColumn() for _ in self.headers]
+        if rows is not None:
+            self.extend(rows)
+
+    @classmethod
+    def from_columns(cls, headers, columns):
+        instance = cls.__new__(cls)
+        instance.headers = list(headers)
+        instance.columns = list(columns)
+        return instance
+
+    def __repr__(self):
+        return '%s(%s rows, %s)' % (self.__class__.__name__, len(self), self.headers)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self.from_columns(self.headers, [column[index] for column in self.columns])
+        return [column[index] for column in self.columns]
+
+    def __iter__(self):
+        for values in zip(*self.columns):
+            yield list(values)
+
+    def __eq__(self, other):
+        if isinstance(other, NameTable):
+            return self.headers == other.headers and self.columns == other.columns
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the values of the table
+        """
+        return sum(column.nbytes for column in self.columns)
+
+    def get_index(self, key):
+        """Return the position of a column from
+        its name or its position
+        """
+        if isinstance(key, int):
+            return key
+        return self.headers.index(key)
+
+    def column(self, key):
+        return self.columns[self.get_index(key)]
+
+    def append(self, row):
+        if len(row) > len(self.columns):
+            # A row with more values than the headers
+            # adds columns without names
+            for _ in range(len(self.columns), len(row)):
+                self.add_column('', [''] * len(self))
+        for index, column in enumerate(self.columns):
+            column.append(row[index] if index < len(row) else '')
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def add_column(self, header, values):
+        """Add a column at the end of the table. The
+        other columns are neither copied nor modified
+        """
+        if not isinstance(values, StringColumn):
+            values = StringColumn(values)
+        if self.columns and len(values) != len(self):
+            raise ValueError('The column should contain %s values, got %s'
+                                % (len(self), len(values)))
+        self.headers.append(header)
+        self.columns.append(values)
+        return self
+
+    def with_column(self, header, values):
+        """Return a new table sharing the columns of
+        this table with an additional column
+        """
+        # The columns are shared through views so that the
+        # rows appended to one table are not added to the other
+        columns = [column[:] for column in self.columns]
+        table = self.from_columns(self.headers, columns)
+        return table.add_column(header, values)
+
+    def map_column(self, key, function):
+        """Replace the values of a column by the
+        result of the function for each value
+        """
+        index = self.get_index(key)
+        self.columns[index] = self.columns[index].map(function)
+        return self
@@ -0,0 +1,196 @@
+"""Message templates used to send the same email to a large
+number of recipients without serializing it for each one of them
+
+author: pendenquejohn@gmail.com
+"""
+import quopri
+import re
+import uuid
+from email.charset import Charset
+from email.header import Header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from ze_mailer.app.core.errors import InvalidValueError
+from ze_mailer.app.core.senders import CRLF, Envelope
+
+# Merge fields are written {{field}} in the
+# subject, the text and the html of the email
+MERGE_FIELD = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+# The maximum length of a line in an email
+# without the CRLF (RFC 5322)
+MAX_LINE_LENGTH = 998
+
+
+def check_value(value):
+    """Reject the values that contain line breaks
+    which could be used to add headers to the email
+    """
+    value = str(value)
+    if '\r' in value or '\n' in value:
+        raise InvalidValueError('Line breaks are not allowed in %r' % value, value)
+    return value
+
+def encode_header(name, value):
+    """Return the bytes of a header line, encoding
+    the value if it is not ascii
+    """
+    value = check_value(value)
+    if not value.isascii():
+        value = Header(value, 'utf-8', header_name=name).encode(linesep='\r\n')
+    return ('%s: %s' % (name, value)).encode('ascii') + CRLF
+
+def encode_body(text, eight_bit=False):
+    """Return the Content-Transfer-Encoding and the bytes of a text
+    part. Quoted-printable is used when the text is not ascii and
+    the server does not accept 8bit data or when a line is too long
+    """
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    data = '\n'.join(lines).encode('utf-8')
+    short = all(len(line.encode('utf-8')) <= MAX_LINE_LENGTH for line in lines)
+    if short and data.isascii():
+        return '7bit', data.replace(b'\n', CRLF)
+    if short and eight_bit:
+        return '8bit', data.replace(b'\n', CRLF)
+    return 'quoted-printable', quopri.encodestring(data).replace(b'\n', CRLF)
+
+
+class MessageTemplate:
+    """An email whose body and attachments are serialized
+    once and reused for every recipient
+
+    Description
+    -----------
+
+    Only the `To` header and the text parts change from one recipient
+    to another. The text and the html can contain merge fields such
+    as `{{first_name}}` which are replaced by the values given for
+    each recipient:
+
+        template = MessageTemplate('from@gmail.com', 'Welcome', 'Hello {{first_name}}')
+        template.render('to@gmail.com', first_name='Eugenie')
+
+    The text parts that are not ascii are encoded in quoted-printable,
+    or in 8bit UTF-8 when the server supports the 8BITMIME extension.
+    The messages are then sent with BODY=8BITMIME. The text parts
+    without merge fields are only encoded once. The attachments are
+    never modified. Values used in the html part are not escaped and
+    values containing line breaks are rejected.
+
+    Parameters
+    ----------
+
+        sender: the email sending the message
+
+        subject: of the message, can contain merge fields
+
+        text: the plain text version of the message
+
+        html: the html version of the message
+
+        attachments: a list of MIME parts to attach to the message
+
+        eight_bit: whether the server supports 8BITMIME e.g.
+                   `server.smtp_connection.has_extn('8bitmime')`
+    """
+    def __init__(self, sender, subject, text, html=None, attachments=None, eight_bit=False):
+        self.sender = sender
+        self.subject = subject
+        self.eight_bit = eight_bit
+
+        charset = Charset('utf-8')
+        charset.body_encoding = None
+
+        if attachments:
+            message = MIMEMultipart('mixed')
+            body = MIMEMultipart('alternative')
+            message.attach(body)
+        else:
+            message = body = MIMEMultipart('alternative')
+
+        # The text parts are serialized as markers which
+        # are replaced by the encoded text of each recipient
+        marker = 'ZEMAILER-%s-' % uuid.uuid4().hex
+        # [[text, field, text, field, ..., text], ...]
+        self.parts = []
+        # The encoded parts that do not change
+        # for each recipient, None otherwise
+        self.encoded = []
+        for content, subtype in ((text, 'plain'), (html, 'html')):
+            if content is not None:
+                part = MIMEText(marker + str(len(self.parts)), subtype, charset)
+                del part['Content-Transfer-Encoding']
+                body.attach(part)
+                segments = MERGE_FIELD.split(content)
+                self.parts.append(segments)
+                self.encoded.append(self.encode(content) if len(segments) == 1 else None)
+
+        for attachment in attachments or []:
+            message.attach(attachment)
+
+        message['From'] = sender
+        # The subject is only serialized with the other
+        # headers if it does not change for each recipient
+        self.subject_fields = MERGE_FIELD.search(subject) is not None
+        if not self.subject_fields:
+            message['Subject'] = Header(subject, 'utf-8') if not subject.isascii() else subject
+
+        serialized = message.as_bytes(policy=message.policy.clone(linesep='\r\n'))
+        headers, _, body = serialized.partition(CRLF + CRLF)
+        self.headers = headers + CRLF
+
+        # The headers of each text part end with an empty line
+        # which is removed in order to add the encoding
+        segments = re.split(re.escape(marker).encode('ascii') + br'\d+', body)
+        self.segments = [segment[:-2] for segment in segments[:-1]] + segments[-1:]
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, self.sender, self.subject)
+
+    def encode(self, text):
+        """Return the encoding header and the data of a text part
+        """
+        encoding, data = encode_body(text, eight_bit=self.eight_bit)
+        return ('Content-Transfer-Encoding: %s' % encoding).encode('ascii') + CRLF + CRLF + data
+
+    @staticmethod
+    def merge(segments, fields):
+        values = list(segments)
+        for index in range(1, len(values), 2):
+            values[index] = check_value(fields[values[index]])
+        return ''.join(values)
+
+    def render(self, receiver, **fields):
+        """Return the bytes of the message for a recipient
+        """
+        lines = [self.headers, encode_header('To', receiver)]
+        if self.subject_fields:
+            subject = MERGE_FIELD.sub(lambda match: str(fields[match.group(1)]), self.subject)
+            lines.append(encode_header('Subject', subject))
+        lines.append(CRLF)
+
+        lines.append(self.segments[0])
+        for segments, encoded, segment in zip(self.parts, self.encoded, self.segments[1:]):
+            if encoded is None:
+                encoded = self.encode(self.merge(segments, fields))
+            lines.append(encoded)
+            lines.append(segment)
+        return b''.join(lines)
+
+    def envelope(self, receiver, **fields):
+        """Return the envelope used to send the
+        message to a recipient
+        """
+        return Envelope(self.sender, receiver, self.render(receiver, **fields))
+
+    def envelopes(self, receivers):
+        """Create the envelopes for a list of recipients. Each item is
+        either an email or a tuple of an email and its merge fields
+        """
+        for receiver in receivers:
+            if isinstance(receiver, str):
+                yield self.envelope(receiver)
+            else:
+                receiver, fields = receiver
+                yield self.envelope(receiver, **fields)
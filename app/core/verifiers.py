@@ -0,0 +1,362 @@
+"""Verifies which of the emails created by the names algorithms
+can receive emails by asking the mail servers of their domains
+
+author: pendenquejohn@gmail.com
+"""
+import smtplib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# The number of seconds during which the mail servers
+# of a domain are kept when the DNS does not give a TTL
+# and when a domain does not exist
+DEFAULT_TTL = 3600
+
+NEGATIVE_TTL = 300
+
+
+def resolve_mx(domain):
+    """Return the (preference, host, ttl) of the mail servers
+    of a domain using dnspython when it is installed.
+    Returns an empty list if the domain does not exist
+    """
+    try:
+        import dns.resolver
+    except ImportError:
+        # Without dnspython, the domain is used as its own
+        # mail server which is the fallback of RFC 5321
+        return [(0, domain, DEFAULT_TTL)]
+
+    try:
+        answer = dns.resolver.resolve(domain, 'MX')
+    except dns.resolver.NXDOMAIN:
+        return []
+    except dns.resolver.NoAnswer:
+        return [(0, domain, DEFAULT_TTL)]
+    ttl = answer.rrset.ttl
+    return [(record.preference, str(record.exchange).rstrip('.'), ttl) for record in answer]
+
+
+class MXCache:
+    """Keeps the mail servers of the domains for
+    the duration given by the DNS
+
+    Parameters
+    ----------
+
+        resolver: a function returning the (preference, host, ttl)
+                  of the mail servers of a domain, `resolve_mx`
+                  by default
+
+        negative_ttl: the number of seconds during which a
+                      domain that does not exist is kept
+    """
+    def __init__(self, resolver=resolve_mx, negative_ttl=NEGATIVE_TTL, clock=time.monotonic):
+        self.resolver = resolver
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        # domain -> (hosts, expires_at)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, domain):
+        """Return the mail servers of a domain
+        ordered by preference
+        """
+        domain = domain.lower()
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(domain)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        records = sorted(self.resolver(domain))
+        hosts = [host for _, host, _ in records]
+        ttl = min(record[2] for record in records) if records else self.negative_ttl
+        with self.lock:
+            self.entries[domain] = (hosts, now + ttl)
+        return hosts
+
+
+class Verification:
+    """The result of the verification of an email
+
+    Description
+    -----------
+
+    The status is one of `valid`, `invalid`, `catch_all` when the
+    server of the domain accepts any address which means that the
+    email cannot be verified, or `unknown` when the server could not
+    be reached or refused the address temporarily
+    """
+    VALID = 'valid'
+    INVALID = 'invalid'
+    CATCH_ALL = 'catch_all'
+    UNKNOWN = 'unknown'
+
+    def __init__(self, email, status, code=None, message=None, host=None, error=None):
+        self.email = email
+        self.status = status
+        self.code = code
+        self.message = message
+        self.host = host
+        self.error = error
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, self.email, self.status)
+
+    @property
+    def deliverable(self):
+        return self.status in (self.VALID, self.CATCH_ALL)
+
+
+class HostSession:
+    """An SMTP session with a mail server used to check multiple
+    addresses. The session is used by one domain at a time and
+    waits `delay` seconds between two transactions
+    """
+    def __init__(self, host, port=25, smtp_class=smtplib.SMTP, helo='localhost',
+                    timeout=10, delay=0, clock=time.monotonic, sleep=time.sleep):
+        self.host = host
+        self.port = port
+        self.smtp_class = smtp_class
+        self.helo = helo
+        self.timeout = timeout
+        self.delay = delay
+        self.clock = clock
+        self.sleep = sleep
+        self.smtp_connection = None
+        self.used_at = None
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return '%s(%s:%s)' % (self.__class__.__name__, self.host, self.port)
+
+    def connect(self):
+        smtp_connection = self.smtp_class(self.host, self.port, timeout=self.timeout)
+        code, _ = smtp_connection.ehlo(self.helo)
+        if code != 250:
+            smtp_connection.helo(self.helo)
+        self.smtp_connection = smtp_connection
+
+    def throttle(self):
+        if self.delay and self.used_at is not None:
+            wait = self.used_at + self.delay - self.clock()
+            if wait > 0:
+                self.sleep(wait)
+        self.used_at = self.clock()
+
+    def probe(self, sender, recipients):
+        """Return the reply of the server to RCPT TO for each
+        recipient without sending any email
+        """
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.smtp_connection is None:
+                        self.connect()
+                    self.throttle()
+                    return self.transaction(sender, recipients)
+                except smtplib.SMTPServerDisconnected:
+                    # The server closed the session after
+                    # it was used: connect again once
+                    self.smtp_connection = None
+                    if attempt:
+                        raise
+
+    def transaction(self, sender, recipients):
+        smtp_connection = self.smtp_connection
+        code, response = smtp_connection.mail(sender)
+        if code != 250:
+            smtp_connection.rset()
+            raise smtplib.SMTPSenderRefused(code, response, sender)
+        replies = OrderedDict((recipient, smtp_connection.rcpt(recipient))
+                                for recipient in recipients)
+        smtp_connection.rset()
+        return replies
+
+    def close(self):
+        with self.lock:
+            if self.smtp_connection is not None:
+                try:
+                    self.smtp_connection.quit()
+                except (smtplib.SMTPException, OSError):
+                    self.smtp_connection.close()
+                self.smtp_connection = None
+
+
+class EmailVerifier:
+    """Checks which emails exist by asking the mail servers of their
+    domains with the RCPT TO command, without sending any email
+
+    Description
+    -----------
+
+    The emails are grouped by domain. The mail servers of each domain
+    are resolved once and cached, and all the emails of the domain are
+    checked in a single transaction. A session is kept for each mail
+    server and reused by all the domains that it serves. The domains
+    are checked at the same time by `concurrency` threads.
+
+    An address that cannot exist is also checked for each domain:
+    when it is accepted, the domain is a catch-all domain and its
+    emails cannot be verified:
+
+        patterns = MyEnterprise(file_path='names.csv')
+        with EmailVerifier() as verifier:
+            results = verifier.verify(row[-1] for row in patterns.iter_rows())
+
+    Parameters
+    ----------
+
+        mx_cache: the MXCache used to find the mail servers
+
+        port: the port of the mail servers
+
+        smtp_class: the class used to create the sessions
+
+        sender: the email used in the MAIL FROM command
+
+        concurrency: the number of domains checked at the same time
+
+        host_delay: the minimum number of seconds between two
+                    transactions on the same mail server
+
+        rcpt_limit: the maximum number of RCPT TO commands
+                    sent in a transaction
+    """
+    def __init__(self, mx_cache=None, port=25, smtp_class=smtplib.SMTP, sender='',
+                    helo='localhost', concurrency=10, host_delay=0, rcpt_limit=100,
+                    timeout=10, detect_catch_all=True, clock=time.monotonic, sleep=time.sleep):
+        self.mx_cache = mx_cache if mx_cache is not None else MXCache(clock=clock)
+        self.port = port
+        self.smtp_class = smtp_class
+        self.sender = sender
+        self.helo = helo
+        self.concurrency = concurrency
+        self.host_delay = host_delay
+        self.rcpt_limit = rcpt_limit
+        self.timeout = timeout
+        self.detect_catch_all = detect_catch_all
+        self.clock = clock
+        self.sleep = sleep
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_session(self, host):
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = HostSession(host, self.port, smtp_class=self.smtp_class,
+                            helo=self.helo, timeout=self.timeout, delay=self.host_delay,
+                            clock=self.clock, sleep=self.sleep)
+                self.sessions[host] = session
+            return session
+
+    @staticmethod
+    def get_domain(email):
+        return email.rsplit('@', 1)[-1].lower()
+
+    def probe(self, hosts, recipients):
+        """Return the replies of the first mail server that could
+        be reached, with its name, or raise the last error
+        """
+        error = None
+        for host in hosts:
+            session = self.get_session(host)
+            try:
+                replies = OrderedDict()
+                for index in range(0, len(recipients), self.rcpt_limit):
+                    chunk = recipients[index:index + self.rcpt_limit]
+                    replies.update(session.probe(self.sender, chunk))
+                return host, replies
+            except (smtplib.SMTPException, OSError) as exception:
+                # Try the next mail server
+                error = exception
+        raise error
+
+    def verify_domain(self, domain, emails):
+        """Verify the emails of a single domain
+        """
+        try:
+            hosts = self.mx_cache.get(domain)
+        except Exception as error:
+            return [Verification(email, Verification.UNKNOWN, error=error) for email in emails]
+        if not hosts:
+            return [Verification(email, Verification.INVALID, message='No mail server for %s' % domain)
+                        for email in emails]
+
+        recipients = list(emails)
+        probe_address = None
+        if self.detect_catch_all:
+            probe_address = 'zemailer-%s@%s' % (uuid.uuid4().hex[:16], domain)
+            recipients.insert(0, probe_address)
+
+        try:
+            host, replies = self.probe(hosts, recipients)
+        except (smtplib.SMTPException, OSError) as error:
+            return [Verification(email, Verification.UNKNOWN, error=error) for email in emails]
+
+        catch_all = probe_address is not None and replies[probe_address][0] in (250, 251)
+        results = []
+        for email in emails:
+            code, message = replies[email]
+            if isinstance(message, bytes):
+                message = message.decode('utf-8', 'replace')
+            if code in (250, 251):
+                status = Verification.CATCH_ALL if catch_all else Verification.VALID
+            elif 500 <= code < 600:
+                status = Verification.INVALID
+            else:
+                status = Verification.UNKNOWN
+            results.append(Verification(email, status, code=code, message=message, host=host))
+        return results
+
+    def verify(self, emails):
+        """Verify the emails and return their results in the
+        same order. Each email is only checked once
+        """
+        emails = list(emails)
+        domains = OrderedDict()
+        results = {}
+        for email in OrderedDict.fromkeys(emails):
+            if '@' not in email:
+                results[email] = Verification(email, Verification.INVALID,
+                                    message='Not a valid email')
+                continue
+            domains.setdefault(self.get_domain(email), []).append(email)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(self.verify_domain, domain, items)
+                            for domain, items in domains.items()]
+            for future in futures:
+                for result in future.result():
+                    results[result.email] = result
+        return [results[email] for email in emails]
+
+    def deliverable(self, emails):
+        """Return the emails that can receive emails,
+        including the ones of catch-all domains
+        """
+        return [result.email for result in self.verify(emails) if result.deliverable]
+
+    def close(self):
+        """Close the sessions with the mail servers
+        """
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions = {}
+        for session in sessions:
+            session.close()
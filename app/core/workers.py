@@ -0,0 +1,52 @@
+"""Regroups the utilities used to spread the generation of
+emails over multiple processes
+
+author: pendenquejohn@gmail.com
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+def chunked(iterable, size):
+    """Split an iterable in lists of `size` items. The iterable
+    is only consumed as the chunks are requested
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def map_chunks(function, chunks, workers=None):
+    """Apply a function to each chunk using a pool of `workers`
+    processes and yield the results in the original order of
+    the chunks
+
+    Description
+    -----------
+
+    Only a limited number of chunks are sent to the pool at the
+    same time so that very large files are never fully loaded
+    in memory. When `workers` is None or 1, the chunks are
+    processed in the current process.
+
+    The function and the chunks are sent to the other processes
+    which means that they should be picklable
+    """
+    if not workers or workers <= 1:
+        for chunk in chunks:
+            yield function(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, chunk))
+            # Keep every worker busy while
+            # waiting for the oldest chunk
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -1,12 +1,18 @@
-import csv
 import os
 import re
+from array import array
+from bisect import bisect_right
+from collections import deque
+from functools import partial
 
+from ze_mailer.app.core.caches import OutputCache, hash_rows
+from ze_mailer.app.core.mixins.patterns import EmailTemplate, PatternsMixin
 from ze_mailer.app.core.mixins.utilities import UtilitiesMixin
-from ze_mailer.app.core.errors import SeparatorError
-from ze_mailer.app.core.fileopener import FileOpener, FileWriter
-from ze_mailer.app.core.messages import Info
+from ze_mailer.app.core.errors import FileTypeError, SeparatorError
+from ze_mailer.app.core.fileopener import CSVStream, FileOpener, FileWriter
 from ze_mailer.app.core.settings import configuration
+from ze_mailer.app.core.tables import NameTable, StringColumn
+from ze_mailer.app.core.workers import chunked, map_chunks
 
 # e = 'r'
 # u = 'paramount'
@@ -29,7 +35,21 @@ REGEX_PATTERNS = [
 ]
 
 
-class NamesAlgorithm(FileOpener, FileWriter):
+def render_names(template, names):
+    """Normalize the names of a chunk and create their emails
+    with a compiled template. Used by the processes of
+    `NamesAlgorithm.iter_rows` to receive only the names
+    """
+    normalize_name = UtilitiesMixin.normalize_name
+    render_name = template.render_name
+    results = []
+    for name in names:
+        name = normalize_name(name)
+        results.append((name, render_name(name)))
+    return results
+
+
+class NamesAlgorithm(PatternsMixin, FileOpener, FileWriter):
     """Subclass this class and build basic email patterns such 
     as `name.surname`
 
@@ -46,6 +66,15 @@ class NamesAlgorithm(FileOpener, FileWriter):
     such as `nom.prenom-bba`. It must be a tuple or a list
     containing the string to append and the separator:
         (bba, -)
+
+    The pattern can also be a list of patterns ordered from the
+    most to the least likely one, e.g. ['nomp', 'nom']: each name
+    then creates one row per distinct email with its rank
+
+    Very large files can be processed with constant memory by
+    passing `stream=True`: the rows are then read, completed and
+    written one by one when calling `create_file`. With `table=True`,
+    the names are kept in memory in a compact NameTable
     """
     # ex. name.surname
     pattern = ''
@@ -54,146 +83,225 @@ class NamesAlgorithm(FileOpener, FileWriter):
     # separator = None
     particle = None
 
-    def construct_pattern(self):
-        # A switch that tells if the regex
-        # detected a separator or not -;
-        # By default, we'll assume that there
-        # is a separator
-        with_separator = True
-
-        base_regex_patterns = {
-            'with_separator': [
-                # nom.prenom // prenom.nom
-                # nom_prenom // prenom_nom
-                # nom-prenom // prenom-nom
-                r'^(?:(?:pre)?nom)(\S)(?:(?:pre)?nom)$',
-                # n.prenom // p.nom
-                # n-prenom // p-nom
-                # n_prenom // p_nom
-                r'^(?:n|p)(\S)(?:(?:pre)?nom)$'
-            ],
-            'without_separator': [
-                # pnom
-                # nprenom
-                r'^(p|n)?((?:pre)?nom)$'
-            ]
-        }
+    @classmethod
+    def from_rows(cls, headers, rows, file_path=None):
+        """Create the algorithm from rows that were already read
+        and normalized instead of reading a file again
+        """
+        instance = cls.__new__(cls)
+        instance.file_path = file_path
+        instance.headers = list(headers)
+        instance.csv_content = rows
+        return instance
 
-        if self.pattern:
-            new_rows = []
-
-            # Unify the patterns in a single array in order to facilitate iteration
-            patterns = base_regex_patterns['with_separator'] + base_regex_patterns['without_separator']
-            for index, pattern in enumerate(patterns):
-                is_match = re.search(pattern, self.pattern)
-                if is_match:
-                    # If the last pattern is matched,
-                    # then we matched a pattern without
-                    # a separator
-                    if index == 2:
-                        with_separator = False
-                    break
-            
-            # Differenciate techniques for groups
-            # [nom, ., prenom] and [n, prenom]
-            if not with_separator:
-                # Since we do not have a separator,
-                # just used the match groups
-                template_items = list(is_match.groups())
-                # We have to create a reusable
-                # canvas to prevent changing
-                # the names[...] data on each
-                # iteration
-                copy_of_template_items = template_items.copy()
+    def iter_rows(self, workers=None, chunk_size=10000):
+        """Generate the rows of the file with their email
+        without modifying the content of the file
 
-            else:
-                # We can split the names once the separator has
-                # been correctly identified ex. ['nom', 'prenom']
-                separator_object = is_match.group(1)
-                template_items = self.pattern.split(separator_object, 1)
-                copy_of_template_items = template_items.copy()
-            
-            try:
-                # We can now get the index of items in the array
-                # in order to replace them with the real names
-                index_of_surname = copy_of_template_items.index('nom')
-                index_of_name = copy_of_template_items.index('prenom')
-            except ValueError:
-                try:
-                    index_of_surname = copy_of_template_items.index('n')
-                    index_of_name = copy_of_template_items.index('prenom')
-                except ValueError:
-                    index_of_surname = copy_of_template_items.index('nom')
-                    index_of_name = copy_of_template_items.index('p')
-                else:
-                    # If we cannot match anything,
-                    # just fail the program safely
-                    print(Info('We could not find any match with the pattern (%s) that was provided' % self.pattern))
-                    raise SystemExit()
-
-            # Replace [name, surname] by the
-            # respective names in the file
-            # according to the index of name
-            # and surname in the array
-            # ex. [name, surname] => [pauline, lopez]
+        Example
+        -------
+
+            [pauline lopez] => [pauline lopez, pauline.lopez@gmail.com]
+
+            With ['nomp', 'nom']:
+
+            [pauline lopez] => [pauline lopez, lopezp, 1], [pauline lopez, lopez, 2]
+
+        Parameters
+        ----------
+
+            workers: the number of processes to use in order to create
+                     the emails. The rows are sent to the processes by
+                     chunks of `chunk_size` rows and are returned in
+                     the same order as in the file
+        """
+        # The template is compiled once for the
+        # class so that we only have to fill the
+        # slots for each row of the file
+        template = self.template
+        if workers and workers > 1:
+            yield from self.iter_pool_rows(workers, chunk_size)
+        elif self.multiple:
+            # All the patterns are applied to a
+            # row before going to the next one
             for items in self.csv_content:
-                # Values from the csv file can come in two
-                # different ways:
-                # e.g. [eugenie bouchard], [eugénie, bouchard]
-                # If the array comes like in the first example,
-                # we need to separate the items
-                if with_separator:
-                    first, second = items[0].split(' ')
-                    # We also need to flatten the elements
-                    # in the array
-                
-                    # Join both using the separator
-                    # e.g. pauline.lopez
-                    copy_of_template_items[index_of_surname] = second
-                    copy_of_template_items[index_of_name] = first
-
-                    final_pattern = separator_object.join(copy_of_template_items)
-                else:
-                    # Case for pnom
-                    if template_items[0] == 'p':
-                        copy_of_template_items[index_of_surname] = items[0][:1]
-                        copy_of_template_items[index_of_name] = items[1]
-
-                    # Case for nprenom
-                    if template_items[0] == 'n':
-                        copy_of_template_items[index_of_surname] = items[0]
-                        copy_of_template_items[index_of_name] = items[1][:1]
-
-                    final_pattern = ''.join(copy_of_template_items)
-
-                # If a domain was provided,
-                # append it to the names
-                if self.domain:
-                    # e.g. pauline.lopez@gmail.com
-                    items.append(self.append_domain(final_pattern))
-                    new_rows.append(items)
-                else:
-                    items.append(final_pattern)
-                    new_rows.append(items)
-                # Reset the template with the original
-                # template elements above
-                copy_of_template_items = template_items
+                yield from template.render_row(items)
+        else:
+            for items in self.csv_content:
+                yield items + [template.render_name(items[0])]
 
-            # Update & reinsert headers
-            self.headers.append('email')
-            new_rows.insert(0, self.headers)
+    def iter_pool_rows(self, workers, chunk_size):
+        """Generate the rows using a pool of processes. Only the raw
+        names are sent to the processes which normalize them and
+        send back the names with their emails
+        """
+        rows = self.csv_content
+        if isinstance(rows, CSVStream):
+            rows = rows.iter_rows(normalize=False)
+
+        # The chunks of rows waiting for
+        # their emails, in the same order
+        pending = deque()
+        def iter_names():
+            for chunk in chunked(rows, chunk_size):
+                pending.append(chunk)
+                yield [row[0] for row in chunk]
+
+        function = partial(render_names, self.template)
+        for results in map_chunks(function, iter_names(), workers=workers):
+            for row, (name, emails) in zip(pending.popleft(), results):
+                row = [name] + row[1:]
+                if self.multiple:
+                    for rank, email in enumerate(emails, start=1):
+                        yield row + [email, rank]
+                else:
+                    yield row + [emails]
 
+    def construct_pattern(self):
+        if self.pattern:
+            new_rows = list(self.iter_rows())
+            # Reinsert the headers
+            new_rows.insert(0, self.output_headers)
             return new_rows
 
+    def to_table(self):
+        """Return the names and their emails as a NameTable. When
+        the names were loaded with `table=True`, the columns of the
+        names are shared with the new table and only the column of
+        the emails is created
+        """
+        if isinstance(self.csv_content, NameTable) and not self.multiple:
+            emails = self.csv_content.column(0).map(self.template.render_name)
+            return self.csv_content.with_column('email', emails)
+        rows = self.iter_rows()
+        if self.multiple:
+            # The rank is stored as a string
+            rows = ([str(value) for value in row] for row in rows)
+        return NameTable(self.output_headers, rows)
+
     @classmethod
     def append_domain(cls, name):
         """Appends a domain to a pattern
         """
         return name + '@' + cls.domain
 
-    def create_file(self, file_name='ZEMAILER_EMAILS.csv'):
+    def create_file(self, file_name='ZEMAILER_EMAILS.csv', workers=None, cache=False):
+        """Write the names and their emails to a file in the output
+        directory and return the number of rows that were written.
+        The rows are written as they are generated so that, with
+        `stream=True`, the file is never loaded in memory
+
+        Parameters
+        ----------
+
+            cache: True or an OutputCache in order to copy the file that
+                   was created from the same names with the same pattern,
+                   domain and particle instead of creating it again
+        """
         full_path = os.path.join(configuration['output_dir'], file_name)
-        super().create_file(full_path, ['name', 'emails'], self.construct_pattern())
+
+        if cache is True:
+            cache = OutputCache()
+        elif cache is False:
+            cache = None
+
+        key = None
+        if cache is not None and getattr(self, 'file_path', None):
+            # The class is part of the key since a
+            # subclass can create different rows
+            extra = [self.__class__.__module__, self.__class__.__qualname__]
+            if not isinstance(self.csv_content, CSVStream):
+                # The names in memory might not be
+                # the ones of the file anymore
+                extra.append(hash_rows(self.csv_content))
+            key = cache.get_key(self.file_path, self.template, *extra)
+            info = cache.copy(key, full_path)
+            if info is not None:
+                print(self.get_message(info['rows'], full_path,
+                        action='Copied from the cache'))
+                return info['rows']
+
+        rows = self.iter_rows(workers=workers)
+        count = super().create_file(full_path, self.output_headers, rows)
+        print(self.get_message(count, full_path))
+        if key is not None:
+            cache.put(key, full_path, rows=count)
+        return count
+
+class EmailExpander(UtilitiesMixin):
+    """Creates all the combinations of names, separators and domains
+    used by the SimpleNamesAlgorithm
+
+    Description
+    -----------
+
+    The names are processed as two columns of first names and last
+    names. The `@domain.com` suffixes are computed once and each
+    name and separator is joined to all of them at once:
+
+        (eugenie, bouchard) -> eugenie.bouchard + [@gmail.com, @outlook.com]
+
+    The emails are returned by chunks of names which allows to
+    stream them to a file without keeping them all in memory.
+    Single names are only combined with the domains.
+    """
+    def __init__(self, separators=['.', '-', '_'], domains=['gmail', 'outlook']):
+        self.separators = list(separators)
+        self.domains = list(domains)
+        self.suffixes = ['@%s.com' % domain for domain in self.domains]
+
+    def split_columns(self, names):
+        """Normalize and split the names into a column
+        of first names and a column of last names
+        """
+        firsts = []
+        lasts = []
+        for name in names:
+            first, last = EmailTemplate.split_name(self.normalize_name(name))
+            firsts.append(first)
+            lasts.append(last)
+        return firsts, lasts
+
+    def expand(self, firsts, lasts):
+        """Create the emails for a column of first names
+        and a column of last names
+        """
+        emails = []
+        extend = emails.extend
+        suffixes = self.suffixes
+        separators = self.separators
+        for first, last in zip(firsts, lasts):
+            if first and last:
+                for separator in separators:
+                    extend(map((first + separator + last).__add__, suffixes))
+            elif last:
+                extend(map(last.__add__, suffixes))
+        return emails
+
+    def iter_chunks(self, names, chunk_size=10000):
+        """Yield the emails by chunks of `chunk_size` names
+        """
+        for chunk in chunked(names, chunk_size):
+            yield self.expand(*self.split_columns(chunk))
+
+    def iter_emails(self, names, chunk_size=10000):
+        """Lazily yield the emails one by one
+        """
+        for emails in self.iter_chunks(names, chunk_size=chunk_size):
+            yield from emails
+
+    def write_file(self, file_path, names, chunk_size=10000):
+        """Write the emails to a file, one email per line,
+        and return the number of emails that were written
+        """
+        count = 0
+        with open(file_path, 'w', encoding='utf-8', newline='\n') as f:
+            for emails in self.iter_chunks(names, chunk_size=chunk_size):
+                # A chunk of empty names creates no email
+                if emails:
+                    f.write('\n'.join(emails) + '\n')
+                    count += len(emails)
+        return count
 
 class SimpleNamesAlgorithm(UtilitiesMixin):
     """Use this class to construct a list of of multiple emails 
@@ -220,21 +328,47 @@ class SimpleNamesAlgorithm(UtilitiesMixin):
 
     Parameters
     ----------
-    `name_or_filepath` is a single string name or a file path containing a list of names
+    `name_or_filepath` is a single string name, a file path, a list of names or a NameTable
     
     `separators` contains a list of separators to use in order to create the email patterns
     `domains` is the list of all the domains that you wish to use to construct the emails
+
+    `workers` is the number of processes to use when creating the emails for a list of names
+
+    `lazy` creates the emails only when they are requested. The object can then be
+    iterated over, its length and the email at a given index are computed from the
+    number of names, separators and domains without creating the other emails
     """
 
     def __init__(self, name_or_filepath, separators=['.', '-', '_'], 
-                    domains=['gmail', 'outlook']):
-        patterns = []
+                    domains=['gmail', 'outlook'], workers=None, lazy=False):
+        if isinstance(name_or_filepath, NameTable):
+            # Only the column of the names is used
+            name_or_filepath = name_or_filepath.column(0)
+
+        self.lazy = lazy
+        if lazy:
+            if isinstance(name_or_filepath, (list, StringColumn)):
+                names = name_or_filepath
+            elif os.path.exists(name_or_filepath):
+                names = self.read_names(name_or_filepath)
+            elif ',' in name_or_filepath:
+                names = name_or_filepath.split(',')
+            else:
+                names = [self.flatten_name(name_or_filepath)]
+            self.prepare(names, separators, domains)
+            return
 
         # We have to check whether name_or_filepath
         # is a path, a comma separated list or
         # a list containing names
-        if isinstance(name_or_filepath, list):
-            self.patterns = self.create_multiple_emails(name_or_filepath, separators, domains)
+        if isinstance(name_or_filepath, (list, StringColumn)):
+            self.patterns = self.create_multiple_emails(name_or_filepath, separators,
+                                domains, workers=workers)
+
+        elif os.path.exists(name_or_filepath):
+            self.patterns = self.create_multiple_emails(self.read_names(name_or_filepath),
+                                separators, domains, workers=workers)
 
         elif ',' in name_or_filepath:
             # Do something here when we receive
@@ -243,59 +377,123 @@ class SimpleNamesAlgorithm(UtilitiesMixin):
             has_match = re.match(r'(\w+\s?\w+\,?)+', name_or_filepath)
             if has_match:
                 names = name_or_filepath.split(',')
-                self.patterns = self.create_multiple_emails(names, separators, domains)
+                self.patterns = self.create_multiple_emails(names, separators,
+                                    domains, workers=workers)
 
-        elif os.path.exists(name_or_filepath):
-            if not name_or_filepath.endswith('.csv'):
-                pass
-            with open(name_or_filepath, 'r', encoding='utf-8') as f:
-                csv_file = csv.reader(f)
-                # Pop the headers
-                csv_file.pop(0)
-                names = self.split_multiple_names(csv_file)
         else:
-            name = self.split_name(self.flatten_name(name_or_filepath))
-
-            # In the case the name is just a
-            # single as opposed to a list,
-            # we just have to return the name
-            # the remaining domain
-            if not isinstance(name, list):
-                for domain in domains:
-                    pattern = f'{name}@{domain}.com'
-                    patterns.append(pattern)
-                self.patterns = patterns
-            else:
-                # Create occurences
-                for separator in separators:
-                    for domain in domains:
-                        pattern = f'{name[0]}{separator}{name[1]}@{domain}.com'
-                        patterns.append(pattern)
-                self.patterns = patterns
+            # The name is split like the names of the
+            # lists and files, a composed surname
+            # being joined together
+            self.patterns = self.create_multiple_emails([self.flatten_name(name_or_filepath)],
+                                separators, domains)
+
+    @staticmethod
+    def read_names(file_path):
+        """Read the names of the first column of a csv file
+        """
+        if not file_path.endswith('.csv'):
+            raise FileTypeError('Your file should be a csv file', file_path)
+        return [row[0] for row in CSVStream(file_path)]
 
     def __str__(self):
+        if self.lazy:
+            return str(list(self))
         return str(self.patterns)
 
     def __repr__(self):
-        return '%s(%s)' % (self.__class__.__name__, str(self.patterns))
+        return '%s(%s)' % (self.__class__.__name__, self.__str__())
 
     def __getitem__(self, index):
-        return str(self.patterns[index])
+        if not self.lazy:
+            return str(self.patterns[index])
+
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index = index + len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('%s index out of range' % self.__class__.__name__)
+
+        # Find the name that creates the email and
+        # then the separator and the domain from
+        # the position of the email for that name
+        position = bisect_right(self.offsets, index)
+        local_index = index - (self.offsets[position - 1] if position else 0)
+        first = self.firsts[position]
+        last = self.lasts[position]
+        suffixes = self.expander.suffixes
+        if first:
+            separator, domain = divmod(local_index, len(suffixes))
+            return first + self.expander.separators[separator] + last + suffixes[domain]
+        return last + suffixes[local_index]
+
+    def __iter__(self):
+        if not self.lazy:
+            yield from self.patterns
+            return
+
+        for start in range(0, len(self.firsts), 10000):
+            yield from self.expander.expand(self.firsts[start:start + 10000],
+                                            self.lasts[start:start + 10000])
+
+    def __len__(self):
+        if self.lazy:
+            return self.offsets[-1] if self.offsets else 0
+        return len(self.patterns)
+
+    def prepare(self, names, separators, domains):
+        """Store the names as columns with the number of emails
+        that each name creates in order to create them lazily
+        """
+        self.expander = EmailExpander(separators=separators, domains=domains)
+        # The first and last names are kept in
+        # compact columns instead of lists
+        self.firsts = StringColumn()
+        self.lasts = StringColumn()
+        for chunk in chunked(names, 10000):
+            firsts, lasts = self.expander.split_columns(chunk)
+            self.firsts.extend(firsts)
+            self.lasts.extend(lasts)
+
+        # Cumulated number of emails created by the
+        # names e.g. [6, 8, 14] for a full name, a
+        # single name and a full name
+        full_count = len(self.expander.separators) * len(self.expander.suffixes)
+        single_count = len(self.expander.suffixes)
+        self.offsets = array('Q')
+        total = 0
+        for first, last in zip(self.firsts, self.lasts):
+            if first:
+                total += full_count
+            elif last:
+                total += single_count
+            self.offsets.append(total)
 
     def append(self, value):
+        if self.lazy:
+            # Adding an email requires
+            # creating all the other ones
+            self.patterns = list(self)
+            self.lazy = False
         self.patterns.append(value)
         return self.patterns
 
-    def create_multiple_emails(self, names:list, separators:list, domains:list):
+    def create_multiple_emails(self, names:list, separators:list, domains:list,
+                                workers=None, chunk_size=10000):
         """A definition for creating and generating multiple email addresses with
         multiple different names in a list
+
+        The names can be split in chunks of `chunk_size` names and
+        sent to a pool of `workers` processes. The emails are
+        returned in the same order as with a single process
         """
-        patterns = []
-        for name in names:
-            name = self.normalize_name(name)
-            splitted_name = self.split_name(name)
-            for separator in separators:
-                for domain in domains:
-                    pattern = f'{splitted_name[0]}{separator}{splitted_name[1]}@{domain}.com'
-                    patterns.append(pattern)
-        return patterns
+        if workers and workers > 1:
+            patterns = []
+            function = partial(self.create_multiple_emails, separators=separators,
+                            domains=domains)
+            for chunk in map_chunks(function, chunked(names, chunk_size), workers=workers):
+                patterns.extend(chunk)
+            return patterns
+
+        expander = EmailExpander(separators=separators, domains=domains)
+        return expander.expand(*expander.split_columns(names))
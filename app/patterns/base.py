@@ -20,30 +20,91 @@ class NamePatterns(NamesAlgorithm):
             [ name, email ],
             ...
         ]
+
+    The rows are generated on demand and cached: accessing the
+    row `i` only creates the rows up to `i`. Call `invalidate()`
+    after changing the `pattern`, the `domain` or the names.
     """
+    def __init__(self, file_path=None, stream=False, table=False):
+        super().__init__(file_path=file_path, stream=stream, table=table)
+        self.invalidate()
+
+    @classmethod
+    def from_rows(cls, headers, rows, file_path=None):
+        instance = super().from_rows(headers, rows, file_path=file_path)
+        instance.invalidate()
+        return instance
+
     def __str__(self):
-        return str(self.construct_pattern())
+        return str([self.output_headers] + self.rows)
     
     def __unicode__(self):
         return self.__str__()
 
     def __repr__(self):
-        return '%s(%s)' % (self.__class__.__name__, str(self.construct_pattern()))
+        return '%s(%s)' % (self.__class__.__name__, self.__str__())
 
     def __getitem__(self, index):
-        # Add one in order to return
-        # a list not being the headers
-        if index == 0:
-            index = index + 1
-        return str(self.construct_pattern()[index])
+        if isinstance(index, slice):
+            return [str(row) for row in self.rows[index]]
+        if index < 0:
+            # The rows are counted from the end
+            # which requires knowing all of them
+            index = index + len(self)
+        # Only generate the rows that
+        # were not yet cached
+        if index >= 0:
+            self._generate(index + 1)
+        if index < 0 or index >= len(self._rows):
+            raise IndexError('%s index out of range' % self.__class__.__name__)
+        return str(self._rows[index])
+
+    def __iter__(self):
+        index = 0
+        while True:
+            self._generate(index + 1)
+            if index >= len(self._rows):
+                return
+            yield self._rows[index]
+            index += 1
 
     def __len__(self):
-        return len(self.construct_pattern())
+        if self.multiple:
+            # The number of emails created by each
+            # row is only known once they are created
+            return len(self.rows)
+        # Each row of the file creates
+        # exactly one email
+        return len(self.csv_content)
+
+    def _generate(self, count=None):
+        """Generate and cache the rows until `count` rows
+        are available or all of them when count is None
+        """
+        if self._iterator is None:
+            self._iterator = self.iter_rows()
+        while count is None or len(self._rows) < count:
+            try:
+                self._rows.append(next(self._iterator))
+            except StopIteration:
+                break
+
+    def invalidate(self):
+        """Clear the cached rows. This should be called
+        when the `pattern`, the `domain` or the content
+        of the file is changed
+        """
+        self._rows = []
+        self._iterator = None
+
+    @property
+    def rows(self):
+        """The list of all the rows with their email
+        """
+        self._generate()
+        return self._rows
 
     @property
     def emails(self):
-        items = self.construct_pattern()
-        # Pop headers
-        items.pop(0)
-        for item in items:
+        for item in self:
             yield item[1:]
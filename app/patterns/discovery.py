@@ -0,0 +1,195 @@
+"""Finds the pattern used by a domain to create its emails from
+a few names whose email is already known
+
+Description
+-----------
+
+    samples = [
+        ('Eugénie Bouchard', 'bouchard.eugenie@edhec.com'),
+        ('Serena Williams', 'williams.serena@edhec.com')
+    ]
+    matches = PatternDiscovery().discover(samples)
+    matches[0].pattern, matches[0].confidence
+    >> 'nom.prenom', 1.0
+
+author: pendenquejohn@gmail.com
+"""
+from collections import Counter, OrderedDict
+
+from ze_mailer.app.core.mixins.patterns import EmailTemplate, compile_pattern
+from ze_mailer.app.core.mixins.utilities import UtilitiesMixin
+
+SEPARATORS = ('.', '-', '_', '')
+
+# The parts of the name that can be combined in a pattern:
+# a full name or initial followed or preceded by a full
+# surname or initial, but never two initials
+NAME_TOKENS = ('prenom', 'p')
+
+SURNAME_TOKENS = ('nom', 'n')
+
+
+def build_grammar(separators=SEPARATORS):
+    """Return all the patterns that can be used to create an email
+    from a name, from the most to the least common
+    """
+    patterns = []
+    for separator in separators:
+        for name in NAME_TOKENS:
+            for surname in SURNAME_TOKENS:
+                if name == 'p' and surname == 'n':
+                    continue
+                patterns.append(name + separator + surname)
+                patterns.append(surname + separator + name)
+    patterns.extend(['nom', 'prenom'])
+    # Remove the duplicates created by
+    # the patterns without separators
+    return list(OrderedDict.fromkeys(patterns))
+
+
+class PatternMatch:
+    """A pattern found for a domain with the number of
+    samples that it explains
+
+    Description
+    -----------
+
+    The confidence is the proportion of the samples of the
+    domain whose email is created by the pattern. A sample that
+    several patterns explain equally well, such as a name without
+    a surname, is shared between these patterns
+    """
+    def __init__(self, pattern, domain, particle=None, matches=0, total=0):
+        self.pattern = pattern
+        self.domain = domain
+        self.particle = particle
+        self.matches = matches
+        self.total = total
+
+    def __repr__(self):
+        particle = ', %s%s' % (self.particle[1], self.particle[0]) if self.particle else ''
+        return '%s(%s%s@%s, %.2f)' % (self.__class__.__name__, self.pattern,
+                    particle, self.domain, self.confidence)
+
+    @property
+    def confidence(self):
+        return self.matches / self.total if self.total else 0
+
+    @property
+    def template(self):
+        """The compiled template used to create the emails
+        """
+        return compile_pattern(self.pattern, domain=self.domain, particle=self.particle)
+
+
+class PatternDiscovery(UtilitiesMixin):
+    """Scores every pattern of the grammar against (name, email)
+    samples and ranks the patterns of each domain
+
+    Description
+    -----------
+
+    The names are flattened and split once. For each sample, the
+    local part of every pattern is created and indexed so that the
+    email of the sample is matched against all the patterns with a
+    single lookup. When the email ends with a particle such as
+    `-bba`, the part before the particle is looked up instead
+    and the particle is kept with the pattern.
+
+    Parameters
+    ----------
+
+        separators: the separators that can be used between
+                    the name and the surname
+
+        min_confidence: the patterns explaining a lower
+                        proportion of the samples are ignored
+    """
+    def __init__(self, separators=SEPARATORS, min_confidence=0):
+        self.grammar = build_grammar(separators)
+        self.templates = [compile_pattern(pattern) for pattern in self.grammar]
+        self.separators = [separator for separator in separators if separator]
+        self.min_confidence = min_confidence
+
+    def index(self, name):
+        """Return the local part created by each pattern for a name
+        with the indexes of the patterns that create it
+        """
+        parts = EmailTemplate.split_name(self.flatten_name(name))
+        local_parts = {}
+        for position, template in enumerate(self.templates):
+            local = template.render(*parts)
+            if local:
+                local_parts.setdefault(local, []).append(position)
+        return local_parts
+
+    def match(self, name, email):
+        """Return the (pattern index, particle) that
+        create the email of a sample
+        """
+        local = email.rsplit('@', 1)[0].lower()
+        local_parts = self.index(name)
+        matches = [(position, None) for position in local_parts.get(local, [])]
+        # The email might end with a particle e.g.
+        # eugenie.bouchard-bba: try each separator
+        for position, character in enumerate(local):
+            if character in self.separators and 0 < position < len(local) - 1:
+                particle = (local[position + 1:], character)
+                if not particle[0].isalnum():
+                    continue
+                matches.extend((index, particle) for index in local_parts.get(local[:position], []))
+        return matches
+
+    def discover_domains(self, samples):
+        """Return the ranked patterns of each domain of the samples
+        """
+        scores = OrderedDict()
+        totals = Counter()
+        for name, email in samples:
+            if '@' not in email:
+                continue
+            domain = email.rsplit('@', 1)[1].lower()
+            totals[domain] += 1
+            counter = scores.setdefault(domain, Counter())
+            # A sample counts once for each pattern even
+            # if the pattern matches it in several ways
+            matches = set(self.match(name, email))
+            if matches and len(self.flatten_name(name).split()) < 2:
+                # Without a surname, most patterns create the same
+                # email: the sample does not tell them apart
+                weight = 1 / len(matches)
+                for key in matches:
+                    counter[key] += weight
+            else:
+                counter.update(matches)
+
+        results = OrderedDict()
+        for domain, counter in scores.items():
+            matches = [PatternMatch(self.grammar[index], domain, particle=particle,
+                            matches=count, total=totals[domain])
+                            for (index, particle), count in counter.items()]
+            # The patterns that explain the most samples come
+            # first, then the most common ones of the grammar
+            # and the ones without particles
+            matches.sort(key=lambda match: (-match.matches, self.grammar.index(match.pattern),
+                                            match.particle is not None))
+            results[domain] = [match for match in matches
+                                    if match.confidence >= self.min_confidence]
+        return results
+
+    def discover(self, samples, domain=None):
+        """Return the ranked patterns for the samples of a domain,
+        the most common domain of the samples by default
+        """
+        results = self.discover_domains(samples)
+        if not results:
+            return []
+        if domain is None:
+            domain = max(results, key=lambda key: results[key][0].total if results[key] else 0)
+        return results.get(domain.lower(), [])
+
+    def best(self, samples, count=2, domain=None):
+        """Return the `count` most likely patterns, used to
+        create only the emails that are likely to exist
+        """
+        return self.discover(samples, domain=domain)[:count]
@@ -17,13 +17,29 @@ from the pattern and domain that you would have provided.
 
 Creating a new school is very simple:
 
-    class NewSchool(NamesAlgorithm):
+    class NewSchool(School):
         pattern = ''
         domain = ''
 
+Every subclass of School that has a pattern is registered in
+`School.registry` which allows creating the emails of all the
+schools at once while reading the file of names only once:
+
+    runner = SchoolRunner('path/to/names.csv')
+    runner.create_files()
+    runner.create_combined_file()
+
 John PENDENQUE - pendenquejohn@gmail.com
 """
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
+from ze_mailer.app.core.errors import PatternError
+from ze_mailer.app.core.fileopener import FileOpener, FileWriter
+from ze_mailer.app.core.settings import configuration
+from ze_mailer.app.core.workers import chunked, map_chunks
 from ze_mailer.app.patterns.algorithms import NamesAlgorithm
 
 # import re
@@ -35,61 +51,241 @@ from ze_mailer.app.patterns.algorithms import NamesAlgorithm
 # from app.patterns.patterns import NamePatterns
 
 
-class EDHEC(NamesAlgorithm):
+class School(NamesAlgorithm):
+    """The base class of the schools. Each subclass that has a
+    pattern is registered under its name when it is defined
+
+    Description
+    -----------
+
+    A school cannot replace a registered school with the same name
+    unless it is defined with `replace=True`. Schools that should
+    not be used by the SchoolRunner by default, for instance
+    schools created for a single run, use `register=False`:
+
+        class HEC(School, replace=True):
+            pattern = 'prenom.nom'
+            domain = 'hec.edu'
+    """
+    registry = OrderedDict()
+
+    def __init_subclass__(cls, register=True, replace=False, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not register or not cls.pattern:
+            return
+        if cls.__name__ in School.registry and not replace:
+            raise ValueError('A school named %s is already registered, use'
+                    ' replace=True in order to replace it' % cls.__name__)
+        School.registry[cls.__name__] = cls
+
+    @classmethod
+    def get_school(cls, name):
+        """Return a registered school from its name,
+        regardless of the case
+        """
+        for key, school in cls.registry.items():
+            if key.lower() == name.lower():
+                return school
+        raise KeyError('There is no school named %s. Available schools '
+                'are: %s' % (name, ', '.join(cls.registry)))
+
+
+class EDHEC(School):
     pattern = 'nom.prenom'
     domain = ''
 
-class HEC(NamesAlgorithm):
+class HEC(School):
     pattern = ['nomp', 'nom']
     domain = 'hec.fr'
 
-class EMLyon(NamesAlgorithm):
+class EMLyon(School):
     pattern = 'nom.prenom'
     domain = 'em-lyon.com'
 
-class SKEMA(NamesAlgorithm):
+class SKEMA(School):
     pattern = 'prenom.nom'
     domain = 'skema.edu'
 
-class PolytechParis(NamesAlgorithm):
+class PolytechParis(School):
     pattern = 'prenom.nom'
     domain = 'polytechnique.edu'
 
-class ESCP(NamesAlgorithm):
+class ESCP(School):
     pattern = 'pnom'
     domain = 'escpeurope.eu'
 
-class CentraleParis(NamesAlgorithm):
+class CentraleParis(School):
     pattern = 'nom.prenom'
     domain = ''
 
 class CentraleLille(CentraleParis):
     domain = ''
 
-class HEI(NamesAlgorithm):
+class HEI(School):
     pattern = 'nom.prenom'
     domain = ''
 
-class KEDGE(NamesAlgorithm):
+class KEDGE(School):
     pattern = 'prenom.nom'
     domain = 'kedgebs.com'
 
-class ISCOM(NamesAlgorithm):
+class ISCOM(School):
     pattern = 'prenom.nom'
     domain = 'iscom.fr'
 
-class ESSEC(NamesAlgorithm):
+class ESSEC(School):
     pattern = ['nom', 'nomp']
     domain = 'essec.edu'
 
-class Neoma(NamesAlgorithm):
+class Neoma(School):
     pattern = 'prenom.nom'
     domain = 'neoma.fr'
 
-class ISTC(NamesAlgorithm):
+class ISTC(School):
     pattern = ''
     domain = ''
 
+
+def render_emails(template, name):
+    """Return the emails created from a name by a template
+    or a list of templates, from the most likely one
+    """
+    emails = template.render_name(name)
+    if isinstance(emails, str):
+        return [emails]
+    return emails
+
+def render_schools(schools, rows):
+    """Return the rows of the combined file for a chunk
+    of rows: one row for each school and email
+    """
+    new_rows = []
+    for row in rows:
+        for name, template in schools:
+            for rank, email in enumerate(render_emails(template, row[0]), start=1):
+                new_rows.append(row + [name, email, rank])
+    return new_rows
+
+# The names used by the processes creating the
+# files of the schools, sent once to each process
+WORKER_NAMES = {}
+
+def set_worker_names(headers, rows, file_path):
+    WORKER_NAMES.update(headers=headers, rows=rows, file_path=file_path)
+
+def create_school_file(school, output_path, cache=False):
+    """Create the file of a school, used to create the files
+    of the schools in different processes
+    """
+    instance = school.from_rows(WORKER_NAMES['headers'], WORKER_NAMES['rows'],
+                    file_path=WORKER_NAMES['file_path'])
+    return instance.create_file(output_path, cache=cache)
+
+
+class SchoolRunner(FileWriter):
+    """Creates the emails of multiple schools from a single
+    file of names
+
+    Description
+    -----------
+
+    The file is read and normalized once and its rows are given to
+    the compiled pattern of each school. The emails can be written
+    to one file for each school or to a single file with one row
+    for each name, school and email:
+
+        runner = SchoolRunner('names.csv', schools=['HEC', 'ESSEC'])
+        runner.create_combined_file()
+
+        [name, school, email, rank]
+        [eugenie bouchard, HEC, boucharde@hec.fr, 1]
+
+    Parameters
+    ----------
+
+        file_path: the csv file containing the names
+
+        schools: the names or the classes of the schools to use,
+                 all the registered schools that have a
+                 pattern and a domain by default
+
+        table: if True, the names are kept in a NameTable which is
+               also much cheaper to send to the other processes
+    """
+    def __init__(self, file_path, schools=None, table=False):
+        opener = FileOpener(file_path=file_path, table=table)
+        self.file_path = file_path
+        self.headers = opener.headers
+        self.rows = opener.csv_content
+
+        if schools is None:
+            schools = [school for school in School.registry.values()
+                            if school.pattern and school.domain]
+        self.schools = [School.get_school(school) if isinstance(school, str) else school
+                            for school in schools]
+        for school in self.schools:
+            # The emails of these schools
+            # would be missing their domain
+            if not school.pattern or not school.domain:
+                raise PatternError('%s does not have a pattern and a domain'
+                                    % school.__name__, pattern=school.pattern)
+
+    def __repr__(self):
+        return '%s(%s, %s schools)' % (self.__class__.__name__, self.file_path, len(self.schools))
+
+    def get_instances(self):
+        return [school.from_rows(self.headers, self.rows, file_path=self.file_path)
+                    for school in self.schools]
+
+    def create_files(self, directory=None, workers=None, cache=False):
+        """Write one file for each school, named after the school,
+        and return the number of rows written for each school
+
+        Parameters
+        ----------
+
+            workers: the number of processes used to create
+                     the files of the schools at the same time.
+                     The names are sent once to each process
+        """
+        directory = directory or configuration['output_dir']
+        paths = OrderedDict((school.__name__, os.path.join(directory, 'ZEMAILER_%s.csv'
+                                % school.__name__.upper())) for school in self.schools)
+
+        counts = OrderedDict()
+        if workers and workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=set_worker_names,
+                        initargs=(self.headers, self.rows, self.file_path)) as executor:
+                futures = [(school.__name__, executor.submit(create_school_file, school,
+                                paths[school.__name__], cache=cache))
+                                for school in self.schools]
+                for name, future in futures:
+                    counts[name] = future.result()
+        else:
+            for instance in self.get_instances():
+                name = instance.__class__.__name__
+                counts[name] = instance.create_file(paths[name], cache=cache)
+        return counts
+
+    def iter_rows(self, workers=None, chunk_size=10000):
+        """Generate the rows of the combined file
+        """
+        schools = [(instance.__class__.__name__, instance.template)
+                        for instance in self.get_instances()]
+        function = partial(render_schools, schools)
+        for rows in map_chunks(function, chunked(self.rows, chunk_size), workers=workers):
+            yield from rows
+
+    def create_combined_file(self, file_name='ZEMAILER_SCHOOLS.csv', workers=None):
+        """Write the emails of all the schools to a single file
+        and return the number of rows that were written
+        """
+        full_path = os.path.join(configuration['output_dir'], file_name)
+        headers = self.headers + ['school', 'email', 'rank']
+        count = super().create_file(full_path, headers, self.iter_rows(workers=workers))
+        print(self.get_message(count, full_path))
+        return count
+
 # class Universities(NamesAlgorithm):
 #     def from_url(self, url):
 #         if self._ping(url):
@@ -1,5 +1,11 @@
+import os
+import tempfile
 import unittest
-from ze_mailer.app.patterns.algorithms import SimpleNamesAlgorithm
+
+from ze_mailer.app.core.errors import FileTypeError
+from ze_mailer.app.core.fileopener import CSVStream
+from ze_mailer.app.core.settings import configuration
+from ze_mailer.app.patterns.algorithms import EmailExpander, SimpleNamesAlgorithm
 
 class TestSimpleAlgorithm(unittest.TestCase):
     def setUp(self):
@@ -32,5 +38,101 @@ class TestSimpleAlgorithm(unittest.TestCase):
         self.assertIsInstance(self.simple_algorithm.patterns, list)
         self.assertIn('eugenie.bouchard@google.fr', self.simple_algorithm)
 
+class TestLazySimpleAlgorithm(unittest.TestCase):
+    def setUp(self):
+        self.names = ['eugenie bouchard', 'madonna', '', 'kendall jenner']
+        self.eager = SimpleNamesAlgorithm(self.names)
+        self.lazy = SimpleNamesAlgorithm(self.names, lazy=True)
+
+    def test_same_emails(self):
+        self.assertEqual(list(self.lazy), self.eager.patterns)
+
+    def test_len(self):
+        self.assertEqual(len(self.lazy), len(self.eager.patterns))
+
+    def test_can_get_item(self):
+        for index in range(-len(self.lazy), len(self.lazy)):
+            self.assertEqual(self.lazy[index], self.eager[index])
+        self.assertEqual(self.lazy[2:8:3], self.eager.patterns[2:8:3])
+        with self.assertRaises(IndexError):
+            self.lazy[len(self.lazy)]
+
+    def test_single_name(self):
+        lazy = SimpleNamesAlgorithm('Eugénie Bouchard', lazy=True)
+        self.assertEqual(list(lazy), SimpleNamesAlgorithm('Eugénie Bouchard').patterns)
+
+    def test_composed_name(self):
+        eager = SimpleNamesAlgorithm('Aurélie de la Tour').patterns
+        self.assertEqual(list(SimpleNamesAlgorithm('Aurélie de la Tour', lazy=True)), eager)
+        self.assertEqual(eager[0], 'aurelie.delatour@gmail.com')
+
+    def test_can_append(self):
+        self.lazy.append('eugenie.bouchard@google.fr')
+        self.assertIn('eugenie.bouchard@google.fr', self.lazy)
+        self.assertEqual(len(self.lazy), len(self.eager.patterns) + 1)
+
+class TestFileOfNames(unittest.TestCase):
+    def setUp(self):
+        self.file_path = configuration['dummy_file']
+        self.names = [row[0] for row in CSVStream(self.file_path)]
+
+    def test_eager(self):
+        self.assertEqual(SimpleNamesAlgorithm(self.file_path).patterns,
+                            SimpleNamesAlgorithm(self.names).patterns)
+
+    def test_lazy(self):
+        lazy = SimpleNamesAlgorithm(self.file_path, lazy=True)
+        self.assertEqual(list(lazy), SimpleNamesAlgorithm(self.names).patterns)
+        self.assertNotIn('dummy', lazy[0])
+
+    def test_not_csv(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'names.txt')
+            open(file_path, 'w').close()
+            with self.assertRaises(FileTypeError):
+                SimpleNamesAlgorithm(file_path, lazy=True)
+
+class TestEmailExpander(unittest.TestCase):
+    def setUp(self):
+        self.expander = EmailExpander(separators=['.', '_'], domains=['gmail', 'outlook'])
+        self.names = ['Eugenie Bouchard', 'Madonna', 'kendall jenner']
+
+    def test_expand(self):
+        emails = list(self.expander.iter_emails(self.names, chunk_size=2))
+        self.assertEqual(emails[:4], [
+            'eugenie.bouchard@gmail.com', 'eugenie.bouchard@outlook.com',
+            'eugenie_bouchard@gmail.com', 'eugenie_bouchard@outlook.com'
+        ])
+        self.assertEqual(emails[4:6], ['madonna@gmail.com', 'madonna@outlook.com'])
+        self.assertEqual(len(emails), 10)
+
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'emails.txt')
+            count = self.expander.write_file(file_path, self.names, chunk_size=1)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(count, 10)
+        self.assertEqual(lines, list(self.expander.iter_emails(self.names)))
+
+    def test_write_file_empty_names(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'emails.txt')
+            count = self.expander.write_file(file_path, ['', 'Madonna', ''], chunk_size=1)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+        self.assertEqual(count, 2)
+        self.assertEqual(lines, ['madonna@gmail.com', 'madonna@outlook.com'])
+
+class TestWorkers(unittest.TestCase):
+    def test_same_result_as_serial(self):
+        names = ['eugenie bouchard', 'kendall jenner', 'serena williams'] * 10
+        serial = SimpleNamesAlgorithm(names)
+        parallel = SimpleNamesAlgorithm(names, workers=2)
+        self.assertEqual(serial.patterns, parallel.patterns)
+
+        chunked = serial.create_multiple_emails(names, ['.'], ['gmail'], workers=2, chunk_size=7)
+        self.assertEqual(chunked, serial.create_multiple_emails(names, ['.'], ['gmail']))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
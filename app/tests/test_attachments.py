@@ -0,0 +1,112 @@
+import base64
+import email
+import os
+import tempfile
+import unittest
+
+from ze_mailer.app.core.attachments import (AttachmentCache, StreamingAttachment,
+                                            encode_file, iter_message_data)
+from ze_mailer.app.core.errors import AttachmentError
+from ze_mailer.app.core.senders import Envelope, SendEmail, SendEmailWithAttachment
+from ze_mailer.app.core.templates import MessageTemplate
+from ze_mailer.app.tests.test_pools import FakeServer, FakeSMTP
+from ze_mailer.app.tests.test_senders import SequentialSMTP
+
+
+class SequentialServer(FakeServer):
+    smtp_class = SequentialSMTP
+
+
+class StreamingSender(SendEmailWithAttachment):
+    server = SequentialServer
+
+
+class TestAttachmentCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = []
+        for index in range(3):
+            path = os.path.join(self.directory.name, 'file%s.pdf' % index)
+            with open(path, 'wb') as f:
+                f.write(os.urandom(1000))
+            self.paths.append(path)
+        self.cache = AttachmentCache()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_encode_file(self):
+        with open(self.paths[0], 'rb') as f:
+            content = f.read()
+        self.assertEqual(encode_file(self.paths[0], chunk_size=57), base64.encodebytes(content).decode('ascii'))
+
+    def test_encoded_once(self):
+        attachment = self.cache.get(self.paths[0])
+        self.assertIs(self.cache.get(self.paths[0]), attachment)
+        self.assertEqual(attachment.get_filename(), 'file0.pdf')
+        with open(self.paths[0], 'rb') as f:
+            self.assertEqual(attachment.get_payload(decode=True), f.read())
+
+    def test_modified_file(self):
+        attachment = self.cache.get(self.paths[0])
+        with open(self.paths[0], 'wb') as f:
+            f.write(b'new content')
+        self.assertIsNot(self.cache.get(self.paths[0]), attachment)
+
+    def test_eviction(self):
+        size = len(self.cache.get(self.paths[0]).get_payload())
+        self.cache = AttachmentCache(max_size=size * 2)
+        for path in self.paths:
+            self.cache.get(path)
+        self.assertEqual(len(self.cache), 2)
+        self.assertNotIn(self.paths[0], self.cache)
+        self.assertLessEqual(self.cache.size, self.cache.max_size)
+
+class TestStreamingAttachment(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.connections = []
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'report.pdf')
+        with open(self.path, 'wb') as f:
+            f.write(os.urandom(57 * 300 + 11))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_same_as_encoded_file(self):
+        attachment = StreamingAttachment(self.path, chunk_size=57 * 7)
+        encoded = b''.join(attachment.iter_encoded()) + b'\r\n'
+        self.assertEqual(encoded, encode_file(self.path).encode('ascii').replace(b'\n', b'\r\n'))
+
+    def test_bounded_chunks(self):
+        message = SendEmail.create_message('a@b.com', 'c@d.com', 'Report',
+                                attachment=StreamingAttachment(self.path, chunk_size=570))
+        chunks = list(iter_message_data(message))
+        self.assertEqual(chunks[-1], b'.\r\n')
+        self.assertTrue(all(len(chunk) < 2000 for chunk in chunks))
+
+    def test_send_stream(self):
+        StreamingSender('a@b.com', 'c@d.com', 'Report', self.path, stream=True,
+                        user='a', password='b')
+        _, recipients, data = FakeSMTP.connections[-1].transactions[-1]
+        self.assertEqual(recipients, ['c@d.com'])
+        message = email.message_from_bytes(data.replace(b'\r\n..', b'\r\n.'))
+        attachment = message.get_payload()[-1]
+        self.assertEqual(attachment.get_filename(), 'report.pdf')
+        with open(self.path, 'rb') as f:
+            self.assertEqual(attachment.get_payload(decode=True), f.read())
+
+    def test_other_serializations(self):
+        message = SendEmail.create_message('a@b.com', 'c@d.com', 'Report',
+                                attachment=StreamingAttachment(self.path))
+        with self.assertRaises(AttachmentError):
+            message.as_string()
+        with self.assertRaises(AttachmentError):
+            Envelope.from_message(message)
+        with self.assertRaises(AttachmentError):
+            MessageTemplate('a@b.com', 'Report', 'Hello', attachments=[StreamingAttachment(self.path)])
+        # The message can still be streamed
+        self.assertEqual(list(iter_message_data(message))[-1], b'.\r\n')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ze_mailer.app.core.caches import OutputCache
+from ze_mailer.app.core.settings import configuration
+from ze_mailer.app.patterns.base import NamePatterns
+
+
+class Dummy(NamePatterns):
+    pattern = 'prenom.nom'
+    domain = 'gmail.com'
+
+
+class TestOutputCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = OutputCache(os.path.join(self.directory.name, 'cache'), max_size=10000)
+        self.names = os.path.join(self.directory.name, 'names.csv')
+        shutil.copyfile(configuration['dummy_file'], self.names)
+        self.output = os.path.join(self.directory.name, 'emails.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_file(self, pattern=None):
+        patterns = Dummy(file_path=self.names)
+        if pattern:
+            patterns.pattern = pattern
+        return patterns.create_file(self.output, cache=self.cache)
+
+    def read_output(self):
+        with open(self.output, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def test_hit(self):
+        self.assertEqual(self.create_file(), 5)
+        content = self.read_output()
+        os.remove(self.output)
+
+        with mock.patch.object(Dummy, 'iter_rows', side_effect=AssertionError):
+            self.assertEqual(self.create_file(), 5)
+        self.assertEqual(self.read_output(), content)
+
+    def test_key(self):
+        template = Dummy(file_path=self.names).template
+        key = self.cache.get_key(self.names, template)
+        self.assertEqual(key, self.cache.get_key(self.names, template))
+        other = Dummy(file_path=self.names)
+        other.domain = 'outlook.com'
+        self.assertNotEqual(key, self.cache.get_key(self.names, other.template))
+
+        with open(self.names, 'a', encoding='utf-8') as f:
+            f.write('madonna\n')
+        self.assertNotEqual(key, self.cache.get_key(self.names, template))
+
+    def test_miss_on_other_pattern(self):
+        self.create_file()
+        self.create_file(pattern='nom.prenom')
+        self.assertIn('williams.serene@gmail.com', self.read_output())
+
+    def test_names_in_memory(self):
+        self.create_file()
+        patterns = Dummy(file_path=self.names)
+        patterns.csv_content.append(['madonna'])
+        self.assertEqual(patterns.create_file(self.output, cache=self.cache), 6)
+        self.assertIn('madonna@gmail.com', self.read_output())
+
+    def test_disabled_by_default(self):
+        with mock.patch.object(OutputCache, 'put', side_effect=AssertionError):
+            Dummy(file_path=self.names).create_file(self.output)
+
+    def test_eviction(self):
+        self.cache.max_size = 250
+        for pattern in ('prenom.nom', 'nom.prenom', 'pnom'):
+            self.create_file(pattern=pattern)
+        sizes = [size for _, size, _ in self.cache.entries()]
+        self.assertLessEqual(sum(sizes), 250)
+        self.assertLess(len(self.cache), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+from ze_mailer.app.patterns.discovery import PatternDiscovery, build_grammar
+
+
+class TestGrammar(unittest.TestCase):
+    def test_patterns(self):
+        grammar = build_grammar()
+        self.assertEqual(len(grammar), len(set(grammar)))
+        for pattern in ('prenom.nom', 'nom.prenom', 'pnom', 'nomp', 'nprenom', 'p_nom', 'nom', 'prenom'):
+            self.assertIn(pattern, grammar)
+        self.assertNotIn('pn', grammar)
+
+
+class TestPatternDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.discovery = PatternDiscovery()
+
+    def test_discover(self):
+        samples = [
+            ('Eugénie Bouchard', 'bouchard.eugenie@edhec.com'),
+            ('Serena Williams', 'williams.serena@edhec.com'),
+            ('Aurélie de la Tour', 'delatour.aurelie@edhec.com'),
+            ('Kimberley Garner', 'kgarner@edhec.com')
+        ]
+        matches = self.discovery.discover(samples)
+        self.assertEqual(matches[0].pattern, 'nom.prenom')
+        self.assertEqual(matches[0].confidence, 0.75)
+        self.assertEqual(matches[1].pattern, 'pnom')
+        self.assertEqual(matches[0].template.render('madison', 'keys'), 'keys.madison@edhec.com')
+
+    def test_particle(self):
+        samples = [
+            ('Eugénie Bouchard', 'eugenie.bouchard-bba@edhec.com'),
+            ('Serena Williams', 'serena.williams-bba@edhec.com')
+        ]
+        best = self.discovery.best(samples, count=1)[0]
+        self.assertEqual((best.pattern, best.particle), ('prenom.nom', ('bba', '-')))
+        self.assertEqual(best.template.render('madison', 'keys'), 'madison.keys-bba@edhec.com')
+
+    def test_domains(self):
+        samples = [
+            ('Eugénie Bouchard', 'ebouchard@hec.fr'),
+            ('Serena Williams', 'swilliams@hec.fr'),
+            ('Eugénie Bouchard', 'eugenie_bouchard@essec.edu'),
+            ('Serena Williams', 'unknown@essec.edu')
+        ]
+        results = self.discovery.discover_domains(samples)
+        self.assertEqual(results['hec.fr'][0].pattern, 'pnom')
+        self.assertEqual(results['essec.edu'][0].pattern, 'prenom_nom')
+        self.assertEqual(results['essec.edu'][0].confidence, 0.5)
+        self.assertEqual(self.discovery.discover(samples, domain='ESSEC.edu')[0].pattern, 'prenom_nom')
+
+    def test_single_names(self):
+        samples = [
+            ('Eugénie Bouchard', 'bouchard.eugenie@edhec.com'),
+            ('Madonna', 'madonna@edhec.com'),
+            ('Rihanna', 'rihanna@edhec.com'),
+            ('Kimberley Garner', 'kgarner@edhec.com')
+        ]
+        matches = self.discovery.discover(samples)
+        self.assertEqual([match.pattern for match in matches[:2]], ['nom.prenom', 'pnom'])
+        self.assertLess(matches[0].confidence, 0.5)
+        # Both names are shared between the 17 patterns
+        # that create their email
+        self.assertAlmostEqual(matches[0].matches, 1 + 2 / 17)
+        surname = [match for match in matches if (match.pattern, match.particle) == ('nom', None)]
+        self.assertAlmostEqual(surname[0].matches, 2 / 17)
+
+    def test_min_confidence(self):
+        discovery = PatternDiscovery(min_confidence=0.6)
+        samples = [
+            ('Eugénie Bouchard', 'bouchard.eugenie@edhec.com'),
+            ('Serena Williams', 'williams.serena@edhec.com'),
+            ('Kimberley Garner', 'kgarner@edhec.com')
+        ]
+        self.assertEqual([match.pattern for match in discovery.discover(samples)], ['nom.prenom'])
+
+if __name__ == "__main__":
+    unittest.main()
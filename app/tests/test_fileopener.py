@@ -1,6 +1,10 @@
+import os
+import tempfile
+import time
 import unittest
+from unittest import mock
 
-from ze_mailer.app.core.fileopener import FileOpener
+from ze_mailer.app.core.fileopener import CSVStream, FileOpener, FilesObject
 from ze_mailer.app.core.settings import configuration
 
 
@@ -11,5 +15,64 @@ class TestConfiguration(unittest.TestCase):
     def test_is_csv(self):
         print(self.opener.csv_content)
 
+class TestCSVStream(unittest.TestCase):
+    def setUp(self):
+        self.stream = CSVStream(configuration['dummy_file'])
+
+    def test_headers(self):
+        self.assertEqual(self.stream.headers, ['name'])
+
+    def test_same_rows_as_opener(self):
+        opener = FileOpener(file_path=configuration['dummy_file'])
+        self.assertEqual(list(self.stream), opener.csv_content)
+        # Can be iterated more than once
+        self.assertEqual(list(self.stream), opener.csv_content)
+
+class TestFilesObject(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        for name in ('names.2020.csv', 'other.csv', 'notes.txt'):
+            open(os.path.join(self.path, name), 'w').close()
+        os.mkdir(os.path.join(self.path, 'nested'))
+        open(os.path.join(self.path, 'nested', 'hidden.csv'), 'w').close()
+        self.set_mtime(100)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def set_mtime(self, seconds_ago):
+        mtime = time.time_ns() - seconds_ago * 10**9
+        os.utime(self.path, ns=(mtime, mtime))
+
+    def test_scan(self):
+        files = FilesObject().scan_directory(self.path)
+        self.assertEqual(sorted(files), ['names.2020', 'notes', 'other'])
+        self.assertEqual(files['names.2020']['extension'], 'csv')
+        self.assertEqual(files.get_object('notes').name, 'notes.txt')
+        self.assertEqual(sorted(item.name for item in files.by_extension('.csv')),
+                            ['names.2020.csv', 'other.csv'])
+        # The files are not shared between the instances
+        self.assertEqual(len(FilesObject()), 0)
+
+    def test_cache(self):
+        files = FilesObject().scan_directory(self.path)
+        with mock.patch('ze_mailer.app.core.fileopener.os.scandir') as scandir:
+            files.scan_directory(self.path)
+            scandir.assert_not_called()
+
+        open(os.path.join(self.path, 'new.csv'), 'w').close()
+        self.set_mtime(50)
+        files.scan_directory(self.path)
+        self.assertIn('new', files)
+        self.assertEqual(len(files.by_extension('csv')), 3)
+
+    def test_same_name(self):
+        open(os.path.join(self.path, 'other.json'), 'w').close()
+        files = FilesObject().scan_directory(self.path)
+        self.assertEqual(sorted(item.name for item in files.by_extension('csv')),
+                            ['names.2020.csv', 'other.csv'])
+        self.assertEqual([item.name for item in files.by_extension('json')], ['other.json'])
+
 if __name__ == "__main__":
     unittest.main()
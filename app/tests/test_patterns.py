@@ -0,0 +1,156 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from ze_mailer.app.core.caches import OutputCache
+from ze_mailer.app.core.errors import PatternError
+from ze_mailer.app.core.mixins.patterns import (EmailTemplate, TemplateList,
+                                                compile_pattern)
+from ze_mailer.app.core.settings import configuration
+from ze_mailer.app.patterns.algorithms import render_names
+from ze_mailer.app.patterns.base import NamePatterns
+from ze_mailer.app.patterns.schools import HEC
+
+
+class Dummy(NamePatterns):
+    pattern = 'prenom.nom'
+    domain = 'gmail.com'
+
+
+class TestEmailTemplate(unittest.TestCase):
+    def test_with_separator(self):
+        template = compile_pattern('nom.prenom', domain='edhec.com')
+        self.assertEqual(template.separator, '.')
+        self.assertEqual(template.render('eugenie', 'bouchard'), 'bouchard.eugenie@edhec.com')
+
+    def test_initials(self):
+        self.assertEqual(compile_pattern('pnom').render('eugenie', 'bouchard'), 'ebouchard')
+        self.assertEqual(compile_pattern('nprenom').render('eugenie', 'bouchard'), 'beugenie')
+        self.assertEqual(compile_pattern('nomp').render('eugenie', 'bouchard'), 'boucharde')
+        self.assertEqual(compile_pattern('p_nom').render('eugenie', 'bouchard'), 'e_bouchard')
+
+    def test_particle(self):
+        template = compile_pattern('nom.prenom', domain='edhec.com', particle=('bba', '-'))
+        self.assertEqual(template.render('eugenie', 'bouchard'), 'bouchard.eugenie-bba@edhec.com')
+
+    def test_single_name(self):
+        template = compile_pattern('prenom.nom', domain='gmail.com')
+        self.assertEqual(template.render_name('eugenie de la tour'), 'eugenie.delatour@gmail.com')
+        self.assertEqual(template.render_name('madonna'), 'madonna@gmail.com')
+
+    def test_compiled_once(self):
+        self.assertIs(compile_pattern('prenom.nom', 'gmail.com'), compile_pattern('prenom.nom', 'gmail.com'))
+
+    def test_invalid_patterns(self):
+        for pattern in ['', 'name.surname', 'nom.nom', '.nom', 'nom.']:
+            with self.assertRaises(PatternError):
+                EmailTemplate(pattern)
+
+class TestNamePatterns(unittest.TestCase):
+    def setUp(self):
+        self.patterns = Dummy(file_path=configuration['dummy_file'])
+
+    def test_lazy_rows(self):
+        self.assertEqual(len(self.patterns), 5)
+        self.assertEqual(self.patterns[1], str(['serene williams', 'serene.williams@gmail.com']))
+        # Only the rows up to the index were generated
+        self.assertEqual(len(self.patterns._rows), 2)
+        self.assertEqual(self.patterns[-1], str(['taylor swift', 'taylor.swift@gmail.com']))
+
+    def test_does_not_modify_data(self):
+        list(self.patterns.emails)
+        list(self.patterns.emails)
+        self.assertEqual(self.patterns.headers, ['name'])
+        self.assertEqual(self.patterns.csv_content[0], ['eugénie bouchard'])
+
+    def test_invalidate(self):
+        self.assertEqual(self.patterns.rows[1][1], 'serene.williams@gmail.com')
+        self.patterns.domain = 'outlook.com'
+        self.patterns.invalidate()
+        self.assertEqual(self.patterns.rows[1][1], 'serene.williams@outlook.com')
+
+class TestCreateFile(unittest.TestCase):
+    def test_stream_to_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'emails.csv')
+            cache = OutputCache(os.path.join(directory, 'cache'))
+            count = Dummy(file_path=configuration['dummy_file'], stream=True).create_file(
+                                file_path, cache=cache)
+            self.assertEqual(len(cache), 1)
+            self.assertEqual(count, 5)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ['name', 'email'])
+        self.assertEqual(rows[1:], Dummy(file_path=configuration['dummy_file']).rows)
+
+    def test_workers(self):
+        patterns = Dummy(file_path=configuration['dummy_file'])
+        rows = list(patterns.iter_rows(workers=2, chunk_size=2))
+        self.assertEqual(rows, patterns.rows)
+
+    def test_stream_workers(self):
+        patterns = Dummy(file_path=configuration['dummy_file'], stream=True)
+        rows = list(patterns.iter_rows(workers=2, chunk_size=2))
+        self.assertEqual(rows, Dummy(file_path=configuration['dummy_file']).rows)
+
+    def test_render_names(self):
+        template = compile_pattern('prenom.nom', 'gmail.com')
+        self.assertEqual(render_names(template, [' Eugénie Bouchard']),
+                            [('eugénie bouchard', 'eugénie.bouchard@gmail.com')])
+
+    def test_stream_length(self):
+        patterns = Dummy(file_path=configuration['dummy_file'], stream=True)
+        self.assertEqual(len(patterns), 5)
+        self.assertEqual(patterns[1], str(['serene williams', 'serene.williams@gmail.com']))
+
+class Multiple(NamePatterns):
+    pattern = ['nomp', 'nom']
+    domain = 'hec.fr'
+
+
+class TestPatternList(unittest.TestCase):
+    def test_ranked_rows(self):
+        patterns = Multiple(file_path=configuration['dummy_file'])
+        self.assertEqual(patterns.rows[:2], [
+            ['eugénie bouchard', 'boucharde@hec.fr', 1],
+            ['eugénie bouchard', 'bouchard@hec.fr', 2]
+        ])
+        self.assertEqual(len(patterns), 10)
+        self.assertEqual(patterns.construct_pattern()[0], ['name', 'email', 'rank'])
+
+    def test_lazy_index(self):
+        patterns = Multiple(file_path=configuration['dummy_file'])
+        self.assertEqual(patterns[1], str(['eugénie bouchard', 'bouchard@hec.fr', 2]))
+        # The rows after the index are not generated
+        self.assertEqual(len(patterns._rows), 2)
+        with self.assertRaises(IndexError):
+            patterns[10]
+        self.assertEqual(patterns[-1], str(patterns.rows[9]))
+
+    def test_duplicates(self):
+        templates = TemplateList([compile_pattern('nom', 'hec.fr'), compile_pattern('prenom.nom', 'hec.fr')])
+        self.assertEqual(templates.render_name('madonna'), ['madonna@hec.fr'])
+        self.assertEqual(templates.render_row(['madonna']), [['madonna', 'madonna@hec.fr', 1]])
+
+    def test_create_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'emails.csv')
+            count = Multiple(file_path=configuration['dummy_file'], stream=True).create_file(
+                                file_path, cache=False)
+            with open(file_path, 'r', encoding='utf-8') as f:
+                rows = list(csv.reader(f))
+        self.assertEqual(count, 10)
+        self.assertEqual(rows[0], ['name', 'email', 'rank'])
+        self.assertEqual(rows[2], ['eugénie bouchard', 'bouchard@hec.fr', '2'])
+
+    def test_workers(self):
+        patterns = Multiple(file_path=configuration['dummy_file'])
+        self.assertEqual(list(patterns.iter_rows(workers=2, chunk_size=2)), patterns.rows)
+
+    def test_school(self):
+        rows = HEC(file_path=configuration['dummy_file']).construct_pattern()
+        self.assertEqual(rows[1], ['eugénie bouchard', 'boucharde@hec.fr', 1])
+
+if __name__ == "__main__":
+    unittest.main()
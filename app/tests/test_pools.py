@@ -0,0 +1,135 @@
+import smtplib
+import unittest
+
+from ze_mailer.app.core.errors import PoolTimeoutError
+from ze_mailer.app.core.pools import ServerPool
+from ze_mailer.app.core.servers import BaseServer
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP and records
+    the commands that were sent
+    """
+    connections = []
+    extensions = []
+
+    def __init__(self, host=None, port=None):
+        self.host = host
+        self._host = host
+        self.port = port
+        self.connected = True
+        self.logins = 0
+        self.sent = []
+        self.connections.append(self)
+
+    def ehlo(self):
+        return 250, b'ok'
+
+    def has_extn(self, name):
+        return name.lower() in self.extensions
+
+    def starttls(self):
+        return 220, b'ok'
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def noop(self):
+        if not self.connected:
+            raise smtplib.SMTPServerDisconnected()
+        return 250, b'ok'
+
+    def sendmail(self, sender, receiver, message, mail_options=()):
+        if not self.connected:
+            raise smtplib.SMTPServerDisconnected()
+        self.sent.append((sender, receiver, message))
+        self.mail_options = list(mail_options)
+        return {}
+
+    def quit(self):
+        self.connected = False
+
+    def close(self):
+        self.connected = False
+
+
+class FakeServer(BaseServer):
+    smtp_class = FakeSMTP
+
+
+class TestServerPool(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.connections = []
+        self.now = 0
+        self.pool = ServerPool(server_class=FakeServer, max_size=2, idle_timeout=30,
+                                clock=lambda: self.now)
+
+    def test_reuses_connections(self):
+        for _ in range(5):
+            self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        self.assertEqual(len(FakeSMTP.connections), 1)
+        self.assertEqual(len(FakeSMTP.connections[0].sent), 5)
+        self.assertEqual(len(self.pool), 1)
+
+    def test_connections_per_user(self):
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='c', password='d')
+        self.assertEqual(len(FakeSMTP.connections), 2)
+
+    def test_reconnects(self):
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        # The server closes the connection
+        FakeSMTP.connections[0].connected = False
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        self.assertEqual(len(FakeSMTP.connections), 2)
+        self.assertEqual(len(FakeSMTP.connections[1].sent), 1)
+        self.assertEqual(len(self.pool), 1)
+
+    def test_reconnects_without_health_check(self):
+        self.pool.health_check = False
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        FakeSMTP.connections[0].connected = False
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        self.assertEqual(len(FakeSMTP.connections[1].sent), 1)
+
+    def test_no_retry_after_transaction(self):
+        class ClosingSMTP(FakeSMTP):
+            def sendmail(self, sender, receiver, message):
+                # The message was received before
+                # the server closed the connection
+                super().sendmail(sender, receiver, message)
+                raise smtplib.SMTPServerDisconnected()
+
+        class ClosingServer(BaseServer):
+            smtp_class = ClosingSMTP
+
+        pool = ServerPool(server_class=ClosingServer)
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        self.assertEqual(sum(len(item.sent) for item in FakeSMTP.connections), 1)
+        self.assertEqual(len(pool), 0)
+
+    def test_idle_timeout(self):
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        self.now = 31
+        self.pool.sendmail('localhost', 25, 'a@b.com', 'c@d.com', 'message', user='a', password='b')
+        self.assertEqual(len(FakeSMTP.connections), 2)
+        self.assertFalse(FakeSMTP.connections[0].connected)
+
+    def test_max_size(self):
+        first = self.pool.acquire('localhost', 25, user='a', password='b')
+        self.pool.acquire('localhost', 25, user='a', password='b')
+        with self.assertRaises(PoolTimeoutError):
+            self.pool.acquire('localhost', 25, user='a', password='b', timeout=0)
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire('localhost', 25, user='a', password='b', timeout=0), first)
+
+    def test_close(self):
+        server = self.pool.acquire('localhost', 25, user='a', password='b')
+        self.pool.release(server)
+        self.pool.close()
+        self.assertEqual(len(self.pool), 0)
+        self.assertFalse(server.smtp_connection.connected)
+
+if __name__ == "__main__":
+    unittest.main()
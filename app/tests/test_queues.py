@@ -0,0 +1,155 @@
+import os
+import tempfile
+import unittest
+
+from ze_mailer.app.core.queues import SendQueue
+from ze_mailer.app.core.senders import Envelope, SendResult
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestSendQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'queue.sqlite')
+        self.clock = Clock()
+        self.queue = self.get_queue()
+        self.queue.enqueue(Envelope('a@b.com', 'user%s@d.com' % i, 'message') for i in range(10))
+
+    def tearDown(self):
+        self.queue.close()
+        self.directory.cleanup()
+
+    def get_queue(self):
+        return SendQueue(self.path, max_attempts=3, backoff=10, clock=self.clock)
+
+    def test_claim(self):
+        envelopes = self.queue.claim(4)
+        self.assertEqual(len(envelopes), 4)
+        self.assertEqual(envelopes[0].recipients, ['user0@d.com'])
+        self.assertEqual(envelopes[0].message, b'message')
+        self.assertEqual(self.queue.counts()[SendQueue.IN_FLIGHT], 4)
+        self.assertEqual(len(self.queue.claim(100)), 6)
+
+    def test_resume_without_sending_again(self):
+        envelopes = self.queue.claim(4)
+        self.queue.update([SendResult(envelope, SendResult.ACCEPTED) for envelope in envelopes[:3]])
+        self.queue.close()
+
+        # The process restarts after the lease expired
+        self.clock.sleep(600)
+        self.queue = self.get_queue()
+        counts = self.queue.counts()
+        self.assertEqual(counts[SendQueue.SENT], 3)
+        self.assertEqual(counts[SendQueue.RETRY], 1)
+        recipients = [envelope.recipients[0] for envelope in self.queue.claim(100)]
+        # The envelope that was in flight is available
+        # since its lease expired, after the others
+        self.assertEqual(recipients, ['user%s@d.com' % i for i in range(4, 10)] + ['user3@d.com'])
+
+    def test_other_process(self):
+        envelopes = self.queue.claim(4)
+        # Another process opens the queue while
+        # the envelopes are being sent
+        other = self.get_queue()
+        try:
+            self.assertEqual(other.counts()[SendQueue.IN_FLIGHT], 4)
+            others = other.claim(100)
+            self.assertEqual(len(others), 6)
+            other.update([SendResult(envelope, SendResult.ACCEPTED) for envelope in others])
+            self.clock.sleep(600)
+            # The first process stopped
+            claimed = other.claim(100)
+            self.assertEqual([item.queue_id for item in claimed],
+                                [item.queue_id for item in envelopes])
+        finally:
+            other.close()
+
+    def test_claim_uses_index(self):
+        plan = self.queue.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT available_at, id FROM messages WHERE state = ? '
+            'AND available_at <= ? ORDER BY available_at, id LIMIT ?', ('queued', 0, 1)
+        ).fetchall()
+        self.assertNotIn('TEMP B-TREE', str(plan))
+
+    def test_drain_errors(self):
+        def send(envelopes):
+            raise RuntimeError('error')
+
+        with self.assertRaises(RuntimeError):
+            self.queue.drain(send, batch_size=3, sleep=self.clock.sleep)
+        counts = self.queue.counts()
+        self.assertEqual(counts[SendQueue.IN_FLIGHT], 0)
+        self.assertEqual(counts[SendQueue.RETRY], 3)
+
+        # Only the first envelope is reported
+        self.queue.drain(lambda envelopes: [SendResult(envelopes[0], SendResult.ACCEPTED)],
+                            batch_size=100, sleep=self.clock.sleep)
+        counts = self.queue.counts()
+        self.assertEqual(counts[SendQueue.IN_FLIGHT], 0)
+        self.assertEqual(counts[SendQueue.SENT] + counts[SendQueue.FAILED], 10)
+
+    def test_retry_with_backoff(self):
+        envelope = self.queue.claim(1)[0]
+        self.queue.update([SendResult(envelope, SendResult.DEFERRED)])
+        self.assertNotIn(envelope.queue_id, [item.queue_id for item in self.queue.claim(100)])
+        self.assertEqual(self.queue.next_available(), 1010)
+        self.clock.sleep(10)
+        self.assertEqual([item.queue_id for item in self.queue.claim(100)], [envelope.queue_id])
+        self.assertEqual(self.queue.next_available(), None)
+
+    def test_attempts_of_two_processes(self):
+        envelope = self.queue.claim(1)[0]
+        other = self.get_queue()
+        try:
+            # Both processes defer the same envelope
+            other.update([SendResult(envelope, SendResult.DEFERRED)])
+            self.queue.update([SendResult(envelope, SendResult.DEFERRED)])
+        finally:
+            other.close()
+        attempts, available_at = self.queue.connection.execute(
+            'SELECT attempts, available_at FROM messages WHERE id = ?', (envelope.queue_id,)
+        ).fetchone()
+        self.assertEqual(attempts, 2)
+        # The second attempt waits twice as long
+        self.assertEqual(available_at, 1020)
+
+        self.queue.update([SendResult(envelope, SendResult.DEFERRED)])
+        self.assertEqual(self.queue.counts()[SendQueue.FAILED], 1)
+
+    def test_drain(self):
+        attempts = {}
+
+        def send(envelopes):
+            results = []
+            for envelope in envelopes:
+                recipient = envelope.recipients[0]
+                attempts.setdefault(recipient, []).append(self.clock.now)
+                if recipient == 'user0@d.com':
+                    results.append(SendResult(envelope, SendResult.DEFERRED))
+                elif recipient == 'user1@d.com':
+                    results.append(SendResult(envelope, SendResult.REFUSED))
+                else:
+                    results.append(SendResult(envelope, SendResult.ACCEPTED))
+            return results
+
+        self.queue.drain(send, batch_size=3, sleep=self.clock.sleep)
+        counts = self.queue.counts()
+        self.assertEqual(counts[SendQueue.SENT], 8)
+        self.assertEqual(counts[SendQueue.FAILED], 2)
+        self.assertEqual(len(self.queue), 0)
+        # Retried after 10 and 20 seconds
+        self.assertEqual(attempts['user0@d.com'], [1000, 1010, 1030])
+        self.assertEqual(len(attempts['user2@d.com']), 1)
+
+if __name__ == "__main__":
+    unittest.main()
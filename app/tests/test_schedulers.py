@@ -0,0 +1,126 @@
+import unittest
+
+from ze_mailer.app.core.errors import NoServerError
+from ze_mailer.app.core.schedulers import Scheduler, TokenBucket
+from ze_mailer.app.core.senders import Envelope
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_consume(self):
+        clock = Clock()
+        bucket = TokenBucket(2, 10, clock=clock)
+        self.assertTrue(bucket.consume())
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+        self.assertEqual(bucket.wait_time(), 5)
+        clock.sleep(5)
+        self.assertTrue(bucket.consume())
+
+    def test_larger_than_capacity(self):
+        bucket = TokenBucket(2, 10, clock=Clock())
+        with self.assertRaises(ValueError):
+            bucket.wait_time(3)
+        with self.assertRaises(ValueError):
+            bucket.consume(3)
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        accounts = [
+            {'name': 'google', 'host': 'smtp.gmail.com', 'port': 587, 'user': 'a', 'password': 'a'},
+            {'name': 'google', 'host': 'smtp.gmail.com', 'port': 587, 'user': 'b', 'password': 'b'}
+        ]
+        limits = {
+            'google': {'server': [], 'account': [(10, 60)]},
+            'domain': [(5, 60)]
+        }
+        self.scheduler = Scheduler(accounts=accounts, limits=limits, clock=self.clock)
+
+    def test_spreads_over_accounts(self):
+        self.scheduler.extend(Envelope('a@b.com', 'user%s@d%s.com' % (i, i % 4), 'm') for i in range(8))
+        users = [self.scheduler.next()[0][0]['user'] for _ in range(8)]
+        self.assertEqual(users.count('a'), 4)
+        self.assertEqual(users.count('b'), 4)
+        self.assertEqual(self.scheduler.queue_depth, 0)
+
+    def test_respects_limits(self):
+        self.scheduler.extend(Envelope('a@b.com', 'user%s@d%s.com' % (i, i % 10), 'm') for i in range(40))
+        sent = []
+        self.scheduler.run(lambda account, envelope: sent.append((self.clock.now, account['user'])),
+                            sleep=self.clock.sleep)
+        self.assertEqual(len(sent), 40)
+        # A burst of 10 emails per account and
+        # then one email every 6 seconds
+        for user in ('a', 'b'):
+            times = [moment for moment, item in sent if item == user]
+            self.assertEqual(times[:10], [0] * 10)
+            for index in range(11, len(times)):
+                self.assertGreaterEqual(times[index] - times[index - 1], 6 - 1e-6)
+        self.assertAlmostEqual(sent[-1][0], 60)
+
+    def test_domain_limits(self):
+        self.scheduler.extend(Envelope('a@b.com', 'user%s@d.com' % i, 'm') for i in range(6))
+        self.scheduler.extend([Envelope('a@b.com', 'user@e.com', 'm')])
+        domains = [self.scheduler.next()[0][1].recipients[0] for _ in range(6)]
+        # The sixth email to d.com waits and e.com is sent first
+        self.assertEqual(domains[-1], 'user@e.com')
+        item, wait = self.scheduler.next()
+        self.assertIsNone(item)
+        self.assertEqual(wait, 12)
+
+    def test_projected_completion(self):
+        self.scheduler.extend(Envelope('a@b.com', 'user%s@d%s.com' % (i, i), 'm') for i in range(50))
+        # 20 emails are sent immediately, then 20 per minute
+        self.assertAlmostEqual(self.scheduler.projected_completion(), 90)
+        self.assertAlmostEqual(self.scheduler.throughput(), 20 / 60)
+
+    def test_recipients(self):
+        recipients = ['user%s@d.com' % i for i in range(3)] + ['user@e.com']
+        self.scheduler.extend([Envelope('a@b.com', recipients, 'm')] * 2)
+        self.assertEqual(self.scheduler.domains, {'d.com': 6, 'e.com': 2})
+        (account, _), _ = self.scheduler.next()
+        # One token for each recipient and domain
+        self.assertEqual(self.scheduler.account_buckets(account)[0].available(), 6)
+        self.assertEqual(self.scheduler.domain_buckets('d.com')[0].available(), 2)
+        self.assertEqual(self.scheduler.domain_buckets('e.com')[0].available(), 4)
+        # Only 2 of the 3 recipients of d.com can receive the second email
+        item, wait = self.scheduler.next()
+        self.assertIsNone(item)
+        self.assertEqual(wait, 12)
+        self.assertEqual(self.scheduler.domains, {'d.com': 3, 'e.com': 1})
+
+    def test_too_many_recipients(self):
+        with self.assertRaises(ValueError):
+            self.scheduler.add(Envelope('a@b.com', ['user%s@d%s.com' % (i, i) for i in range(11)], 'm'))
+        with self.assertRaises(ValueError):
+            self.scheduler.add(Envelope('a@b.com', ['user%s@d.com' % i for i in range(6)], 'm'))
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_accounts_with_lower_limits(self):
+        self.scheduler.limits['outlook'] = {'account': [(2, 60)]}
+        self.scheduler.accounts.insert(0, {'name': 'outlook', 'host': 'smtp.office365.com',
+                                            'port': 587, 'user': 'c', 'password': 'c'})
+        self.scheduler.add(Envelope('a@b.com', ['user%s@d%s.com' % (i, i) for i in range(3)], 'm'))
+        (account, _), _ = self.scheduler.next()
+        self.assertEqual(account['name'], 'google')
+
+    def test_no_accounts(self):
+        scheduler = Scheduler(accounts=[], limits={}, clock=self.clock)
+        scheduler.add(Envelope('a@b.com', 'user@d.com', 'm'))
+        with self.assertRaises(NoServerError):
+            scheduler.next()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import csv
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from ze_mailer.app.core.errors import PatternError
+from ze_mailer.app.core.fileopener import FileOpener
+from ze_mailer.app.core.settings import configuration
+from ze_mailer.app.patterns.schools import ESSEC, HEC, KEDGE, School, SchoolRunner
+
+HEC_SCHOOL = HEC
+
+
+class TestRegistry(unittest.TestCase):
+    def test_registered(self):
+        self.assertIs(School.registry['HEC'], HEC)
+        self.assertIs(School.get_school('essec'), ESSEC)
+        self.assertNotIn('School', School.registry)
+
+    def test_new_school(self):
+        class NewSchool(School):
+            pattern = 'pnom'
+            domain = 'new.fr'
+
+        try:
+            self.assertIs(School.get_school('NewSchool'), NewSchool)
+        finally:
+            del School.registry['NewSchool']
+
+    def test_duplicate_name(self):
+        with self.assertRaises(ValueError):
+            class HEC(School):
+                pattern = 'prenom.nom'
+                domain = 'hec.edu'
+        self.assertIs(School.get_school('HEC'), HEC_SCHOOL)
+
+        class HEC(School, replace=True):
+            pattern = 'prenom.nom'
+            domain = 'hec.edu'
+
+        try:
+            self.assertIs(School.get_school('HEC'), HEC)
+        finally:
+            School.registry['HEC'] = HEC_SCHOOL
+
+    def test_not_registered(self):
+        class Temporary(School, register=False):
+            pattern = 'pnom'
+            domain = 'temporary.fr'
+
+        self.assertNotIn('Temporary', School.registry)
+        runner = SchoolRunner(configuration['dummy_file'], schools=[Temporary])
+        self.assertEqual(runner.schools, [Temporary])
+
+    def test_unknown_school(self):
+        with self.assertRaises(KeyError):
+            School.get_school('unknown')
+
+
+class TestSchoolRunner(unittest.TestCase):
+    def setUp(self):
+        self.runner = SchoolRunner(configuration['dummy_file'], schools=['HEC', KEDGE])
+
+    def read(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return list(csv.reader(f))
+
+    def test_default_schools(self):
+        runner = SchoolRunner(configuration['dummy_file'])
+        self.assertIn(HEC, runner.schools)
+        # Schools without a pattern or a domain are skipped
+        self.assertNotIn('ISTC', School.registry)
+        self.assertNotIn(School.get_school('EDHEC'), runner.schools)
+        with self.assertRaises(PatternError):
+            SchoolRunner(configuration['dummy_file'], schools=['HEC', 'EDHEC'])
+
+    def test_reads_once(self):
+        with mock.patch.object(FileOpener, 'normalize_names', wraps=FileOpener.normalize_names) as normalize:
+            runner = SchoolRunner(configuration['dummy_file'], schools=['HEC', 'ESSEC', 'KEDGE'])
+            list(runner.iter_rows())
+        self.assertEqual(normalize.call_count, 1)
+
+    def test_create_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            counts = self.runner.create_files(directory)
+            self.assertEqual(counts, {'HEC': 10, 'KEDGE': 5})
+            rows = self.read(os.path.join(directory, 'ZEMAILER_KEDGE.csv'))
+            self.assertEqual(rows[1], ['eugénie bouchard', 'eugénie.bouchard@kedgebs.com'])
+            rows = self.read(os.path.join(directory, 'ZEMAILER_HEC.csv'))
+            self.assertEqual(rows[0], ['name', 'email', 'rank'])
+
+    def test_create_files_workers(self):
+        with tempfile.TemporaryDirectory() as directory:
+            counts = self.runner.create_files(directory, workers=2)
+            self.assertEqual(counts, {'HEC': 10, 'KEDGE': 5})
+            self.assertEqual(len(self.read(os.path.join(directory, 'ZEMAILER_HEC.csv'))), 11)
+
+    def test_combined_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'schools.csv')
+            count = self.runner.create_combined_file(path)
+            rows = self.read(path)
+        self.assertEqual(count, 15)
+        self.assertEqual(rows[0], ['name', 'school', 'email', 'rank'])
+        self.assertEqual(rows[1:4], [
+            ['eugénie bouchard', 'HEC', 'boucharde@hec.fr', '1'],
+            ['eugénie bouchard', 'HEC', 'bouchard@hec.fr', '2'],
+            ['eugénie bouchard', 'KEDGE', 'eugénie.bouchard@kedgebs.com', '1']
+        ])
+
+    def test_workers(self):
+        rows = list(self.runner.iter_rows())
+        self.assertEqual(list(self.runner.iter_rows(workers=2, chunk_size=2)), rows)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,324 @@
+import asyncio
+import smtplib
+import unittest
+from collections import deque
+
+from ze_mailer.app.core.pools import ServerPool
+from ze_mailer.app.core.senders import (AsyncSender, BatchSender, Envelope,
+                                        SendResult, deliver, prepare_data)
+from ze_mailer.app.tests.test_pools import FakeServer, FakeSMTP
+
+
+class RefusingSMTP(FakeSMTP):
+    def sendmail(self, sender, receiver, message, mail_options=()):
+        if any('refused' in item for item in receiver):
+            raise smtplib.SMTPRecipientsRefused({item: (550, b'no') for item in receiver})
+        if any('later' in item for item in receiver):
+            raise smtplib.SMTPDataError(451, b'try later')
+        if isinstance(message, str):
+            # Like smtplib, which only accepts ASCII strings
+            message.encode('ascii')
+        return super().sendmail(sender, receiver, message, mail_options=mail_options)
+
+
+class RefusingServer(FakeServer):
+    smtp_class = RefusingSMTP
+
+
+class PipeliningSMTP(FakeSMTP):
+    """Replies to the raw commands written to the connection
+    in order to test pipelined transactions
+    """
+    extensions = ['pipelining']
+
+    def __init__(self, host=None, port=None):
+        super().__init__(host=host, port=port)
+        self.replies = deque()
+        self.buffer = b''
+        self.in_data = False
+        self.writes = 0
+        self.transaction = None
+        self.transactions = []
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode('ascii')
+        self.writes += 1
+        self.buffer += data
+        while self.process():
+            pass
+
+    def process(self):
+        if self.in_data:
+            if self.buffer.startswith(b'.\r\n'):
+                body, self.buffer = b'', self.buffer[3:]
+            else:
+                body, separator, rest = self.buffer.partition(b'\r\n.\r\n')
+                if not separator:
+                    return False
+                self.buffer = rest
+            self.in_data = False
+            self.transactions.append(self.transaction + (body,))
+            self.replies.append((250, b'ok'))
+            return True
+
+        line, separator, self.buffer = self.buffer.partition(b'\r\n')
+        if not separator:
+            self.buffer = line
+            return False
+        command = line.decode('utf-8')
+        verb = command[:4].lower()
+        if verb == 'mail':
+            self.transaction = (command.split(':', 1)[1].strip('<>'), [])
+            self.replies.append((250, b'ok'))
+        elif verb == 'rcpt':
+            address = command.split(':', 1)[1].strip('<>')
+            if 'refused' in address:
+                self.replies.append((550, b'unknown'))
+            elif 'later' in address:
+                self.replies.append((450, b'later'))
+            else:
+                self.transaction[1].append(address)
+                self.replies.append((250, b'ok'))
+        elif verb == 'data':
+            if self.transaction and self.transaction[1]:
+                self.in_data = True
+                self.replies.append((354, b'go ahead'))
+            else:
+                self.replies.append((554, b'no valid recipients'))
+        else:
+            self.transaction = None
+            self.replies.append((250, b'ok'))
+        return True
+
+    def getreply(self):
+        return self.replies.popleft()
+
+    def putcmd(self, command, args=''):
+        self.send(('%s %s' % (command, args)).strip() + '\r\n')
+
+    def mail(self, sender, options=()):
+        self.putcmd('mail', ' '.join(['FROM:%s' % smtplib.quoteaddr(sender)] + list(options)))
+        return self.getreply()
+
+    def rcpt(self, recipient):
+        self.putcmd('rcpt', 'TO:%s' % smtplib.quoteaddr(recipient))
+        return self.getreply()
+
+    def rset(self):
+        self.putcmd('rset')
+        return self.getreply()
+
+
+class SequentialSMTP(PipeliningSMTP):
+    extensions = []
+
+
+class UTF8SMTP(PipeliningSMTP):
+    extensions = ['pipelining', 'smtputf8']
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        super().send(data)
+
+
+class TestBatchSender(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.connections = []
+
+    def get_sender(self, smtp_class, rcpt_limit=100):
+        server = type('Server', (FakeServer,), {'smtp_class': smtp_class})(user='a', password='b')
+        return BatchSender(server, rcpt_limit=rcpt_limit), server.smtp_connection
+
+    def test_pipelining(self):
+        sender, smtp = self.get_sender(PipeliningSMTP)
+        envelopes = [Envelope('a@b.com', 'user%s@d.com' % i, 'message') for i in range(5)]
+        results = sender.send(envelopes)
+        self.assertTrue(all(result.status == SendResult.ACCEPTED for result in results))
+        # A single transaction sent in two writes
+        self.assertEqual(len(smtp.transactions), 1)
+        self.assertEqual(len(smtp.transactions[0][1]), 5)
+        self.assertEqual(smtp.writes, 2)
+
+    def test_rcpt_limit(self):
+        sender, smtp = self.get_sender(PipeliningSMTP, rcpt_limit=2)
+        envelopes = [Envelope('a@b.com', 'user%s@d.com' % i, 'message') for i in range(5)]
+        sender.send(envelopes)
+        self.assertEqual([len(item[1]) for item in smtp.transactions], [2, 2, 1])
+
+    def test_refused_recipients(self):
+        for smtp_class in (PipeliningSMTP, SequentialSMTP):
+            sender, smtp = self.get_sender(smtp_class)
+            envelopes = [
+                Envelope('a@b.com', ['user@d.com', 'refused@d.com'], 'message'),
+                Envelope('a@b.com', 'later@d.com', 'message'),
+                Envelope('a@b.com', 'refused@e.com', 'other message'),
+                Envelope('a@b.com', 'user@e.com', '.hidden line')
+            ]
+            results = sender.send(envelopes)
+            self.assertEqual([result.status for result in results], [
+                SendResult.ACCEPTED, SendResult.DEFERRED,
+                SendResult.REFUSED, SendResult.ACCEPTED
+            ])
+            self.assertEqual(list(results[0].refused), ['refused@d.com'])
+            self.assertEqual(smtp.transactions[-1][2], b'..hidden line')
+
+    def test_session_failure(self):
+        class ClosingSMTP(PipeliningSMTP):
+            def send(self, data):
+                # The connection is lost after
+                # the first transaction
+                if self.transactions:
+                    raise smtplib.SMTPServerDisconnected()
+                super().send(data)
+
+        sender, smtp = self.get_sender(ClosingSMTP, rcpt_limit=2)
+        envelopes = [Envelope('a@b.com', 'user%s@d.com' % i, 'message') for i in range(3)]
+        envelopes.append(Envelope('a@b.com', 'user@e.com', 'other message'))
+        results = sender.send(envelopes)
+        self.assertEqual([result.status for result in results], [
+            SendResult.ACCEPTED, SendResult.ACCEPTED,
+            SendResult.DEFERRED, SendResult.DEFERRED
+        ])
+        self.assertIsInstance(results[2].error, smtplib.SMTPServerDisconnected)
+
+    def test_invalid_envelopes(self):
+        sender, smtp = self.get_sender(PipeliningSMTP)
+        results = sender.send([
+            Envelope('a@b.com', [], 'message'),
+            Envelope('a@b.com', 'user@d.com', 'messagé'),
+            Envelope('a@b.com', 'user@d.com', 'message')
+        ])
+        self.assertEqual([result.status for result in results],
+                            [SendResult.FAILED, SendResult.FAILED, SendResult.ACCEPTED])
+
+    def test_non_ascii_recipient(self):
+        envelopes = [
+            Envelope('a@b.com', 'usér@d.com', 'message'),
+            Envelope('a@b.com', 'user@d.com', 'message')
+        ]
+        for smtp_class in (PipeliningSMTP, SequentialSMTP):
+            sender, smtp = self.get_sender(smtp_class)
+            results = sender.send(envelopes)
+            self.assertEqual([result.status for result in results],
+                                [SendResult.FAILED, SendResult.ACCEPTED])
+            self.assertEqual(smtp.transactions[0][1], ['user@d.com'])
+
+        sender, smtp = self.get_sender(UTF8SMTP)
+        results = sender.send(envelopes)
+        self.assertEqual([result.status for result in results],
+                            [SendResult.ACCEPTED, SendResult.ACCEPTED])
+        self.assertEqual(smtp.transactions[0][1], ['usér@d.com', 'user@d.com'])
+
+    def test_eight_bit(self):
+        class EightBitSMTP(PipeliningSMTP):
+            extensions = ['pipelining', '8bitmime']
+
+        envelopes = [Envelope('a@b.com', 'user@d.com', 'Hello Eugénie'.encode('utf-8'))]
+        sender, smtp = self.get_sender(PipeliningSMTP)
+        result = sender.send(envelopes)[0]
+        self.assertEqual(result.status, SendResult.FAILED)
+        self.assertIsInstance(result.error, smtplib.SMTPNotSupportedError)
+        self.assertEqual(smtp.transactions, [])
+
+        sender, smtp = self.get_sender(EightBitSMTP)
+        self.assertEqual(sender.send(envelopes)[0].status, SendResult.ACCEPTED)
+        self.assertIn('BODY=8BITMIME', smtp.transactions[0][0])
+
+    def test_deliver_eight_bit(self):
+        class EightBitSMTP(FakeSMTP):
+            extensions = ['8bitmime']
+
+        envelope = Envelope('a@b.com', 'user@d.com', 'Hello Eugénie'.encode('utf-8'))
+        server = FakeServer(user='a', password='b')
+        self.assertEqual(deliver(server, envelope).status, SendResult.FAILED)
+
+        server = type('Server', (FakeServer,), {'smtp_class': EightBitSMTP})(user='a', password='b')
+        self.assertEqual(deliver(server, envelope).status, SendResult.ACCEPTED)
+        self.assertEqual(server.smtp_connection.mail_options, ['BODY=8BITMIME'])
+
+    def test_prepare_data(self):
+        self.assertEqual(prepare_data('a\n.b\r\nc'), b'a\r\n..b\r\nc\r\n.\r\n')
+
+
+class TestAsyncSender(unittest.TestCase):
+    def setUp(self):
+        FakeSMTP.connections = []
+        pool = ServerPool(server_class=RefusingServer, max_size=4)
+        self.sender = AsyncSender('localhost', 25, user='a', password='b',
+                                    concurrency=4, pool=pool)
+
+    def test_send(self):
+        envelopes = [Envelope('a@b.com', 'user%s@d.com' % i, 'message') for i in range(50)]
+        results = asyncio.run(self.sender.send(envelopes))
+        self.assertEqual(len(results), 50)
+        self.assertTrue(all(result.status == SendResult.ACCEPTED for result in results))
+        # Each session is reused for multiple envelopes
+        self.assertLessEqual(len(FakeSMTP.connections), 4)
+        self.assertEqual(sum(len(item.sent) for item in FakeSMTP.connections), 50)
+
+    def test_async_iterable(self):
+        async def envelopes():
+            for i in range(10):
+                yield Envelope('a@b.com', 'user%s@d.com' % i, 'message')
+
+        results = asyncio.run(self.sender.send(envelopes()))
+        self.assertEqual(len(results), 10)
+
+    def test_statuses(self):
+        envelopes = [
+            Envelope('a@b.com', 'refused@d.com', 'message'),
+            Envelope('a@b.com', 'later@d.com', 'message'),
+            Envelope('a@b.com', 'user@d.com', 'message')
+        ]
+        results = asyncio.run(self.sender.send(envelopes))
+        statuses = {result.envelope.recipients[0]: result.status for result in results}
+        self.assertEqual(statuses, {
+            'refused@d.com': SendResult.REFUSED,
+            'later@d.com': SendResult.DEFERRED,
+            'user@d.com': SendResult.ACCEPTED
+        })
+
+    def test_early_exit(self):
+        pool = ServerPool(server_class=RefusingServer, max_size=2)
+        sender = AsyncSender('localhost', 25, user='a', password='b',
+                                concurrency=2, pool=pool)
+        envelopes = [Envelope('a@b.com', 'user%s@d.com' % i, 'message') for i in range(50)]
+
+        async def take():
+            results = sender.results(envelopes)
+            taken = []
+            async for result in results:
+                taken.append(result)
+                if len(taken) == 3:
+                    break
+            await results.aclose()
+            return taken
+
+        async def send():
+            return await asyncio.wait_for(take(), timeout=5)
+
+        self.assertEqual(len(asyncio.run(send())), 3)
+        # Every session is back in the pool
+        self.assertEqual(len(pool), sum(len(item) for item in pool.idle.values()))
+
+    def test_raising_envelope(self):
+        pool = ServerPool(server_class=RefusingServer, max_size=1)
+        sender = AsyncSender('localhost', 25, user='a', password='b',
+                                concurrency=1, pool=pool)
+        envelopes = [
+            Envelope('a@b.com', 'user@d.com', 'messagé'),
+            Envelope('a@b.com', 'user@d.com', 'message')
+        ]
+
+        async def send():
+            return await asyncio.wait_for(sender.send(envelopes), timeout=5)
+
+        results = asyncio.run(send())
+        self.assertEqual([result.status for result in results],
+                            [SendResult.FAILED, SendResult.ACCEPTED])
+        self.assertIsInstance(results[0].error, UnicodeEncodeError)
+
+if __name__ == "__main__":
+    unittest.main()
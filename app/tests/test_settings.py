@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import ze_mailer
+from ze_mailer.app.core.settings import Configuration
+
+
+class TestConfiguration(unittest.TestCase):
+    def setUp(self):
+        self.configuration = Configuration()
+
+    def test_lazy_resolution(self):
+        self.assertEqual(self.configuration.resolved, {})
+        self.assertTrue(self.configuration['dummy_file'].endswith('dummy.csv'))
+        self.assertEqual(set(self.configuration.resolved), {'base_dir', 'data_dir', 'dummy_file'})
+        self.assertIsNone(self.configuration['unknown'])
+
+    def test_output_dir_without_homedrive(self):
+        environment = {key: value for key, value in os.environ.items()
+                            if key not in ('HOMEDRIVE', 'HOMEPATH', 'ZEMAILER_OUTPUT_DIR')}
+        with mock.patch.dict(os.environ, environment, clear=True):
+            self.assertEqual(self.configuration['output_dir'],
+                                os.path.join(os.path.expanduser('~'), 'Documents'))
+
+    def test_environment(self):
+        with mock.patch.dict(os.environ, {'ZEMAILER_OUTPUT_DIR': '/tmp/emails',
+                                            'ZEMAILER_PASSWORD': '1234',
+                                            'ZEMAILER_SENDING_LIMITS': '{"domain": [[10, 60]]}'}):
+            self.assertEqual(self.configuration['output_dir'], '/tmp/emails')
+            self.assertEqual(self.configuration['password'], '1234')
+            self.assertEqual(self.configuration['sending_limits'], {'domain': [[10, 60]]})
+            # The values set on the instance come first
+            self.configuration['output_dir'] = '/tmp/other'
+            self.assertEqual(self.configuration['output_dir'], '/tmp/other')
+
+    def test_json_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'settings.json')
+            with open(path, 'w') as f:
+                json.dump({'user': 'a@gmail.com', 'custom': 1}, f)
+
+            settings = self.configuration(path)
+            self.assertEqual(settings['user'], 'a@gmail.com')
+            self.assertEqual(settings['custom'], 1)
+            self.assertEqual(settings['server_config']['default']['user'], 'a@gmail.com')
+
+            with mock.patch('builtins.open', side_effect=AssertionError):
+                self.configuration(path)
+
+            with open(path, 'w') as f:
+                json.dump({'user': 'b@gmail.com'}, f)
+            os.utime(path, ns=(0, 0))
+            self.configuration(path)
+            self.assertEqual(self.configuration['user'], 'b@gmail.com')
+
+    def test_dependent_settings(self):
+        self.assertIsNone(self.configuration['server_config']['default']['user'])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'settings.json')
+            with open(path, 'w') as f:
+                json.dump({'user': 'a@gmail.com'}, f)
+            self.configuration(path)
+            self.assertEqual(self.configuration['server_config']['default']['user'], 'a@gmail.com')
+
+            self.assertNotEqual(self.configuration['data_dir'], os.path.join(directory, 'app', 'data'))
+            self.configuration['base_dir'] = directory
+            self.assertEqual(self.configuration['data_dir'], os.path.join(directory, 'app', 'data'))
+
+    def test_register(self):
+        self.configuration.register('custom', lambda config: config['data_dir'] + '/custom')
+        self.assertIn('custom', self.configuration)
+        self.assertTrue(self.configuration['custom'].endswith('custom'))
+
+    def test_import_time(self):
+        code = (
+            'import sys, time\n'
+            'start = time.perf_counter()\n'
+            'from ze_mailer.app.core.settings import configuration\n'
+            'print(time.perf_counter() - start)\n'
+            'print(len(configuration.resolved), "ze_mailer.app.core.fileopener" in sys.modules)\n'
+        )
+        environment = {key: value for key, value in os.environ.items() if key != 'HOMEDRIVE'}
+        environment['PYTHONPATH'] = os.path.dirname(list(ze_mailer.__path__)[0])
+        output = subprocess.run([sys.executable, '-c', code], env=environment, check=True,
+                                    capture_output=True, text=True).stdout.split('\n')
+        self.assertLess(float(output[0]), 0.1)
+        self.assertEqual(output[1], '0 False')
+
+if __name__ == "__main__":
+    unittest.main()
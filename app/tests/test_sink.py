@@ -0,0 +1,60 @@
+import smtplib
+import unittest
+
+from ze_mailer.app.benchmarks.bench_senders import compare
+from ze_mailer.app.benchmarks.sink import SinkServer
+from ze_mailer.app.core.pools import ServerPool
+from ze_mailer.app.core.senders import BatchSender, Envelope, SendResult
+from ze_mailer.app.core.servers import LocalServer
+
+
+class TestSinkServer(unittest.TestCase):
+    def setUp(self):
+        self.sink = SinkServer(port=0, credentials=('user', 'password'), keep=True).start()
+
+    def tearDown(self):
+        self.sink.stop()
+
+    def get_server(self, user='user', password='password'):
+        return LocalServer(port=self.sink.port, user=user, password=password)
+
+    def test_sendmail(self):
+        server = self.get_server()
+        server.smtp_connection.sendmail('a@b.com', ['c@d.com', 'e@f.com'], 'Subject: test\r\n\r\n.hello')
+        server.close()
+        self.assertEqual(self.sink.count, 1)
+        self.assertEqual(self.sink.messages[0], ('a@b.com', ['c@d.com', 'e@f.com'],
+                            b'Subject: test\r\n\r\n.hello'))
+
+    def test_authentication(self):
+        with self.assertRaises(smtplib.SMTPAuthenticationError):
+            self.get_server(password='wrong')
+
+    def test_pipelining(self):
+        server = self.get_server()
+        self.assertTrue(server.smtp_connection.has_extn('pipelining'))
+        envelopes = [Envelope('a@b.com', 'user%s@d.com' % i, 'message') for i in range(10)]
+        results = BatchSender(server).send(envelopes)
+        server.close()
+        self.assertTrue(all(result.status == SendResult.ACCEPTED for result in results))
+        self.assertEqual(self.sink.count, 1)
+        self.assertEqual(self.sink.recipients, 10)
+
+    def test_refusal_rate(self):
+        self.sink.refusal_rate = 1
+        pool = ServerPool(server_class=LocalServer)
+        with self.assertRaises(smtplib.SMTPRecipientsRefused):
+            pool.sendmail('localhost', self.sink.port, 'a@b.com', 'c@d.com', 'message',
+                            user='user', password='password')
+        pool.close()
+        self.assertEqual(self.sink.count, 0)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_compare(self):
+        baseline = {'pooled': {'messages_per_second': 100}, 'async': {'messages_per_second': 100}}
+        results = {'pooled': {'messages_per_second': 90}, 'async': {'messages_per_second': 70}}
+        self.assertEqual(compare(results, baseline, 0.2), ['async'])
+
+if __name__ == "__main__":
+    unittest.main()
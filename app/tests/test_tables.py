@@ -0,0 +1,153 @@
+import os
+import pickle
+import sys
+import tempfile
+import unittest
+
+from ze_mailer.app.core.fileopener import FileOpener
+from ze_mailer.app.core.settings import configuration
+from ze_mailer.app.core.tables import NameTable, StringColumn
+from ze_mailer.app.patterns.algorithms import NamesAlgorithm, SimpleNamesAlgorithm
+
+
+class Enterprise(NamesAlgorithm):
+    pattern = 'prenom.nom'
+    domain = 'gmail.com'
+
+
+class TestStringColumn(unittest.TestCase):
+    def setUp(self):
+        self.values = ['eugénie bouchard', '', 'serena williams', 'madonna']
+        self.column = StringColumn(self.values)
+
+    def test_values(self):
+        self.assertEqual(len(self.column), 4)
+        self.assertEqual(list(self.column), self.values)
+        self.assertEqual(self.column[0], 'eugénie bouchard')
+        self.assertEqual(self.column[-1], 'madonna')
+        with self.assertRaises(IndexError):
+            self.column[4]
+
+    def test_slice_is_a_view(self):
+        view = self.column[1:3]
+        self.assertIs(view.data, self.column.data)
+        self.assertEqual(list(view), ['', 'serena williams'])
+        self.assertEqual(view[-1], 'serena williams')
+        self.assertEqual(list(view[1:]), ['serena williams'])
+        self.assertEqual(self.column[::2], ['eugénie bouchard', 'serena williams'])
+
+    def test_append_to_view(self):
+        view = self.column[:2]
+        view.append('kendall jenner')
+        self.assertIsNot(view.data, self.column.data)
+        self.assertEqual(list(view), ['eugénie bouchard', '', 'kendall jenner'])
+        self.assertEqual(list(self.column), self.values)
+
+    def test_append_to_later_view(self):
+        view = self.column[2:]
+        view.append('kendall jenner')
+        self.assertEqual(len(view), 3)
+        self.assertEqual(list(view), ['serena williams', 'madonna', 'kendall jenner'])
+        self.assertEqual(list(self.column), self.values)
+
+    def test_pickle_view(self):
+        view = self.column[2:]
+        state = pickle.dumps(view)
+        self.assertLess(len(state), len(pickle.dumps(self.column)))
+        self.assertEqual(list(pickle.loads(state)), ['serena williams', 'madonna'])
+
+
+class TestNameTable(unittest.TestCase):
+    def setUp(self):
+        self.rows = [['eugenie bouchard', 'tennis'], ['madonna']]
+        self.table = NameTable(['name', 'sport'], self.rows)
+
+    def test_rows(self):
+        self.assertEqual(len(self.table), 2)
+        self.assertEqual(self.table[1], ['madonna', ''])
+        self.assertEqual(list(self.table), [['eugenie bouchard', 'tennis'], ['madonna', '']])
+        # Rows are copies of the values
+        self.table[0][0] = 'kendall jenner'
+        self.assertEqual(self.table[0][0], 'eugenie bouchard')
+
+    def test_slice(self):
+        table = self.table[1:]
+        self.assertIsInstance(table, NameTable)
+        self.assertIs(table.column('name').data, self.table.column('name').data)
+        self.assertEqual(list(table), [['madonna', '']])
+
+    def test_append_to_slice(self):
+        table = NameTable(['name', 'sport'], self.rows + [['serena williams', 'tennis']])
+        part = table[1:]
+        part.append(['kendall jenner', 'modeling'])
+        self.assertEqual(len(part), 3)
+        self.assertEqual(list(part), [['madonna', ''], ['serena williams', 'tennis'],
+                                        ['kendall jenner', 'modeling']])
+        self.assertEqual(len(table), 3)
+
+    def test_add_column(self):
+        table = self.table.with_column('email', ['eugenie.bouchard@gmail.com', 'madonna@gmail.com'])
+        self.assertEqual(table.headers, ['name', 'sport', 'email'])
+        self.assertIs(table.column('name').data, self.table.column('name').data)
+        self.assertEqual(self.table.headers, ['name', 'sport'])
+        # The tables do not share their new rows
+        table.append(['madonna', 'singing', 'madonna@gmail.com'])
+        self.assertEqual(len(self.table), 2)
+        self.table.append(['serena williams', 'tennis'])
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table[-1], ['madonna', 'singing', 'madonna@gmail.com'])
+        with self.assertRaises(ValueError):
+            self.table.add_column('email', ['madonna@gmail.com'])
+
+    def test_memory(self):
+        names = ['firstname%s lastname%s' % (i, i) for i in range(10000)]
+        rows = [[name] for name in names]
+        size = sum(sys.getsizeof(row) + sys.getsizeof(row[0]) for row in rows)
+        self.assertLess(NameTable(['name'], rows).nbytes * 3, size)
+
+
+class TestTableOpener(unittest.TestCase):
+    def setUp(self):
+        self.file_path = configuration['dummy_file']
+
+    def test_same_rows(self):
+        opener = FileOpener(file_path=self.file_path, table=True)
+        self.assertIsInstance(opener.csv_content, NameTable)
+        self.assertEqual(opener.headers, ['name'])
+        self.assertEqual(opener.csv_content, FileOpener(file_path=self.file_path).csv_content)
+
+    def test_empty_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'empty.csv')
+            open(path, 'w').close()
+            opener = FileOpener(file_path=path, table=True)
+            self.assertEqual(len(opener.csv_content), 0)
+
+    def test_algorithm(self):
+        expected = list(Enterprise(file_path=self.file_path).iter_rows())
+        algorithm = Enterprise(file_path=self.file_path, table=True)
+        self.assertEqual(list(algorithm.iter_rows()), expected)
+        self.assertEqual(list(algorithm.iter_rows(workers=2, chunk_size=2)), expected)
+
+        table = algorithm.to_table()
+        self.assertEqual(table.headers, ['name', 'email'])
+        self.assertIs(table.column('name').data, algorithm.csv_content.column('name').data)
+        self.assertEqual(table, expected)
+
+    def test_multiple_patterns(self):
+        class Multiple(Enterprise):
+            pattern = ['nomp', 'nom']
+
+        expected = [row[:2] + [str(row[2])] for row in Multiple(file_path=self.file_path).iter_rows()]
+        table = Multiple(file_path=self.file_path, table=True).to_table()
+        self.assertEqual(table.headers, ['name', 'email', 'rank'])
+        self.assertEqual(table, expected)
+
+    def test_simple_algorithm(self):
+        table = FileOpener(file_path=self.file_path, table=True).csv_content
+        names = list(table.column('name'))
+        self.assertEqual(SimpleNamesAlgorithm(table).patterns,
+                            SimpleNamesAlgorithm(names).patterns)
+        lazy = SimpleNamesAlgorithm(table, lazy=True)
+        self.assertIsInstance(lazy.firsts, StringColumn)
+        self.assertEqual(list(lazy), SimpleNamesAlgorithm(names).patterns)
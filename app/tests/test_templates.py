@@ -0,0 +1,100 @@
+import email
+import unittest
+from unittest import mock
+from email.header import decode_header, make_header
+from email.encoders import encode_noop
+from email.mime.application import MIMEApplication
+
+from ze_mailer.app.core.errors import InvalidValueError
+from ze_mailer.app.core.templates import MessageTemplate, encode_body
+
+
+class TestMessageTemplate(unittest.TestCase):
+    def setUp(self):
+        self.template = MessageTemplate('from@gmail.com', 'Welcome to Mars',
+                            'Hello {{first_name}}', html='<p>Hello {{ first_name }}</p>')
+
+    def parse(self, data):
+        return email.message_from_bytes(data)
+
+    def test_render(self):
+        message = self.parse(self.template.render('to@gmail.com', first_name='Eugénie'))
+        self.assertEqual(message['To'], 'to@gmail.com')
+        self.assertEqual(message['From'], 'from@gmail.com')
+        self.assertEqual(message['Subject'], 'Welcome to Mars')
+        text, html = message.get_payload()
+        self.assertEqual(text.get_payload(decode=True).decode('utf-8'), 'Hello Eugénie')
+        self.assertEqual(html.get_payload(decode=True).decode('utf-8'), '<p>Hello Eugénie</p>')
+
+    def test_serialized_once(self):
+        first = self.template.render('a@gmail.com', first_name='A')
+        second = self.template.render('b@gmail.com', first_name='A')
+        self.assertEqual(first.replace(b'a@gmail.com', b'b@gmail.com'), second)
+
+    def test_subject_fields(self):
+        template = MessageTemplate('from@gmail.com', 'Bienvenue {{first_name}}', 'Hello')
+        message = self.parse(template.render('to@gmail.com', first_name='Eugénie'))
+        self.assertEqual(str(make_header(decode_header(message['Subject']))), 'Bienvenue Eugénie')
+
+    def test_missing_field(self):
+        with self.assertRaises(KeyError):
+            self.template.render('to@gmail.com')
+
+    def test_attachments(self):
+        attachment = MIMEApplication(b'%PDF', 'pdf')
+        template = MessageTemplate('from@gmail.com', 'Welcome', 'Hello', attachments=[attachment])
+        envelopes = list(template.envelopes(['a@gmail.com', 'b@gmail.com']))
+        self.assertEqual(envelopes[1].recipients, ['b@gmail.com'])
+        message = self.parse(envelopes[1].message)
+        self.assertEqual(message.get_payload()[1].get_payload(decode=True), b'%PDF')
+
+    def test_line_breaks(self):
+        with self.assertRaises(InvalidValueError):
+            self.template.render('to@gmail.com\r\nBcc: other@gmail.com', first_name='A')
+        with self.assertRaises(InvalidValueError):
+            self.template.render('to@gmail.com', first_name='A\nBcc: other@gmail.com')
+        template = MessageTemplate('from@gmail.com', 'Hello {{first_name}}', 'Hello')
+        with self.assertRaises(InvalidValueError):
+            template.render('to@gmail.com', first_name='A\r\nBcc: other@gmail.com')
+
+    def test_encodings(self):
+        message = self.parse(self.template.render('to@gmail.com', first_name='Eugenie'))
+        self.assertEqual(message.get_payload()[0]['Content-Transfer-Encoding'], '7bit')
+
+        message = self.parse(self.template.render('to@gmail.com', first_name='Eugénie'))
+        text = message.get_payload()[0]
+        self.assertEqual(text['Content-Transfer-Encoding'], 'quoted-printable')
+        self.assertEqual(text.get_payload(decode=True).decode('utf-8'), 'Hello Eugénie')
+
+        template = MessageTemplate('from@gmail.com', 'Welcome', 'Hello {{first_name}}',
+                                    eight_bit=True)
+        message = self.parse(template.render('to@gmail.com', first_name='Eugénie'))
+        self.assertEqual(message.get_payload()[0]['Content-Transfer-Encoding'], '8bit')
+
+    def test_encoded_once(self):
+        template = MessageTemplate('from@gmail.com', 'Welcome', 'Hello',
+                                    html='<p>Hello {{first_name}}</p>')
+        with mock.patch('ze_mailer.app.core.templates.encode_body',
+                            wraps=encode_body) as encode:
+            for name in ('a', 'b', 'c'):
+                template.render('to@gmail.com', first_name=name)
+        # Only the html part is encoded for each recipient
+        self.assertEqual(encode.call_count, 3)
+        message = self.parse(template.render('to@gmail.com', first_name='a'))
+        self.assertEqual(message.get_payload()[0].get_payload(), 'Hello')
+
+    def test_long_lines(self):
+        data = self.template.render('to@gmail.com', first_name='a' * 2000)
+        self.assertTrue(all(len(line) <= 998 for line in data.split(b'\r\n')))
+        text = self.parse(data).get_payload()[0]
+        self.assertEqual(text['Content-Transfer-Encoding'], 'quoted-printable')
+        self.assertEqual(text.get_payload(decode=True).decode('utf-8'), 'Hello ' + 'a' * 2000)
+
+    def test_attachments_not_merged(self):
+        attachment = MIMEApplication(b'{{first_name}}', 'octet-stream', _encoder=encode_noop)
+        template = MessageTemplate('from@gmail.com', 'Welcome', 'Hello', attachments=[attachment])
+        message = self.parse(template.render('to@gmail.com'))
+        self.assertEqual(message.get_payload()[1].get_payload(), '{{first_name}}')
+
+if __name__ == "__main__":
+    unittest.main()
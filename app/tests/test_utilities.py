@@ -0,0 +1,37 @@
+import unittest
+
+from ze_mailer.app.core.mixins.utilities import UtilitiesMixin
+
+
+class TestFlattenName(unittest.TestCase):
+    def test_accents(self):
+        self.assertEqual(UtilitiesMixin.flatten_name('Eugénie Bouchard '), 'eugenie bouchard')
+        self.assertEqual(UtilitiesMixin.flatten_name('François Çağlar Ñoño'), 'francois caglar nono')
+        self.assertEqual(UtilitiesMixin.flatten_name('ÉLODIE LÖW'), 'elodie low')
+
+    def test_special_letters(self):
+        self.assertEqual(UtilitiesMixin.flatten_name('Søren Straße'), 'soren strasse')
+        self.assertEqual(UtilitiesMixin.flatten_name('Œdipe Łukasz'), 'oedipe lukasz')
+
+    def test_flatten_names(self):
+        names = UtilitiesMixin.flatten_names(['Zoë', 'Aurélie Konaté'])
+        self.assertEqual(list(names), ['zoe', 'aurelie konate'])
+
+class TestNameStructure(unittest.TestCase):
+    def setUp(self):
+        self.utilities = UtilitiesMixin()
+
+    def test_split_name(self):
+        self.assertEqual(self.utilities.split_name('eugenie bouchard'), ['eugenie', 'bouchard'])
+        self.assertEqual(self.utilities.split_name('eugenie de la tour'), ['eugenie', 'de', 'la', 'tour'])
+        self.assertEqual(self.utilities.split_name('eugenie'), ['eugenie'])
+        self.assertEqual(self.utilities.split_name('jean-pierre dupont'), 'jean-pierre dupont')
+
+    def test_check_name_structure(self):
+        self.assertEqual(self.utilities.check_name_structure('eugenie bouchard ')['match'], 'normal')
+        self.assertEqual(self.utilities.check_name_structure('eugenie  bouchard')['match'], 'single')
+        # Does not backtrack on long names that cannot be matched
+        self.assertEqual(self.utilities.check_name_structure('a' * 5000 + '!')['match'], 'single')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+from ze_mailer.app.benchmarks.sink import SinkServer
+from ze_mailer.app.core.verifiers import EmailVerifier, MXCache, Verification
+
+
+class Resolver:
+    """Sends all the domains to the local sink
+    except the ones that do not exist
+    """
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.calls = []
+
+    def __call__(self, domain):
+        self.calls.append(domain)
+        if domain == 'missing.com':
+            return []
+        return [(10, 'localhost', self.ttl), (20, 'backup.invalid', self.ttl * 2)]
+
+
+class TestMXCache(unittest.TestCase):
+    def test_ttl(self):
+        self.now = 0
+        resolver = Resolver(ttl=60)
+        cache = MXCache(resolver, negative_ttl=10, clock=lambda: self.now)
+        self.assertEqual(cache.get('edhec.com'), ['localhost', 'backup.invalid'])
+        self.assertEqual(cache.get('EDHEC.com'), ['localhost', 'backup.invalid'])
+        self.assertEqual(cache.get('missing.com'), [])
+        self.assertEqual(resolver.calls, ['edhec.com', 'missing.com'])
+
+        self.now = 30
+        cache.get('missing.com')
+        cache.get('edhec.com')
+        self.assertEqual(resolver.calls, ['edhec.com', 'missing.com', 'missing.com'])
+        self.now = 61
+        cache.get('edhec.com')
+        self.assertEqual(resolver.calls[-1], 'edhec.com')
+
+
+class TestEmailVerifier(unittest.TestCase):
+    def setUp(self):
+        self.sink = SinkServer(port=0, auth=False, catch_all=['catchall.com'],
+                                mailboxes=['eugenie.bouchard@edhec.com', 'serena.williams@essec.edu'])
+        self.sink.start()
+        self.resolver = Resolver()
+        self.verifier = EmailVerifier(MXCache(self.resolver), port=self.sink.port, concurrency=4)
+
+    def tearDown(self):
+        self.verifier.close()
+        self.sink.stop()
+
+    def test_verify(self):
+        emails = [
+            'eugenie.bouchard@edhec.com',
+            'bouchard.eugenie@edhec.com',
+            'serena.williams@essec.edu',
+            'anyone@catchall.com',
+            'someone@missing.com',
+            'not an email',
+            'eugenie.bouchard@edhec.com'
+        ]
+        statuses = [result.status for result in self.verifier.verify(emails)]
+        self.assertEqual(statuses, [
+            Verification.VALID, Verification.INVALID, Verification.VALID,
+            Verification.CATCH_ALL, Verification.INVALID, Verification.INVALID,
+            Verification.VALID
+        ])
+        # Resolved once for each domain
+        self.assertEqual(sorted(self.resolver.calls), ['catchall.com', 'edhec.com',
+                                                        'essec.edu', 'missing.com'])
+        # A single session with the mail server
+        self.assertEqual(self.sink.connections, 1)
+        self.assertEqual(self.sink.count, 0)
+
+    def test_session_reused(self):
+        self.verifier.verify(['eugenie.bouchard@edhec.com'])
+        self.verifier.verify(['serena.williams@essec.edu'])
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_unreachable_server(self):
+        verifier = EmailVerifier(MXCache(lambda domain: [(10, 'localhost', 60)]), port=1, timeout=1)
+        result = verifier.verify(['eugenie.bouchard@edhec.com'])[0]
+        self.assertEqual(result.status, Verification.UNKNOWN)
+        self.assertIsNotNone(result.error)
+
+    def test_deliverable(self):
+        emails = ['eugenie.bouchard@edhec.com', 'bouchard.eugenie@edhec.com', 'anyone@catchall.com']
+        self.assertEqual(self.verifier.deliverable(emails),
+                            ['eugenie.bouchard@edhec.com', 'anyone@catchall.com'])
+
+if __name__ == "__main__":
+    unittest.main()